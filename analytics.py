@@ -2,23 +2,49 @@ from nose.tools import set_trace
 import importlib
 import contextlib
 import datetime
+import fcntl
+import json
+import logging
 import os
+import time as time_module
 from collections import defaultdict
-from model import ExternalIntegration
-from config import CannotLoadConfiguration
+from threading import (
+    Event,
+    RLock,
+    Thread,
+)
+from Queue import (
+    Empty,
+    Full,
+    Queue,
+)
+from model import (
+    ExternalIntegration,
+    Library,
+    LicensePool,
+    SessionManager,
+)
+from config import (
+    CannotLoadConfiguration,
+    Configuration,
+)
 from sqlalchemy.orm.session import Session
 
-class Analytics(object):
+class AnalyticsProviderRegistry(object):
+    """The analytics providers configured for this site, built from the
+    site's analytics ExternalIntegrations.
+    """
 
-    GLOBAL_ENABLED = None
-    LIBRARY_ENABLED = set()
+    def __init__(self, _db, last_update=None):
+        """Constructor.
 
-    def __init__(self, _db):
+        :param last_update: The time the site configuration was last
+            changed, as of the time this registry was built.
+        """
+        self.last_update = last_update
         self.sitewide_providers = []
         self.library_providers = defaultdict(list)
         self.initialization_exceptions = {}
-        Analytics.GLOBAL_ENABLED = False
-        Analytics.LIBRARY_ENABLED = set()
         # Find a list of all the ExternalIntegrations set up with a
         # goal of analytics.
         integrations = _db.query(ExternalIntegration).filter(ExternalIntegration.goal==ExternalIntegration.ANALYTICS_GOAL)
@@ -40,17 +66,73 @@ class Analytics(object):
                     if not integration.libraries:
                         provider = provider_class(integration)
                         self.sitewide_providers.append(provider)
-                        Analytics.GLOBAL_ENABLED = True
                     else:
                         for library in integration.libraries:
                             provider = provider_class(integration, library)
                             self.library_providers[library.id].append(provider)
-                            Analytics.LIBRARY_ENABLED.add(library.id)
                 else:
                     self.initialization_exceptions[integration.id] = "Module %s does not have Provider defined." % module
             except (ImportError, CannotLoadConfiguration), e:
                 self.initialization_exceptions[integration.id] = e
 
+        self.global_enabled = len(self.sitewide_providers) > 0
+        self.library_enabled = set(self.library_providers.keys())
+
+
+class Analytics(object):
+
+    GLOBAL_ENABLED = None
+    LIBRARY_ENABLED = set()
+
+    # The AnalyticsProviderRegistry shared by every Analytics object in
+    # this process. It's rebuilt when the site configuration changes.
+    _registry = None
+    _registry_lock = RLock()
+
+    def __init__(self, _db):
+        registry = self.registry(_db)
+        self.sitewide_providers = list(registry.sitewide_providers)
+        self.library_providers = defaultdict(list)
+        for library_id, providers in registry.library_providers.items():
+            self.library_providers[library_id] = list(providers)
+        self.initialization_exceptions = dict(
+            registry.initialization_exceptions
+        )
+
+    @classmethod
+    def registry(cls, _db):
+        """Find the process-wide AnalyticsProviderRegistry, building it if
+        necessary.
+
+        The registry is thrown away by reset_registry() whenever this
+        process calls site_configuration_has_changed(), and it's
+        rebuilt if this process learns that the site configuration was
+        changed by some other process.
+
+        This also sets GLOBAL_ENABLED and LIBRARY_ENABLED.
+        """
+        # Flushing the session triggers the listeners that reset the
+        # registry, if there are pending changes to the site
+        # configuration.
+        _db.flush()
+        last_update = Configuration._site_configuration_last_update()
+        with cls._registry_lock:
+            registry = cls._registry
+            if registry is None or registry.last_update != last_update:
+                registry = AnalyticsProviderRegistry(_db, last_update)
+                cls._registry = registry
+            Analytics.GLOBAL_ENABLED = registry.global_enabled
+            Analytics.LIBRARY_ENABLED = set(registry.library_enabled)
+        return registry
+
+    @classmethod
+    def reset_registry(cls):
+        """Make sure the AnalyticsProviderRegistry is rebuilt the next time
+        it's needed.
+        """
+        with cls._registry_lock:
+            cls._registry = None
+
     def collect_event(self, library, license_pool, event_type, time=None, **kwargs):
         if not time:
             time = datetime.datetime.utcnow()
@@ -63,8 +145,345 @@ class Analytics(object):
     @classmethod
     def is_configured(cls, library):
         if cls.GLOBAL_ENABLED is None:
-            Analytics(Session.object_session(library))
+            cls.registry(Session.object_session(library))
         if cls.GLOBAL_ENABLED:
             return True
         else:
             return library.id in cls.LIBRARY_ENABLED
+
+
+class BufferedAnalytics(Analytics):
+    """An Analytics object that never makes the caller wait for the
+    analytics providers.
+
+    collect_event() puts events into an in-memory queue. A background
+    thread takes them off the queue in batches and passes them on to
+    the providers, using its own database session. If the queue is
+    full, events are appended to a spill file on disk instead, and
+    picked up once the queue has drained -- including by the next
+    process to use the same spill file, if this one dies first.
+
+    Providers that define a `collect_events` method receive each batch
+    all at once; other providers get one collect_event() call per
+    event. The Libraries and LicensePools passed to a provider belong
+    to a session that's closed once the batch has been delivered, so
+    a provider must not hold on to them afterwards.
+
+    If a batch can't be delivered, it's written to the spill file (if
+    there is one) to be tried again later. A provider may see the same
+    event more than once if some other provider failed the first time.
+    """
+
+    DEFAULT_MAX_QUEUE_SIZE = 10000
+    DEFAULT_BATCH_SIZE = 100
+
+    # The background thread will deliver a partial batch if no new
+    # events come in for this many seconds.
+    DEFAULT_FLUSH_INTERVAL = 5
+
+    # Event times are written to the spill file in this format.
+    TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+    # An event that couldn't be delivered this many times is dropped.
+    MAX_DISPATCH_ATTEMPTS = 5
+
+    log = logging.getLogger("Buffered analytics")
+
+    def __init__(self, _db, session_factory=None, max_queue_size=None,
+                 batch_size=None, flush_interval=None, spill_path=None):
+        """Constructor.
+
+        :param session_factory: Creates the database session used by the
+            background thread. By default, sessions are bound to the same
+            database as `_db`.
+        :param spill_path: Events that don't fit in the in-memory queue
+            are written to this file. If this is not provided, those
+            events are delivered immediately, in the caller's thread.
+        """
+        super(BufferedAnalytics, self).__init__(_db)
+        self._db = _db
+        self.session_factory = (
+            session_factory or SessionManager.sessionmaker(session=_db)
+        )
+        self.batch_size = batch_size or self.DEFAULT_BATCH_SIZE
+        if flush_interval is None:
+            flush_interval = self.DEFAULT_FLUSH_INTERVAL
+        self.flush_interval = flush_interval
+        self.queue = Queue(max_queue_size or self.DEFAULT_MAX_QUEUE_SIZE)
+        self.spill_path = spill_path
+        self.spill_lock = RLock()
+        self.dispatch_lock = RLock()
+        self.stopping = Event()
+        self.thread = None
+
+        # Metrics.
+        self.events_queued = 0
+        self.events_spilled = 0
+        self.events_dispatched = 0
+        self.dispatch_errors = 0
+        self.last_latency = None
+        self.max_latency = 0
+
+    def collect_event(self, library, license_pool, event_type, time=None,
+                      **kwargs):
+        """Queue an event for delivery to the analytics providers."""
+        if not time:
+            time = datetime.datetime.utcnow()
+        event = dict(
+            library_id=library.id if library else None,
+            license_pool_id=license_pool.id if license_pool else None,
+            event_type=event_type,
+            time=time.strftime(self.TIME_FORMAT),
+            queued_at=time_module.time(),
+            kwargs=kwargs,
+        )
+        try:
+            self.queue.put_nowait(event)
+            self.events_queued += 1
+        except Full:
+            if self.spill_path:
+                self.spill([event])
+            else:
+                # There's nowhere to put the event, so deliver it now.
+                self.log.warn("Analytics queue is full; delivering event immediately.")
+                _db = None
+                if library or license_pool:
+                    _db = Session.object_session(library or license_pool)
+                self.dispatch(_db or self._db, [event])
+
+    @contextlib.contextmanager
+    def spill_file_lock(self):
+        """Keep other threads, and other processes using the same spill
+        file, away from the spill file.
+
+        The lock is held on a separate file, which is never removed,
+        so that a process waiting for it can't end up writing to a
+        spill file that's just been taken away.
+        """
+        with self.spill_lock:
+            with open(self.spill_path + ".lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def spill(self, events):
+        """Append events to the spill file."""
+        with self.spill_file_lock():
+            with open(self.spill_path, 'a') as out:
+                for event in events:
+                    out.write(json.dumps(event) + "\n")
+        self.events_spilled += len(events)
+
+    def unspill(self):
+        """Take all events out of the spill file.
+
+        :return: A list of events.
+        """
+        if not self.spill_path:
+            return []
+        with self.spill_file_lock():
+            if not os.path.exists(self.spill_path):
+                return []
+            with open(self.spill_path) as spilled:
+                events = [json.loads(line) for line in spilled if line.strip()]
+            os.remove(self.spill_path)
+        return events
+
+    @property
+    def metrics(self):
+        """Describe the state of the queue and how quickly events are
+        being delivered.
+
+        Latency is the number of seconds between an event being
+        queued and it being delivered to the providers.
+        """
+        spilled = 0
+        if self.spill_path and os.path.exists(self.spill_path):
+            with self.spill_file_lock():
+                if os.path.exists(self.spill_path):
+                    with open(self.spill_path) as f:
+                        spilled = sum(1 for line in f)
+        return dict(
+            queue_depth=self.queue.qsize(),
+            spilled_depth=spilled,
+            events_queued=self.events_queued,
+            events_spilled=self.events_spilled,
+            events_dispatched=self.events_dispatched,
+            dispatch_errors=self.dispatch_errors,
+            last_latency=self.last_latency,
+            max_latency=self.max_latency,
+        )
+
+    def start(self):
+        """Start delivering events in a background thread."""
+        if self.thread and self.thread.is_alive():
+            return
+        self.stopping.clear()
+        self.thread = Thread(target=self._run, name="Buffered analytics")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop the background thread and deliver any events that
+        are still in the queue.
+        """
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+    def _run(self):
+        while not self.stopping.is_set():
+            batch = self._next_batch()
+            if not batch:
+                # The queue is empty; see if there's anything in the
+                # spill file.
+                batch = self.unspill()
+            if batch:
+                self._dispatch_with_new_session(batch)
+
+    def _next_batch(self):
+        """Wait for events to show up in the queue, and collect up to
+        a batch's worth of them.
+        """
+        batch = []
+        deadline = time_module.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time_module.time()
+            if timeout <= 0 or self.stopping.is_set():
+                break
+            try:
+                batch.append(self.queue.get(timeout=min(timeout, 1)))
+            except Empty:
+                continue
+        return batch
+
+    def flush(self):
+        """Deliver every queued or spilled event right now, in the
+        current thread.
+
+        :return: The number of events delivered.
+        """
+        delivered = 0
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            if not batch:
+                batch = self.unspill()
+            if not batch:
+                break
+            if not self._dispatch_with_new_session(batch):
+                # Anything that failed has been spilled again; don't
+                # keep retrying it right away.
+                break
+            delivered += len(batch)
+        return delivered
+
+    def _dispatch_with_new_session(self, batch):
+        """Deliver a batch of events using a new database session.
+
+        If delivery fails, the events are spilled so they can be tried
+        again later.
+
+        :return: True if the batch was delivered, False otherwise.
+        """
+        _db = self.session_factory()
+        try:
+            self.dispatch(_db, batch)
+            _db.commit()
+            return True
+        except Exception, e:
+            _db.rollback()
+            self.dispatch_errors += 1
+            self.log.error(
+                "Error delivering %d analytics event(s)", len(batch),
+                exc_info=e
+            )
+            self._retry_later(batch)
+            return False
+        finally:
+            _db.close()
+
+    def _retry_later(self, batch):
+        """Spill events that couldn't be delivered, unless they've
+        already failed too many times.
+        """
+        if not self.spill_path:
+            self.log.error(
+                "No spill file; dropping %d analytics event(s).", len(batch)
+            )
+            return
+        retry = []
+        for event in batch:
+            event['attempts'] = event.get('attempts', 0) + 1
+            if event['attempts'] < self.MAX_DISPATCH_ATTEMPTS:
+                retry.append(event)
+        if len(retry) < len(batch):
+            self.log.error(
+                "Dropping %d analytics event(s) after %d failed attempts.",
+                len(batch) - len(retry), self.MAX_DISPATCH_ATTEMPTS
+            )
+        if retry:
+            self.spill(retry)
+
+    def dispatch(self, _db, batch):
+        """Deliver a batch of events to the appropriate providers.
+
+        :param _db: A database session used to look up the Libraries and
+            LicensePools associated with the events.
+        :param batch: A list of queued events.
+        """
+        with self.dispatch_lock:
+            library_ids = set(x['library_id'] for x in batch)
+            pool_ids = set(x['license_pool_id'] for x in batch)
+            libraries = dict(
+                (x.id, x) for x in _db.query(Library).filter(
+                    Library.id.in_(library_ids))
+            )
+            pools = dict(
+                (x.id, x) for x in _db.query(LicensePool).filter(
+                    LicensePool.id.in_(pool_ids))
+            )
+
+            # Figure out which events go to which providers.
+            by_provider = defaultdict(list)
+            providers = []
+            now = time_module.time()
+            for event in batch:
+                library = libraries.get(event['library_id'])
+                args = (
+                    library,
+                    pools.get(event['license_pool_id']),
+                    event['event_type'],
+                    datetime.datetime.strptime(event['time'], self.TIME_FORMAT),
+                    event['kwargs']
+                )
+                relevant = list(self.sitewide_providers)
+                if library:
+                    relevant.extend(self.library_providers[library.id])
+                for provider in relevant:
+                    if provider not in by_provider:
+                        providers.append(provider)
+                    by_provider[provider].append(args)
+
+                latency = now - event['queued_at']
+                self.last_latency = latency
+                self.max_latency = max(self.max_latency, latency)
+
+            for provider in providers:
+                events = by_provider[provider]
+                if hasattr(provider, 'collect_events'):
+                    provider.collect_events(events)
+                else:
+                    for library, pool, event_type, time, kwargs in events:
+                        provider.collect_event(
+                            library, pool, event_type, time, **kwargs
+                        )
+            self.events_dispatched += len(batch)
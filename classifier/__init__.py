@@ -12,6 +12,8 @@
 # SQL to find commonly used classifications not assigned to a genre
 # select count(identifiers.id) as c, subjects.type, substr(subjects.identifier, 0, 20) as i, substr(subjects.name, 0, 20) as n from workidentifiers join classifications on workidentifiers.id=classifications.work_identifier_id join subjects on classifications.subject_id=subjects.id where subjects.genre_id is null and subjects.fiction is null group by subjects.type, i, n order by c desc;
 
+import glob
+import hashlib
 import logging
 import json
 import os
@@ -100,6 +102,39 @@ class Classifier(object):
 
     classifiers = dict()
 
+    # Data files in the resource directory that classification
+    # rules are based on.
+    RULES_RESOURCES = ["bisac.csv", "dewey_1000.json", "lcc_one_level.json"]
+
+    # The answer to version(), once it has been calculated.
+    _version = None
+
+    @classmethod
+    def version(cls):
+        """A string that changes whenever the classification rules change.
+
+        This is a hash of the code in this package and the data files
+        it uses, so a change to any classifier changes the version of
+        all of them.
+
+        :return: A string, or None if the files can't be read.
+        """
+        if Classifier._version is None:
+            paths = sorted(glob.glob(os.path.join(base_dir, "*.py")))
+            paths += [os.path.join(resource_dir, x) for x in cls.RULES_RESOURCES]
+            digest = hashlib.sha1()
+            try:
+                for path in paths:
+                    with open(path, 'rb') as f:
+                        digest.update(f.read())
+                Classifier._version = unicode(digest.hexdigest())
+            except IOError, e:
+                logging.error(
+                    "Could not calculate classifier version: %s", e
+                )
+                Classifier._version = False
+        return Classifier._version or None
+
     @classmethod
     def range_tuple(cls, lower, upper):
         """Turn a pair of ages into a tuple that represents an age range.
@@ -1,28 +1,98 @@
 from . import *
 
+def _keyword_pattern(keywords):
+    """Turn a list of keywords into a regular expression that matches
+    any of them, so long as there's a word boundary on both ends.
+    """
+    if not keywords:
+        return None
+    return r'\b(%s)\b' % "|".join(keywords)
+
 def match_kw(*l):
     """Turn a list of strings into a function which uses a regular expression
     to match any of those strings, so long as there's a word boundary on both ends.
     The function will match all the strings by default, or can exclude the strings
     that are examples of the classification.
+
+    The regular expressions are compiled once, when match_kw is called.
     """
+    all_keywords = [str(keyword) for keyword in l]
+    non_examples = [keyword for keyword in l if not isinstance(keyword, Eg)]
+    regexes = {}
+    for exclude_examples, keywords in (
+        (False, all_keywords), (True, non_examples)
+    ):
+        pattern = _keyword_pattern(keywords)
+        if pattern:
+            regexes[exclude_examples] = re.compile(pattern, re.I)
+
     def match_term(term, exclude_examples=False):
-        if not l:
+        regex = regexes.get(exclude_examples)
+        if not regex:
             return None
-        if exclude_examples:
-            keywords = [keyword for keyword in l if not isinstance(keyword, Eg)]
-        else:
-            keywords = [str(keyword) for keyword in l]
+        return regex.search(term)
 
-        if not keywords:
-            return None
-        any_keyword = "|".join(keywords)
-        with_boundaries = r'\b(%s)\b' % any_keyword
-        return re.compile(with_boundaries, re.I).search(term)
+    # This is a dictionary so it can be used as a class variable
+    return {"search": match_term, "keywords": l}
 
+class KeywordTable(dict):
+    """A dictionary mapping genres to the output of match_kw, which can
+    find every genre that matches a string in a single call.
 
-    # This is a dictionary so it can be used as a class variable
-    return {"search": match_term}
+    The regular expressions are compiled once, when the table is
+    created. The keywords for every genre are also combined into a
+    single regular expression, which is checked first: most strings
+    don't match any of the keywords, and they can be ruled out with
+    one search instead of one search per genre.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(KeywordTable, self).__init__(*args, **kwargs)
+        self.compiled = {}
+        for exclude_examples in (False, True):
+            self.compiled[exclude_examples] = self._compile(exclude_examples)
+
+    def _compile(self, exclude_examples):
+        """Compile the regular expressions for one way of matching.
+
+        :return: A 2-tuple (regular expression matching any keyword
+            in the table, list of (genre, regular expression) 2-tuples).
+        """
+        all_keywords = []
+        by_genre = []
+        for genre, keywords in self.items():
+            if not keywords:
+                continue
+            l = keywords["keywords"]
+            if exclude_examples:
+                l = [keyword for keyword in l if not isinstance(keyword, Eg)]
+            else:
+                l = [str(keyword) for keyword in l]
+            pattern = _keyword_pattern(l)
+            if not pattern:
+                continue
+            all_keywords.extend(l)
+            by_genre.append((genre, re.compile(pattern, re.I)))
+        if not all_keywords:
+            return None, by_genre
+        any_keyword = re.compile(
+            r'\b(?:%s)\b' % "|".join(all_keywords), re.I
+        )
+        return any_keyword, by_genre
+
+    def matching_genres(self, name, exclude_examples=False):
+        """Find every genre whose keywords match `name`.
+
+        :return: A set of genres. The set may include None, which
+            is used as a genre to swallow keywords that would otherwise
+            match the wrong genre.
+        """
+        any_keyword, by_genre = self.compiled[exclude_examples]
+        if not name or not any_keyword or not any_keyword.search(name):
+            return set()
+        return set(
+            genre for genre, regex in by_genre if regex.search(name)
+        )
 
 class Eg(object):
     """Mark this string as an example of a classification, rather than
@@ -91,7 +161,7 @@ class KeywordBasedClassifier(AgeOrGradeClassifier):
         "missing children",
     ])
 
-    CATCHALL_KEYWORDS = {
+    CATCHALL_KEYWORDS = KeywordTable({
         Adventure : match_kw(
             "adventure",
             "adventurers",
@@ -1150,9 +1220,9 @@ class KeywordBasedClassifier(AgeOrGradeClassifier):
                    "world history",
                    "history[^a-z]*world",
                ),
-    }
+    })
 
-    LEVEL_2_KEYWORDS = {
+    LEVEL_2_KEYWORDS = KeywordTable({
         Reference_Study_Aids : match_kw(
             # Formerly in 'Language Arts & Disciplines'
             Eg("language arts & disciplines"),
@@ -1260,13 +1330,13 @@ class KeywordBasedClassifier(AgeOrGradeClassifier):
         None : match_kw(
             "children of",
         )
-    }
+    })
 
-    LEVEL_3_KEYWORDS = {
+    LEVEL_3_KEYWORDS = KeywordTable({
         Space_Opera: match_kw(
             "space opera",
         ),
-    }
+    })
 
 
     @classmethod
@@ -1322,14 +1392,16 @@ class KeywordBasedClassifier(AgeOrGradeClassifier):
         matches = Counter()
         match_against = [name]
         for l in [cls.LEVEL_3_KEYWORDS, cls.LEVEL_2_KEYWORDS, cls.CATCHALL_KEYWORDS]:
+            matching_genres = l.matching_genres(name, exclude_examples)
             for genre, keywords in l.items():
+                if genre not in matching_genres:
+                    continue
                 if genre and fiction is not None and genre.is_fiction != fiction:
                     continue
                 if (genre and audience and genre.audience_restriction
                     and audience not in genre.audience_restriction):
                     continue
-                if keywords and keywords["search"](name, exclude_examples):
-                    matches[genre] += 1
+                matches[genre] += 1
             most_specific_genre = None
             most_specific_count = 0
             # The genre with the most regex matches wins.
@@ -96,6 +96,11 @@ class Configuration(ConfigurationConstants):
 
     DATA_DIRECTORY = "data_directory"
 
+    # If this is set, Representation content is kept in a blob store
+    # in this directory instead of in the database. Every host that
+    # reads or writes Representations needs to see the same directory.
+    BLOB_STORE_DIRECTORY = "blob_store_directory"
+
     # ConfigurationSetting key for the base url of the app.
     BASE_URL_KEY = u'base_url'
 
@@ -451,6 +456,10 @@ class Configuration(ConfigurationConstants):
     def data_directory(cls):
         return cls.get(cls.DATA_DIRECTORY)
 
+    @classmethod
+    def blob_store_directory(cls):
+        return cls.get(cls.BLOB_STORE_DIRECTORY)
+
     @classmethod
     def load_cdns(cls, _db, config_instance=None):
         from model import ExternalIntegration as EI
@@ -1570,6 +1570,16 @@ class WorkPresentationEditionCoverageProvider(WorkPresentationProvider):
         work.calculate_presentation(self.POLICY)
         return work
 
+    def finalize_batch(self):
+        """Report how much of the presentation calculation was
+        actually necessary, then commit the batch.
+        """
+        self.log.info(
+            "Presentation calculation so far: %r",
+            Work.presentation_calculation_stats
+        )
+        super(WorkPresentationEditionCoverageProvider, self).finalize_batch()
+
 
 class WorkClassificationCoverageProvider(
     WorkPresentationEditionCoverageProvider
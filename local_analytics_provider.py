@@ -1,3 +1,4 @@
+import logging
 from flask_babel import lazy_gettext as _
 from model import (
     Session,
@@ -15,6 +16,8 @@ class LocalAnalyticsProvider(object):
     # A given site can only have one analytics provider.
     CARDINALITY = 1
 
+    log = logging.getLogger("Local analytics")
+
     # Where to get the 'location' of an analytics event.
     LOCATION_SOURCE = "location_source"
 
@@ -60,15 +63,58 @@ class LocalAnalyticsProvider(object):
         if library and self.library_id and library.id != self.library_id:
             return
 
-        neighborhood = None
-        if self.location_source == self.LOCATION_SOURCE_NEIGHBORHOOD:
-            neighborhood = kwargs.pop("neighborhood", None)
+        neighborhood = self._location(kwargs)
 
         return CirculationEvent.log(
             _db, license_pool, event_type, old_value, new_value, start=time,
             library=library, location=neighborhood
         )
 
+    def collect_events(self, events):
+        """Record a batch of events with a single database statement.
+
+        :param events: A list of (library, license_pool, event_type,
+            time, kwargs) 5-tuples, where `kwargs` contains the keyword
+            arguments that would have been passed into collect_event().
+        :return: The number of events recorded.
+        """
+        _db = None
+        to_log = []
+        for library, license_pool, event_type, time, kwargs in events:
+            if not library and not license_pool:
+                # collect_event() would raise ValueError, but that
+                # shouldn't stop the rest of the batch from being
+                # recorded.
+                self.log.error(
+                    "Ignoring %s event with neither library nor license pool.",
+                    event_type
+                )
+                continue
+            if library and self.library_id and library.id != self.library_id:
+                continue
+            _db = _db or Session.object_session(library or license_pool)
+            kwargs = dict(kwargs)
+            to_log.append(
+                dict(
+                    license_pool=license_pool, event_name=event_type,
+                    old_value=kwargs.pop('old_value', None),
+                    new_value=kwargs.pop('new_value', None),
+                    start=time, library=library,
+                    location=self._location(kwargs)
+                )
+            )
+        if not to_log:
+            return 0
+        return CirculationEvent.bulk_log(_db, to_log)
+
+    def _location(self, kwargs):
+        """Find the location of an event, if this provider is configured
+        to record one.
+        """
+        if self.location_source == self.LOCATION_SOURCE_NEIGHBORHOOD:
+            return kwargs.pop("neighborhood", None)
+        return None
+
     @classmethod
     def initialize(cls, _db):
         """Find or create a local analytics service.
@@ -18,6 +18,8 @@ from sqlalchemy.orm.exc import (
 from sqlalchemy.orm import aliased
 import csv
 import datetime
+import hashlib
+import json
 import logging
 import re
 
@@ -35,6 +37,7 @@ from model import (
     Classification,
     Collection,
     Contributor,
+    ContributorResolver,
     CoverageRecord,
     DataSource,
     DeliveryMechanism,
@@ -52,6 +55,7 @@ from model import (
     RightsStatus,
     Representation,
     Resource,
+    SortNameMemo,
     Timestamp,
     Work,
 )
@@ -78,7 +82,8 @@ class ReplacementPolicy(object):
             analytics=None,
             http_get=None,
             even_if_not_apparently_updated=False,
-            presentation_calculation_policy=None
+            presentation_calculation_policy=None,
+            contributor_resolver=None
     ):
         self.identifiers = identifiers
         self.subjects = subjects
@@ -96,6 +101,9 @@ class ReplacementPolicy(object):
             presentation_calculation_policy or
             PresentationCalculationPolicy()
         )
+        # A ContributorResolver shared by everything being imported
+        # at the same time.
+        self.contributor_resolver = contributor_resolver
 
     @classmethod
     def from_license_source(cls, _db, **args):
@@ -365,6 +373,15 @@ class ContributorData(object):
                 "Cannot find sort name for a contributor with no display name!"
             )
 
+        # Has this display name been seen before?
+        sort_name = SortNameMemo.lookup(
+            _db, self.display_name,
+            canonicalizer_available=bool(metadata_client)
+        )
+        if sort_name:
+            self.sort_name = sort_name
+            return True
+
         # Is there a contributor already in the database with this
         # exact sort name? If so, use their display name.
         # If not, take our best guess based on the display name.
@@ -372,15 +389,21 @@ class ContributorData(object):
             _db, self.display_name)
         if sort_name:
             self.sort_name = sort_name
+            SortNameMemo.remember(
+                _db, self.display_name, sort_name,
+                SortNameMemo.EXISTING_CONTRIBUTOR
+            )
             return True
 
         # Time to break out the big guns. Ask the metadata wrangler
         # if it can find a sort name for this display name.
+        asked_canonicalizer = False
         if metadata_client:
             try:
                 sort_name = self.display_name_to_sort_name_through_canonicalizer(
                     _db, identifiers, metadata_client
                 )
+                asked_canonicalizer = True
             except RemoteIntegrationException, e:
                 # There was some kind of problem with the metadata
                 # wrangler. Act as though no metadata wrangler had
@@ -392,11 +415,19 @@ class ContributorData(object):
                 )
             if sort_name:
                 self.sort_name = sort_name
+                SortNameMemo.remember(
+                    _db, self.display_name, sort_name,
+                    SortNameMemo.CANONICALIZER, asked_canonicalizer=True
+                )
                 return True
 
         # If there's still no sort name, take our best guess based
         # on the display name.
         self.sort_name = display_name_to_sort_name(self.display_name)
+        SortNameMemo.remember(
+            _db, self.display_name, self.sort_name, SortNameMemo.GUESS,
+            asked_canonicalizer=asked_canonicalizer
+        )
 
         return (self.sort_name is not None)
 
@@ -1336,6 +1367,14 @@ class Metadata(MetaToModelUtility):
         'issued', 'published'
     ]
 
+    # These fields change when nothing about the book itself has
+    # changed, so they're left out of content_hash(). In particular,
+    # MeasurementData.taken_at defaults to the current time.
+    CONTENT_HASH_IGNORED_FIELDS = set([
+        'data_source_last_updated', 'last_checked', 'data_source_obj',
+        'primary_identifier_obj', 'log', '_content_hash', 'taken_at',
+    ])
+
     def __init__(
             self,
             data_source,
@@ -1403,6 +1442,65 @@ class Metadata(MetaToModelUtility):
         self.__links = None
         self.links = links
 
+        self._content_hash = None
+
+    def content_hash(self):
+        """Calculate a hash of everything this Metadata (and its
+        CirculationData) says about a book.
+
+        If two Metadata objects have the same hash, applying the second
+        one after the first won't change anything.
+
+        The hash is calculated once and remembered, so it reflects
+        this Metadata as it was before anything (e.g. apply()) had a
+        chance to fill in missing information.
+
+        :return: A string of hex digits.
+        """
+        if self._content_hash is None:
+            normalized = self._normalize_for_hash(self)
+            self._content_hash = hashlib.sha256(
+                json.dumps(normalized, sort_keys=True)
+            ).hexdigest()
+        return self._content_hash
+
+    @classmethod
+    def _normalize_for_hash(cls, value):
+        """Turn a value into something json.dumps can serialize the
+        same way every time.
+        """
+        if value is None or isinstance(value, (bool, int, long, float, unicode)):
+            return value
+        if isinstance(value, str):
+            try:
+                return value.decode("utf8")
+            except UnicodeDecodeError:
+                # Binary content, such as an image.
+                return u"sha256:" + hashlib.sha256(value).hexdigest()
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return value.isoformat()
+        if isinstance(value, (list, tuple)):
+            return [cls._normalize_for_hash(x) for x in value]
+        if isinstance(value, (set, frozenset)):
+            return sorted(cls._normalize_for_hash(x) for x in value)
+        if isinstance(value, dict):
+            return dict(
+                (unicode(k), cls._normalize_for_hash(v))
+                for k, v in value.items()
+            )
+        if hasattr(value, '__table__'):
+            # A database object, such as a DataSource.
+            return u"%s:%s" % (value.__class__.__name__, value.id)
+        if hasattr(value, '__dict__'):
+            normalized = dict(
+                (k, cls._normalize_for_hash(v))
+                for k, v in vars(value).items()
+                if k not in cls.CONTENT_HASH_IGNORED_FIELDS
+            )
+            normalized[u'__class__'] = value.__class__.__name__
+            return normalized
+        return unicode(value)
+
     @property
     def links(self):
         return self.__links
@@ -1615,6 +1713,7 @@ class Metadata(MetaToModelUtility):
     def guess_license_pools(self, _db, metadata_client):
         """Try to find existing license pools for this Metadata."""
         potentials = {}
+        candidates = None
         for contributor in self.contributors:
             if not any(
                     x in contributor.roles for x in
@@ -1623,37 +1722,65 @@ class Metadata(MetaToModelUtility):
             ):
                 continue
             contributor.find_sort_name(_db, self.identifiers, metadata_client)
-            confidence = 0
 
-            base = _db.query(Edition).filter(
-                Edition.title.ilike(self.title)).filter(
-                    Edition.medium==Edition.BOOK_MEDIUM)
-            success = False
+            # Every match requires the title to be the same, so all
+            # the books with this title are found once, up front.
+            if candidates is None:
+                candidates = self._license_pool_candidates(_db)
 
             # A match based on work ID is the most reliable.
             pwid = self.calculate_permanent_work_id(_db, metadata_client)
-            clause = and_(Edition.data_source_id==LicensePool.data_source_id, Edition.primary_identifier_id==LicensePool.identifier_id)
-            qu = base.filter(Edition.permanent_work_id==pwid).join(LicensePool, clause)
-            success = self._run_query(qu, potentials, 0.95)
-            if not success and contributor.sort_name:
-                qu = base.filter(Edition.sort_author==contributor.sort_name)
-                success = self._run_query(qu, potentials, 0.9)
-            if not success and contributor.display_name:
-                qu = base.filter(Edition.author==contributor.display_name)
-                success = self._run_query(qu, potentials, 0.8)
-            if not success:
-                # Look for the book by an unknown author (our mistake)
-                qu = base.filter(Edition.author==Edition.UNKNOWN_AUTHOR)
-                success = self._run_query(qu, potentials, 0.45)
-            if not success:
-                # See if there is any book with this title at all.
-                success = self._run_query(base, potentials, 0.3)
+            rules = [(lambda e: e.permanent_work_id==pwid, 0.95)]
+            if contributor.sort_name:
+                rules.append(
+                    (lambda e: e.sort_author==contributor.sort_name, 0.9)
+                )
+            if contributor.display_name:
+                rules.append(
+                    (lambda e: e.author==contributor.display_name, 0.8)
+                )
+            # Look for the book by an unknown author (our mistake)
+            rules.append(
+                (lambda e: e.author==Edition.UNKNOWN_AUTHOR, 0.45)
+            )
+            # See if there is any book with this title at all.
+            rules.append((lambda e: True, 0.3))
+
+            for matches, confidence in rules:
+                matching = [
+                    (edition, pools) for edition, pools in candidates
+                    if matches(edition)
+                ]
+                if self._add_potentials(matching, potentials, confidence):
+                    break
         return potentials
 
-    def _run_query(self, qu, potentials, confidence):
+    def _license_pool_candidates(self, _db):
+        """Find the books with this Metadata's title, and the
+        LicensePools that provide access to them.
+
+        :return: A list of (Edition, [LicensePool]) 2-tuples.
+        """
+        clause = and_(Edition.data_source_id==LicensePool.data_source_id, Edition.primary_identifier_id==LicensePool.identifier_id)
+        qu = _db.query(Edition, LicensePool).outerjoin(
+            LicensePool, clause
+        ).filter(
+            Edition.title.ilike(self.title)
+        ).filter(
+            Edition.medium==Edition.BOOK_MEDIUM
+        ).order_by(Edition.id, LicensePool.id)
+
+        candidates = []
+        for edition, pool in qu:
+            if not candidates or candidates[-1][0] != edition:
+                candidates.append((edition, []))
+            if pool:
+                candidates[-1][1].append(pool)
+        return candidates
+
+    def _add_potentials(self, candidates, potentials, confidence):
         success = False
-        for i in qu:
-            pools = i.license_pools
+        for edition, pools in candidates:
             for lp in pools:
                 if lp and lp.deliverable and potentials.get(lp, 0) < confidence:
                     potentials[lp] = confidence
@@ -1754,8 +1881,10 @@ class Metadata(MetaToModelUtility):
 
         # Create equivalencies between all given identifiers and
         # the edition's primary identifier.
-        contributors_changed = self.update_contributions(_db, edition,
-                                  metadata_client, replace.contributions)
+        contributors_changed = self.update_contributions(
+            _db, edition, metadata_client, replace.contributions,
+            contributor_resolver=replace.contributor_resolver
+        )
         if contributors_changed:
             work_requires_new_presentation_edition = True
 
@@ -1773,47 +1902,14 @@ class Metadata(MetaToModelUtility):
                 identifier.equivalent_to(
                     data_source, new_identifier, identifier_data.weight)
 
-        new_subjects = {}
-        if self.subjects:
-            new_subjects = dict(
-                (subject.key, subject)
-                for subject in self.subjects
-            )
-        if replace.subjects:
-            # Remove any old Subjects from this data source, unless they
-            # are also in the list of new subjects.
-            surviving_classifications = []
-
-            def _key(classification):
-                s = classification.subject
-                return s.type, s.identifier, s.name, classification.weight
-
-            for classification in identifier.classifications:
-                if classification.data_source == data_source:
-                    key = _key(classification)
-                    if not key in new_subjects:
-                        # The data source has stopped claiming that
-                        # this classification should exist.
-                        _db.delete(classification)
-                        work_requires_full_recalculation = True
-                    else:
-                        # The data source maintains that this
-                        # classification is a good idea. We don't have
-                        # to do anything.
-                        del new_subjects[key]
-                        surviving_classifications.append(classification)
-                else:
-                    # This classification comes from some other data
-                    # source.  Don't mess with it.
-                    surviving_classifications.append(classification)
-            identifier.classifications = surviving_classifications
-
-        # Apply all new subjects to the identifier.
-        for subject in new_subjects.values():
-            identifier.classify(
-                data_source, subject.type, subject.identifier,
-                subject.name, weight=subject.weight)
-            work_requires_full_recalculation = True
+        if self.subjects or replace.subjects:
+            # Apply all the new subjects to the identifier at once,
+            # removing any old subjects from this data source if
+            # they're being replaced.
+            if identifier.classify_many(
+                data_source, self.subjects or [], replace=replace.subjects
+            ):
+                work_requires_full_recalculation = True
 
         # Associate all links with the primary identifier.
         if replace.links and self.links is not None:
@@ -2036,7 +2132,14 @@ class Metadata(MetaToModelUtility):
 
 
     def update_contributions(self, _db, edition, metadata_client=None,
-                             replace=True):
+                             replace=True, contributor_resolver=None):
+        """Give an Edition Contributions based on this Metadata's
+        contributors.
+
+        :param contributor_resolver: A ContributorResolver to find
+            Contributors with. If this is not provided, one will be
+            created just for this Metadata.
+        """
         contributors_changed = False
         old_contributors = []
         new_contributors = []
@@ -2055,6 +2158,7 @@ class Metadata(MetaToModelUtility):
                 _db.delete(contribution)
             edition.contributions = surviving_contributions
 
+        registered = []
         for contributor_data in self.contributors:
             contributor_data.find_sort_name(
                 _db, self.identifiers, metadata_client
@@ -2062,30 +2166,46 @@ class Metadata(MetaToModelUtility):
             if (contributor_data.sort_name
                 or contributor_data.lc
                 or contributor_data.viaf):
-                contributor = edition.add_contributor(
-                    name=contributor_data.sort_name,
-                    roles=contributor_data.roles,
-                    lc=contributor_data.lc,
-                    viaf=contributor_data.viaf
-                )
-                new_contributors.append(contributor.id)
-                if contributor_data.display_name:
-                    contributor.display_name = contributor_data.display_name
-                if contributor_data.biography:
-                    contributor.biography = contributor_data.biography
-                if contributor_data.aliases:
-                    contributor.aliases = contributor_data.aliases
-                if contributor_data.lc:
-                    contributor.lc = contributor_data.lc
-                if contributor_data.viaf:
-                    contributor.viaf = contributor_data.viaf
-                if contributor_data.wikipedia_name:
-                    contributor.wikipedia_name = contributor_data.wikipedia_name
+                registered.append(contributor_data)
             else:
                 self.log.info(
                     "Not registering %s because no sort name, LC, or VIAF",
                     contributor_data.display_name
                 )
+        # Find or create all the Contributors at once.
+        resolver = contributor_resolver or ContributorResolver(_db)
+        resolver.resolve([
+            (x.sort_name, x.lc, x.viaf) for x in registered
+        ])
+
+        contributions = []
+        for contributor_data in registered:
+            contributor = resolver.lookup(
+                contributor_data.sort_name, contributor_data.lc,
+                contributor_data.viaf
+            )
+            roles = contributor_data.roles
+            if isinstance(roles, basestring):
+                roles = [roles]
+            for role in roles:
+                contributions.append((contributor, role))
+            new_contributors.append(contributor.id)
+            if contributor_data.display_name:
+                contributor.display_name = contributor_data.display_name
+            if contributor_data.biography:
+                contributor.biography = contributor_data.biography
+            if contributor_data.aliases:
+                contributor.aliases = contributor_data.aliases
+            if contributor_data.lc:
+                contributor.lc = contributor_data.lc
+            if contributor_data.viaf:
+                contributor.viaf = contributor_data.viaf
+            if contributor_data.wikipedia_name:
+                contributor.wikipedia_name = contributor_data.wikipedia_name
+
+        # Then create all the Contributions at once.
+        if contributions:
+            resolver.add_contributions(edition, contributions)
 
         if sorted(old_contributors) != sorted(new_contributors):
             contributors_changed = True
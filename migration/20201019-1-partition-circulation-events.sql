@@ -0,0 +1,74 @@
+-- Convert circulationevents into a table partitioned by month on
+-- 'start', and copy the existing events into it.
+DO $$
+ DECLARE
+  month timestamp;
+  partition_name varchar;
+  undated integer;
+ BEGIN
+  IF EXISTS (
+   SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON pt.partrelid = c.oid
+   WHERE c.relname = 'circulationevents'
+  ) THEN
+   RAISE NOTICE 'circulationevents is already partitioned, leaving it alone.';
+   RETURN;
+  END IF;
+
+  -- 'start' is part of the primary key of the partitioned table, so
+  -- it can't be null. Events with no start date are given a start
+  -- date of 1970-01-01 and kept in the default partition. This
+  -- changes what reports see for these events: they used to have no
+  -- date at all, and now they appear to have happened in 1970. Any
+  -- report that needs to tell them apart should treat a start date
+  -- of 1970-01-01 as unknown.
+  SELECT count(*) INTO undated FROM circulationevents WHERE start IS NULL;
+  IF undated > 0 THEN
+   RAISE NOTICE 'Setting the start date of % undated circulation event(s) to 1970-01-01.', undated;
+   UPDATE circulationevents SET start = '1970-01-01' WHERE start IS NULL;
+  END IF;
+
+  CREATE TABLE circulationevents_partitioned (
+   LIKE circulationevents INCLUDING DEFAULTS,
+   PRIMARY KEY (id, start)
+  ) PARTITION BY RANGE (start);
+
+  -- Events for a month with no partition of its own end up here.
+  CREATE TABLE circulationevents_default PARTITION OF circulationevents_partitioned DEFAULT;
+
+  -- Create a partition for every month from the earliest event
+  -- through next month.
+  FOR month IN
+   SELECT generate_series(
+    date_trunc('month', coalesce((SELECT min(start) FROM circulationevents WHERE start > '1970-01-01'), now())),
+    date_trunc('month', now() + interval '1 month'),
+    interval '1 month'
+   )
+  LOOP
+   partition_name := 'circulationevents_' || to_char(month, 'YYYY_MM');
+   EXECUTE format(
+    'CREATE TABLE %I PARTITION OF circulationevents_partitioned FOR VALUES FROM (%L) TO (%L)',
+    partition_name, month, month + interval '1 month'
+   );
+  END LOOP;
+
+  INSERT INTO circulationevents_partitioned SELECT * FROM circulationevents;
+
+  -- Keep the ID sequence when the old table is dropped.
+  ALTER SEQUENCE circulationevents_id_seq OWNED BY NONE;
+  DROP TABLE circulationevents;
+  ALTER TABLE circulationevents_partitioned RENAME TO circulationevents;
+  ALTER SEQUENCE circulationevents_id_seq OWNED BY circulationevents.id;
+
+  ALTER TABLE circulationevents ADD CONSTRAINT circulationevents_license_pool_id_fkey FOREIGN KEY (license_pool_id) REFERENCES licensepools(id);
+  ALTER TABLE circulationevents ADD CONSTRAINT circulationevents_library_id_fkey FOREIGN KEY (library_id) REFERENCES libraries(id);
+
+  CREATE INDEX ix_circulationevents_license_pool_id ON circulationevents (license_pool_id);
+  CREATE INDEX ix_circulationevents_library_id ON circulationevents (library_id);
+  CREATE INDEX ix_circulationevents_type ON circulationevents (type);
+  CREATE INDEX ix_circulationevents_start ON circulationevents (start);
+  CREATE INDEX ix_circulationevents_location ON circulationevents (location);
+  CREATE INDEX ix_circulationevents_start_desc_nullslast ON circulationevents (start DESC NULLS LAST);
+  CREATE UNIQUE INDEX ix_circulationevents_license_pool_library_type_start ON circulationevents (license_pool_id, library_id, type, start);
+  CREATE UNIQUE INDEX ix_circulationevents_license_pool_type_start ON circulationevents (license_pool_id, type, start) WHERE library_id IS NULL;
+ END;
+$$;
@@ -0,0 +1,10 @@
+DO $$
+ BEGIN
+  -- Add the 'metadata_hash' column
+  BEGIN
+   ALTER TABLE editions ADD COLUMN metadata_hash varchar(64);
+  EXCEPTION
+   WHEN duplicate_column THEN RAISE NOTICE 'column editions.metadata_hash already exists, not creating it.';
+  END;
+ END;
+$$;
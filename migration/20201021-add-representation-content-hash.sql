@@ -0,0 +1,12 @@
+DO $$
+ BEGIN
+  -- Add the 'content_hash' column
+  BEGIN
+   ALTER TABLE representations ADD COLUMN content_hash varchar(64);
+  EXCEPTION
+   WHEN duplicate_column THEN RAISE NOTICE 'column representations.content_hash already exists, not creating it.';
+  END;
+ END;
+$$;
+
+CREATE INDEX IF NOT EXISTS ix_representations_content_hash ON representations (content_hash);
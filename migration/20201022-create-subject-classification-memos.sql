@@ -0,0 +1,20 @@
+DO $$
+    BEGIN
+        BEGIN
+            CREATE TABLE subjectclassificationmemos (
+                id SERIAL PRIMARY KEY,
+                type VARCHAR NOT NULL,
+                identifier VARCHAR NOT NULL,
+                name VARCHAR NOT NULL,
+                classifier_version VARCHAR NOT NULL,
+                genre VARCHAR,
+                audience VARCHAR,
+                target_age INT4RANGE,
+                fiction BOOLEAN
+            );
+            ALTER TABLE subjectclassificationmemos ADD CONSTRAINT subjectclassificationmemos_type_identifier_name_classifier__key UNIQUE (type, identifier, name, classifier_version);
+        EXCEPTION
+            WHEN duplicate_table THEN RAISE NOTICE 'Warning: subjectclassificationmemos already exists.';
+        END;
+    END;
+$$;
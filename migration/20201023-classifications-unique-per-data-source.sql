@@ -0,0 +1,17 @@
+-- Remove duplicate classifications, keeping the oldest one, so that
+-- a data source can only classify an identifier under a subject once.
+DELETE FROM classifications a USING classifications b
+ WHERE a.id > b.id
+ AND a.identifier_id = b.identifier_id
+ AND a.subject_id = b.subject_id
+ AND a.data_source_id = b.data_source_id;
+
+DO $$
+ BEGIN
+  BEGIN
+   ALTER TABLE classifications ADD CONSTRAINT classifications_identifier_id_subject_id_data_source_id_key UNIQUE (identifier_id, subject_id, data_source_id);
+  EXCEPTION
+   WHEN duplicate_table THEN RAISE NOTICE 'Warning: classifications_identifier_id_subject_id_data_source_id_key already exists.';
+  END;
+ END;
+$$;
@@ -0,0 +1,15 @@
+DO $$
+    BEGIN
+        BEGIN
+            CREATE TABLE sortnamememos (
+                id SERIAL PRIMARY KEY,
+                display_name VARCHAR NOT NULL UNIQUE,
+                sort_name VARCHAR NOT NULL,
+                source VARCHAR NOT NULL,
+                asked_canonicalizer BOOLEAN NOT NULL DEFAULT false
+            );
+        EXCEPTION
+            WHEN duplicate_table THEN RAISE NOTICE 'Warning: sortnamememos already exists.';
+        END;
+    END;
+$$;
@@ -0,0 +1,10 @@
+DO $$
+ BEGIN
+  -- Add the 'permanent_work_id_input_hash' column
+  BEGIN
+   ALTER TABLE editions ADD COLUMN permanent_work_id_input_hash varchar(32);
+  EXCEPTION
+   WHEN duplicate_column THEN RAISE NOTICE 'column editions.permanent_work_id_input_hash already exists, not creating it.';
+  END;
+ END;
+$$;
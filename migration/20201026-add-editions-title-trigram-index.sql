@@ -0,0 +1,15 @@
+-- The trigram index only makes some lookups faster, so it's skipped
+-- if the pg_trgm extension isn't installed or can't be enabled by
+-- this database user.
+DO $$
+ BEGIN
+  BEGIN
+   CREATE EXTENSION IF NOT EXISTS pg_trgm;
+  EXCEPTION WHEN OTHERS THEN
+   RAISE NOTICE 'Could not enable the pg_trgm extension (%); skipping the trigram index on editions.title.', SQLERRM;
+   RETURN;
+  END;
+
+  CREATE INDEX IF NOT EXISTS ix_editions_title_trgm ON editions USING gin (title gin_trgm_ops);
+ END;
+$$;
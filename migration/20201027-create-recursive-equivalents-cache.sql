@@ -0,0 +1,27 @@
+DO $$
+    BEGIN
+        BEGIN
+            CREATE TABLE recursiveequivalentscache (
+                parent_identifier_id INTEGER NOT NULL REFERENCES identifiers(id) ON DELETE CASCADE,
+                identifier_id INTEGER NOT NULL REFERENCES identifiers(id) ON DELETE CASCADE,
+                PRIMARY KEY (parent_identifier_id, identifier_id)
+            );
+            CREATE INDEX ix_recursiveequivalentscache_identifier_id
+                ON recursiveequivalentscache (identifier_id);
+
+            -- Fill in the closure of every identifier that's part of
+            -- an equivalency, using the default policy's settings.
+            INSERT INTO recursiveequivalentscache (parent_identifier_id, identifier_id)
+                SELECT p.id, e.id
+                FROM (
+                    SELECT input_id AS id FROM equivalents
+                    UNION
+                    SELECT output_id FROM equivalents
+                ) AS p,
+                LATERAL fn_recursive_equivalents(p.id, 3, 0.5, 1000) AS e(id)
+                WHERE p.id IS NOT NULL AND e.id != p.id;
+        EXCEPTION
+            WHEN duplicate_table THEN RAISE NOTICE 'Warning: recursiveequivalentscache already exists.';
+        END;
+    END;
+$$;
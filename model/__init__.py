@@ -15,6 +15,7 @@ from sqlalchemy import (
     text,
 )
 from sqlalchemy.exc import (
+    DBAPIError,
     IntegrityError,
     SAWarning,
 )
@@ -173,6 +174,67 @@ class PresentationCalculationPolicy(object):
     DEFAULT_THRESHOLD = 0.5
     DEFAULT_CUTOFF = 1000
 
+    # The steps of presentation calculation that can be turned on and
+    # off.
+    STEPS = [
+        'choose_edition', 'set_edition_metadata', 'choose_cover',
+        'classify', 'choose_summary', 'calculate_quality',
+    ]
+
+    # The kinds of change to a Work's underlying data that
+    # for_changes() knows about, and the steps that have to be redone
+    # after each one.
+    BIBLIOGRAPHIC_CHANGE = u'bibliographic'
+    COVER_CHANGE = u'cover'
+    SUBJECT_CHANGE = u'subject'
+    DESCRIPTION_CHANGE = u'description'
+    MEASUREMENT_CHANGE = u'measurement'
+    EQUIVALENCY_CHANGE = u'equivalency'
+    LICENSE_POOL_CHANGE = u'license-pool'
+
+    STEPS_FOR_CHANGE = {
+        BIBLIOGRAPHIC_CHANGE : ['choose_edition', 'set_edition_metadata'],
+        COVER_CHANGE : ['choose_cover'],
+        SUBJECT_CHANGE : ['classify'],
+        DESCRIPTION_CHANGE : ['choose_summary'],
+        MEASUREMENT_CHANGE : ['calculate_quality'],
+        # Classifications, summaries and measurements are all
+        # gathered from equivalent identifiers, and so are covers.
+        EQUIVALENCY_CHANGE : [
+            'choose_cover', 'classify', 'choose_summary', 'calculate_quality'
+        ],
+        # A Work's LicensePools determine its presentation edition,
+        # and their data sources affect the choice of summary and the
+        # default quality.
+        LICENSE_POOL_CHANGE : [
+            'choose_edition', 'set_edition_metadata', 'choose_cover',
+            'choose_summary', 'calculate_quality'
+        ],
+    }
+
+    # The parts of a Work's presentation that calculate_presentation()
+    # can change, and the things generated from the presentation that
+    # have to be regenerated when each one changes.
+    EDITION = u'edition'
+    CLASSIFICATION = u'classification'
+    SUMMARY = u'summary'
+    QUALITY = u'quality'
+
+    OPDS_ENTRY = u'opds-entry'
+    VERBOSE_OPDS_ENTRY = u'verbose-opds-entry'
+    MARC_RECORD = u'marc-record'
+    SEARCH_DOCUMENT = u'search-document'
+    PRODUCTS = [OPDS_ENTRY, VERBOSE_OPDS_ENTRY, MARC_RECORD, SEARCH_DOCUMENT]
+
+    DEPENDENT_PRODUCTS = {
+        EDITION : PRODUCTS,
+        CLASSIFICATION : PRODUCTS,
+        SUMMARY : PRODUCTS,
+        # Only the verbose OPDS entry and the search document
+        # mention a Work's quality.
+        QUALITY : [VERBOSE_OPDS_ENTRY, SEARCH_DOCUMENT],
+    }
+
     def __init__(self,
                  choose_edition=True,
                  set_edition_metadata=True,
@@ -258,6 +320,42 @@ class PresentationCalculationPolicy(object):
         self.equivalent_identifier_cutoff = equivalent_identifier_cutoff
 
 
+    @classmethod
+    def for_changes(cls, *changes, **kwargs):
+        """A PresentationCalculationPolicy that only redoes the steps
+        that depend on certain kinds of change.
+
+        :param changes: Some of the *_CHANGE constants, e.g.
+           MEASUREMENT_CHANGE.
+        :param kwargs: Other arguments to the constructor. These can
+           also be used to turn particular steps on or off.
+        """
+        steps = set()
+        for change in changes:
+            steps.update(cls.STEPS_FOR_CHANGE[change])
+        for step in cls.STEPS:
+            kwargs.setdefault(step, step in steps)
+        return cls(**kwargs)
+
+    def products_to_regenerate(self, changed):
+        """Decide which things generated from a Work's presentation
+        need to be regenerated.
+
+        :param changed: The parts of the Work's presentation that
+           changed, e.g. QUALITY.
+        :return: A set of products, e.g. SEARCH_DOCUMENT.
+        """
+        products = set()
+        for part in changed:
+            products.update(self.DEPENDENT_PRODUCTS[part])
+        if self.regenerate_opds_entries:
+            products.update([self.OPDS_ENTRY, self.VERBOSE_OPDS_ENTRY])
+        if self.regenerate_marc_record:
+            products.add(self.MARC_RECORD)
+        if self.update_search_index:
+            products.add(self.SEARCH_DOCUMENT)
+        return products
+
     @classmethod
     def recalculate_everything(cls):
         """A PresentationCalculationPolicy that always recalculates
@@ -305,6 +403,14 @@ class SessionManager(object):
     # is also defined in SQL.
     RECURSIVE_EQUIVALENTS_FUNCTION = 'recursive_equivalents.sql'
 
+    # Indexes that can only be created if the pg_trgm extension is
+    # available. A trigram index on editions.title lets
+    # case-insensitive title lookups, such as the ones done by
+    # Metadata.guess_license_pools, use an index.
+    TRIGRAM_INDEXES = [
+        "CREATE INDEX IF NOT EXISTS ix_editions_title_trgm ON editions USING gin (title gin_trgm_ops)",
+    ]
+
     engine_for_url = {}
 
     @classmethod
@@ -400,6 +506,30 @@ class SessionManager(object):
             if not name.startswith('mv_')
         ]
         Base.metadata.create_all(engine, tables=to_create)
+        cls.initialize_trigram_indexes(engine)
+
+    @classmethod
+    def initialize_trigram_indexes(cls, engine):
+        """Create the indexes that need the pg_trgm extension, if it's
+        available.
+
+        These indexes only make some lookups faster. If the extension
+        isn't installed, or this database user isn't allowed to enable
+        it, they're left out.
+
+        :return: True if the indexes were created, False otherwise.
+        """
+        try:
+            engine.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except DBAPIError, e:
+            logging.warn(
+                "Could not enable the pg_trgm extension; skipping trigram indexes: %s",
+                e
+            )
+            return False
+        for sql in cls.TRIGRAM_INDEXES:
+            engine.execute(sql)
+        return True
 
     @classmethod
     def session(cls, url, initialize_data=True, initialize_schema=True):
@@ -480,6 +610,10 @@ from admin import (
     Admin,
     AdminRole,
 )
+from blobstore import (
+    BlobStore,
+    LocalBlobStore,
+)
 from coverage import (
     BaseCoverageRecord,
     CoverageRecord,
@@ -491,11 +625,15 @@ from cachedfeed import (
     WillNotGenerateExpensiveFeed,
     CachedMARCFile,
 )
-from circulationevent import CirculationEvent
+from circulationevent import (
+    CirculationEvent,
+    CirculationEventBuffer,
+)
 from classification import (
     Classification,
     Genre,
     Subject,
+    SubjectClassificationMemo,
 )
 from collection import (
     Collection,
@@ -512,6 +650,8 @@ from complaint import Complaint
 from contributor import (
     Contribution,
     Contributor,
+    ContributorResolver,
+    SortNameMemo,
 )
 from credential import (
     Credential,
@@ -528,6 +668,8 @@ from hasfulltablecache import HasFullTableCache
 from identifier import (
     Equivalency,
     Identifier,
+    IdentifierResolver,
+    RecursiveEquivalencyCache,
 )
 from integrationclient import IntegrationClient
 from library import Library
@@ -0,0 +1,180 @@
+# encoding: utf-8
+# BlobStore, LocalBlobStore
+from nose.tools import set_trace
+
+from hashlib import sha256
+from io import BytesIO
+import mmap
+import os
+import tempfile
+
+from ..config import Configuration
+
+class BlobStore(object):
+    """Stores byte strings under the SHA-256 hash of their content.
+
+    Since the key is derived from the content, storing the same
+    content twice only stores it once.
+    """
+
+    RESET = object()
+
+    # The BlobStore that Representations keep their content in. If
+    # this is None, content is kept in the database.
+    _instance = RESET
+
+    @classmethod
+    def instance(cls):
+        """Find the BlobStore that Representations should use.
+
+        Unless some other store has been installed with
+        set_instance(), this is a LocalBlobStore in the configured
+        blob store directory. Using a blob store is opt-in: if no
+        directory is configured, content is kept in the database.
+        """
+        if cls._instance is cls.RESET:
+            directory = Configuration.blob_store_directory()
+            if directory:
+                cls._instance = LocalBlobStore(directory)
+            else:
+                cls._instance = None
+        return cls._instance
+
+    @classmethod
+    def set_instance(cls, store):
+        """Make Representations keep their content in `store`.
+
+        :param store: A BlobStore, or None to keep content in the
+            database.
+        """
+        cls._instance = store
+
+    @classmethod
+    def reset(cls):
+        """Look for the BlobStore again next time instance() is called."""
+        cls._instance = cls.RESET
+
+    @classmethod
+    def key(cls, content):
+        """The key under which `content` would be stored."""
+        return sha256(content).hexdigest()
+
+    def put(self, content):
+        """Store some content, unless it's already stored.
+
+        :return: The key under which the content is stored.
+        """
+        key = self.key(content)
+        if not self.exists(key):
+            self._put(key, content)
+        return key
+
+    def get(self, key):
+        """Retrieve stored content.
+
+        :return: A bytestring, or None if nothing is stored under `key`.
+        """
+        fh = self.open(key)
+        if fh is None:
+            return None
+        try:
+            return fh.read()
+        finally:
+            fh.close()
+
+    def exists(self, key):
+        raise NotImplementedError()
+
+    def open(self, key):
+        """Open stored content for reading.
+
+        :return: A file-like object, or None if nothing is stored
+            under `key`.
+        """
+        raise NotImplementedError()
+
+    def _put(self, key, content):
+        raise NotImplementedError()
+
+
+class MappedFile(object):
+    """A read-only memory map that can be read like a file.
+
+    On Python 2, mmap.read() has to be told how much to read, so
+    read() with no arguments is handled here. Everything else is
+    passed through to the mmap.
+    """
+
+    def __init__(self, mapped):
+        self.mmap = mapped
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.mmap.size() - self.mmap.tell()
+        return self.mmap.read(size)
+
+    def __getattr__(self, name):
+        return getattr(self.mmap, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class LocalBlobStore(BlobStore):
+    """Keeps content in files on the local filesystem."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        """Where the content stored under `key` lives.
+
+        Content is spread across subdirectories named for the start
+        of the key, so no one directory gets too big.
+        """
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def open(self, key):
+        """Open stored content as a read-only memory map.
+
+        :return: A MappedFile, or None if nothing is stored under `key`.
+        """
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # An empty file can't be memory-mapped.
+                return BytesIO()
+            return MappedFile(
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            )
+
+    def _put(self, key, content):
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            try:
+                os.makedirs(directory)
+            except OSError, e:
+                # Another process created it first.
+                if not os.path.isdir(directory):
+                    raise
+
+        # Write to a temporary file and rename it into place, so
+        # nobody ever sees a partially written file.
+        fd, temporary_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.rename(temporary_path, path)
+        except Exception:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
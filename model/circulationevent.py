@@ -9,35 +9,61 @@ from . import (
 
 import datetime
 import logging
+import re
 from sqlalchemy import (
     Column,
     DateTime,
+    DDL,
+    event,
     ForeignKey,
     Index,
     Integer,
     String,
     Unicode,
 )
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import text
 
 class CirculationEvent(Base):
 
     """Changes to a license pool's circulation status.
     We log these so we can measure things like the velocity of
     individual books.
+
+    This table is partitioned by month on `start`. Events for a month
+    that doesn't have a partition yet go into the default partition
+    until CirculationEvent.create_partition() is called for that
+    month.
+
+    Since `start` is part of the primary key, it can't be null.
+    Events that were logged without a start date before the table
+    was partitioned have a start date of 1970-01-01.
     """
     __tablename__ = 'circulationevents'
 
     # Used to explicitly tag an event as happening at an unknown time.
     NO_DATE = object()
 
-    id = Column(Integer, primary_key=True)
+    # The names of the partitions of this table.
+    PARTITION_NAME_FORMAT = "circulationevents_%04d_%02d"
+    PARTITION_NAME_RE = re.compile("^circulationevents_([0-9]{4})_([0-9]{2})$")
+    DEFAULT_PARTITION = "circulationevents_default"
+
+    # The ID is the primary key as far as SQLAlchemy is concerned, but
+    # Postgres requires that the primary key of a partitioned table
+    # include the partition key, so in the database the primary key
+    # is (id, start).
+    id = Column(Integer, primary_key=True, autoincrement=True)
 
     # One LicensePool can have many circulation events.
     license_pool_id = Column(
         Integer, ForeignKey('licensepools.id'), index=True)
 
     type = Column(String(32), index=True)
-    start = Column(DateTime, index=True)
+    start = Column(
+        DateTime, primary_key=True, index=True,
+        default=datetime.datetime.utcnow
+    )
     end = Column(DateTime)
     old_value = Column(Integer)
     delta = Column(Integer)
@@ -89,8 +115,13 @@ class CirculationEvent(Base):
             unique=True,
             postgresql_where=(library_id==None)
         ),
+
+        # Store events in monthly partitions.
+        dict(postgresql_partition_by='RANGE (start)'),
     )
 
+    __mapper_args__ = dict(primary_key=[id])
+
     # Constants for use in logging circulation events to JSON
     SOURCE = u"source"
     TYPE = u"event"
@@ -157,3 +188,239 @@ class CirculationEvent(Base):
         if was_new:
             logging.info("EVENT %s %s=>%s", event_name, old_value, new_value)
         return event, was_new
+
+    @classmethod
+    def bulk_log(cls, _db, events):
+        """Log a number of CirculationEvents to the database with a
+        single statement, ignoring any that have already been recorded.
+
+        :param events: A list of dictionaries, each containing keyword
+            arguments that could be passed into log().
+
+        :return: The number of events that were actually recorded.
+        """
+        if not events:
+            return 0
+        rows = [cls._row(**kwargs) for kwargs in events]
+        statement = insert(cls.__table__).values(rows).on_conflict_do_nothing()
+        recorded = _db.execute(statement).rowcount
+        logging.info("Recorded %d of %d event(s)", recorded, len(rows))
+        return recorded
+
+    @classmethod
+    def _row(cls, license_pool, event_name, old_value, new_value,
+             start=None, end=None, library=None, location=None):
+        """Turn the arguments to log() into a row for the
+        circulationevents table.
+        """
+        if new_value is None or old_value is None:
+            delta = None
+        else:
+            delta = new_value - old_value
+        if not start:
+            start = datetime.datetime.utcnow()
+        if not end:
+            end = start
+        return dict(
+            license_pool_id=license_pool.id if license_pool else None,
+            library_id=library.id if library else None,
+            type=event_name,
+            start=start,
+            end=end,
+            old_value=old_value,
+            new_value=new_value,
+            delta=delta,
+            location=location,
+        )
+
+    @classmethod
+    def is_partitioned(cls, _db):
+        """Has the circulationevents table been converted into a
+        partitioned table?
+
+        Databases created before partitioning was introduced keep an
+        ordinary table until the corresponding migration is run.
+        """
+        qu = text(
+            "select count(*) from pg_partitioned_table pt "
+            "join pg_class c on pt.partrelid = c.oid "
+            "where c.relname = :table"
+        )
+        return _db.execute(qu, dict(table=cls.__tablename__)).scalar() > 0
+
+    @classmethod
+    def month_bounds(cls, month):
+        """Find the range of dates covered by the partition for `month`.
+
+        :param month: A date or datetime anywhere in the month.
+        :return: A 2-tuple of datetimes (inclusive, exclusive).
+        """
+        lower = datetime.datetime(month.year, month.month, 1)
+        if month.month == 12:
+            upper = datetime.datetime(month.year + 1, 1, 1)
+        else:
+            upper = datetime.datetime(month.year, month.month + 1, 1)
+        return lower, upper
+
+    @classmethod
+    def partitions(cls, _db):
+        """Find the monthly partitions of this table.
+
+        :return: A list of (partition name, lower bound, upper bound)
+            3-tuples, ordered by date.
+        """
+        qu = text(
+            "select c.relname from pg_inherits i "
+            "join pg_class c on i.inhrelid = c.oid "
+            "join pg_class p on i.inhparent = p.oid "
+            "where p.relname = :table"
+        )
+        partitions = []
+        for [name] in _db.execute(qu, dict(table=cls.__tablename__)):
+            match = cls.PARTITION_NAME_RE.match(name)
+            if not match:
+                # This is the default partition.
+                continue
+            year, month = [int(x) for x in match.groups()]
+            lower, upper = cls.month_bounds(datetime.date(year, month, 1))
+            partitions.append((name, lower, upper))
+        return sorted(partitions, key=lambda x: x[1])
+
+    @classmethod
+    def create_partition(cls, _db, month):
+        """Make sure there's a partition for the given month.
+
+        If the default partition contains events from that month,
+        they are moved into the new partition.
+
+        :param month: A date or datetime anywhere in the month.
+        :return: The name of the partition, or None if this table is
+            not partitioned.
+        """
+        if not cls.is_partitioned(_db):
+            return None
+        name = cls.PARTITION_NAME_FORMAT % (month.year, month.month)
+        if name in [x[0] for x in cls.partitions(_db)]:
+            return name
+
+        lower, upper = cls.month_bounds(month)
+        bounds = dict(lower=lower, upper=upper)
+        in_range = "start >= :lower and start < :upper"
+        stranded = _db.execute(
+            text("select count(*) from %s where %s" % (
+                cls.DEFAULT_PARTITION, in_range
+            )), bounds
+        ).scalar()
+        create = text(
+            "create table %s partition of %s for values from (:lower) to (:upper)" % (
+                name, cls.__tablename__
+            )
+        )
+        if not stranded:
+            _db.execute(create, bounds)
+            return name
+
+        # Postgres won't create a partition if the default partition
+        # contains rows that belong in it. Detach the default
+        # partition, move the rows over, and attach it again.
+        _db.execute(
+            "alter table %s detach partition %s" % (
+                cls.__tablename__, cls.DEFAULT_PARTITION
+            )
+        )
+        _db.execute(create, bounds)
+        _db.execute(
+            text("insert into %s select * from %s where %s" % (
+                cls.__tablename__, cls.DEFAULT_PARTITION, in_range
+            )), bounds
+        )
+        _db.execute(
+            text("delete from %s where %s" % (
+                cls.DEFAULT_PARTITION, in_range
+            )), bounds
+        )
+        _db.execute(
+            "alter table %s attach partition %s default" % (
+                cls.__tablename__, cls.DEFAULT_PARTITION
+            )
+        )
+        logging.info(
+            "Moved %d event(s) from %s into new partition %s.", stranded,
+            cls.DEFAULT_PARTITION, name
+        )
+        return name
+
+    @classmethod
+    def months_in_default_partition(cls, _db):
+        """Find the months for which events were recorded in the default
+        partition because there was no partition for them.
+
+        :return: A list of datetimes, one for the start of each month.
+        """
+        qu = text(
+            "select distinct date_trunc('month', start) from %s "
+            "where start is not null" % cls.DEFAULT_PARTITION
+        )
+        return sorted(x for [x] in _db.execute(qu))
+
+
+# Events go into this partition when there's no monthly partition for
+# them.
+event.listen(
+    CirculationEvent.__table__, "after_create",
+    DDL(
+        "CREATE TABLE IF NOT EXISTS %s PARTITION OF %s DEFAULT" % (
+            CirculationEvent.DEFAULT_PARTITION,
+            CirculationEvent.__tablename__
+        )
+    )
+)
+
+
+class CirculationEventBuffer(object):
+    """Collect CirculationEvents in memory and record them in batches
+    with CirculationEvent.bulk_log(), rather than running a query for
+    every event.
+
+    Use it as a context manager to make sure any remaining events are
+    recorded at the end.
+    """
+
+    DEFAULT_BATCH_SIZE = 500
+
+    def __init__(self, _db, batch_size=None):
+        self._db = _db
+        self.batch_size = batch_size or self.DEFAULT_BATCH_SIZE
+        self.events = []
+        self.recorded = 0
+
+    def log(self, license_pool, event_name, old_value, new_value,
+            start=None, end=None, library=None, location=None):
+        """Queue an event to be recorded. Takes the same arguments as
+        CirculationEvent.log().
+        """
+        self.events.append(
+            dict(license_pool=license_pool, event_name=event_name,
+                 old_value=old_value, new_value=new_value, start=start,
+                 end=end, library=library, location=location)
+        )
+        if len(self.events) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Record all queued events.
+
+        :return: The number of events that were actually recorded.
+        """
+        events = self.events
+        self.events = []
+        recorded = CirculationEvent.bulk_log(self._db, events)
+        self.recorded += recorded
+        return recorded
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.flush()
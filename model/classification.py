@@ -20,6 +20,7 @@ from ..classifier import (
     Erotica,
     GenreData,
 )
+from ..util.lru import LRUCache
 from ..util.string_helpers import native_string
 
 import logging
@@ -31,10 +32,14 @@ from sqlalchemy import (
     ForeignKey,
     func,
     Integer,
+    tuple_,
     Unicode,
     UniqueConstraint,
 )
-from sqlalchemy.dialects.postgresql import INT4RANGE
+from sqlalchemy.dialects.postgresql import (
+    INT4RANGE,
+    insert,
+)
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm.session import Session
@@ -231,6 +236,78 @@ class Subject(Base):
             subject.name = name
         return subject, new
 
+    @classmethod
+    def lookup_many(cls, _db, keys):
+        """Turn a number of (type, identifier, name) 3-tuples into Subjects.
+
+        This does the same thing as calling lookup() on each tuple,
+        but Subjects that have identifiers are found with one query,
+        and any that don't exist yet are created with one INSERT.
+
+        :return: A dictionary mapping each 3-tuple to a Subject.
+        """
+        subjects = dict()
+
+        # Maps (type, identifier) to the name of the Subject to create
+        # if there isn't one already.
+        names = dict()
+        for key in keys:
+            type, identifier, name = key
+            if not type:
+                raise ValueError("Cannot look up Subject with no type.")
+            if identifier:
+                if not names.get((type, identifier)):
+                    names[(type, identifier)] = name
+            elif key not in subjects:
+                # Type + name isn't unique, so these Subjects have to
+                # be looked up one at a time.
+                subjects[key], ignore = cls.lookup(_db, type, identifier, name)
+        if not names:
+            return subjects
+
+        by_identifier = cls._by_type_and_identifier(_db, names.keys())
+        # Create Subjects in sorted order, so that two processes
+        # creating overlapping sets of Subjects lock them in the same
+        # order.
+        missing = sorted(x for x in names if x not in by_identifier)
+        if missing:
+            rows = [
+                dict(type=type, identifier=identifier,
+                     name=names[(type, identifier)])
+                for type, identifier in missing
+            ]
+            # Another process may be creating some of the same
+            # Subjects. If so, we'll use the ones it creates.
+            _db.execute(
+                insert(cls.__table__).values(rows).on_conflict_do_nothing(
+                    index_elements=['type', 'identifier']
+                )
+            )
+            by_identifier.update(cls._by_type_and_identifier(_db, missing))
+
+        for key in keys:
+            type, identifier, name = key
+            if not identifier:
+                continue
+            subject = by_identifier[(type, identifier)]
+            if name and not subject.name:
+                # We just discovered the name of a subject that
+                # previously had only an ID.
+                subject.name = name
+            subjects[key] = subject
+        return subjects
+
+    @classmethod
+    def _by_type_and_identifier(cls, _db, pairs):
+        """Find the Subjects with the given (type, identifier) 2-tuples.
+
+        :return: A dictionary mapping 2-tuples to Subjects.
+        """
+        qu = _db.query(cls).filter(
+            tuple_(cls.type, cls.identifier).in_(list(pairs))
+        )
+        return dict(((x.type, x.identifier), x) for x in qu)
+
     @classmethod
     def common_but_not_assigned_to_genre(cls, _db, min_occurances=1000,
                                          type_restriction=None):
@@ -264,12 +341,13 @@ class Subject(Base):
         if not force:
             q = q.filter(Subject.checked==False)
 
-        counter = 0
-        for subject in q:
-            subject.assign_to_genre()
-            counter += 1
-            if not counter % batch_size:
-                _db.commit()
+        subjects = q.all()
+        for start in range(0, len(subjects), batch_size):
+            batch = subjects[start:start+batch_size]
+            SubjectClassificationMemo.preload(_db, batch)
+            for subject in batch:
+                subject.assign_to_genre()
+            _db.commit()
         _db.commit()
 
     def assign_to_genre(self):
@@ -280,7 +358,9 @@ class Subject(Base):
         self.checked = True
         log = logging.getLogger("Subject-genre assignment")
 
-        genredata, audience, target_age, fiction = classifier.classify(self)
+        genredata, audience, target_age, fiction = SubjectClassificationMemo.classify(
+            classifier, self
+        )
         # If the genre is erotica, the audience will always be ADULTS_ONLY,
         # no matter what the classifier says.
         if genredata == Erotica:
@@ -333,6 +413,133 @@ class Subject(Base):
         self.target_age = tuple_to_numericrange(target_age)
 
 
+class SubjectClassificationMemo(Base):
+    """Remembers what a Classifier said about a subject.
+
+    A Classifier's answer depends only on a subject's type, identifier
+    and name. Until the classification rules change, a subject that
+    has been marked as unchecked, or that some other process is
+    looking at, doesn't need to go through the Classifier again.
+    """
+    __tablename__ = 'subjectclassificationmemos'
+    id = Column(Integer, primary_key=True)
+
+    type = Column(Unicode, nullable=False)
+
+    # A missing identifier or name is stored as the empty string, so
+    # that the unique constraint applies.
+    identifier = Column(Unicode, nullable=False)
+    name = Column(Unicode, nullable=False)
+
+    # The value of Classifier.version() when the Classifier was run.
+    classifier_version = Column(Unicode, nullable=False)
+
+    # What the Classifier said.
+    genre = Column(Unicode)
+    audience = Column(Unicode)
+    target_age = Column(INT4RANGE)
+    fiction = Column(Boolean)
+
+    __table_args__ = (
+        UniqueConstraint('type', 'identifier', 'name', 'classifier_version'),
+    )
+
+    # Answers this process has come up with or looked up recently,
+    # keyed by (classifier, type, identifier, name).
+    _cache = LRUCache(100000)
+
+    @classmethod
+    def reset_cache(cls):
+        cls._cache.clear()
+
+    @classmethod
+    def _key(cls, subject):
+        return (subject.type, subject.identifier or u'', subject.name or u'')
+
+    @property
+    def result(self):
+        """Turn this memo back into the output of Classifier.classify."""
+        genredata = None
+        if self.genre:
+            genredata = classifier.genres.get(self.genre)
+        target_age = None
+        if self.target_age is not None:
+            target_age = numericrange_to_tuple(self.target_age)
+        return genredata, self.audience, target_age, self.fiction
+
+    @classmethod
+    def classify(cls, classifier, subject):
+        """Run a Classifier on a Subject, unless the answer is already known.
+
+        :return: The same 4-tuple as Classifier.classify.
+        """
+        key = (classifier,) + cls._key(subject)
+        result = cls._cache.get(key)
+        if result is not None:
+            return result
+
+        _db = Session.object_session(subject)
+        version = Classifier.version()
+        remember = _db is not None and version is not None
+        if remember:
+            with _db.no_autoflush:
+                memo = get_one(
+                    _db, cls, type=key[1], identifier=key[2], name=key[3],
+                    classifier_version=version
+                )
+            if memo:
+                result = memo.result
+        if result is None:
+            result = classifier.classify(subject)
+            if remember:
+                cls._remember(_db, key[1:], version, result)
+        cls._cache.set(key, result)
+        return result
+
+    @classmethod
+    def _remember(cls, _db, key, version, result):
+        type, identifier, name = key
+        genredata, audience, target_age, fiction = result
+        values = dict(
+            type=type, identifier=identifier, name=name,
+            classifier_version=version,
+            genre=genredata.name if genredata else None,
+            audience=audience, target_age=tuple_to_numericrange(target_age),
+            fiction=fiction,
+        )
+        # Another process may have classified the same subject in
+        # the meantime. If so, its answer is just as good.
+        _db.execute(
+            insert(cls.__table__).values(**values).on_conflict_do_nothing()
+        )
+
+    @classmethod
+    def preload(cls, _db, subjects):
+        """Look up the stored answers for a batch of Subjects with a
+        single query, so classify() doesn't have to look them up one
+        at a time.
+        """
+        version = Classifier.version()
+        if version is None:
+            return
+        classifiers = dict()
+        for subject in subjects:
+            subject_classifier = Classifier.classifiers.get(subject.type)
+            if subject_classifier:
+                classifiers[cls._key(subject)] = subject_classifier
+        if not classifiers:
+            return
+
+        qu = _db.query(cls).filter(
+            cls.classifier_version==version
+        ).filter(
+            tuple_(cls.type, cls.identifier, cls.name).in_(classifiers.keys())
+        )
+        for memo in qu:
+            key = (memo.type, memo.identifier, memo.name)
+            cls._cache.set((classifiers[key],) + key, memo.result)
+
+
 class Classification(Base):
     """The assignment of a Identifier to a Subject."""
     __tablename__ = 'classifications'
@@ -345,6 +552,12 @@ class Classification(Base):
     # How much weight the data source gives to this classification.
     weight = Column(Integer)
 
+    # A data source can only classify an identifier under a given
+    # subject once.
+    __table_args__ = (
+        UniqueConstraint('identifier_id', 'subject_id', 'data_source_id'),
+    )
+
     # If we hear about a classification from a distributor (and we
     # trust the distributor to have accurate classifications), we
     # should give it this weight. This lets us keep the weights
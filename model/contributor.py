@@ -1,5 +1,5 @@
 # encoding: utf-8
-# Contributor, Contribution
+# Contributor, Contribution, ContributorResolver, SortNameMemo
 from nose.tools import set_trace
 
 from . import (
@@ -10,7 +10,9 @@ from . import (
 
 import logging
 import re
+from collections import defaultdict
 from sqlalchemy import (
+    Boolean,
     Column,
     ForeignKey,
     Integer,
@@ -20,6 +22,7 @@ from sqlalchemy import (
 from sqlalchemy.dialects.postgresql import (
     ARRAY,
     JSON,
+    insert,
 )
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.mutable import MutableDict
@@ -28,6 +31,8 @@ from sqlalchemy.orm import (
     synonym,
 )
 from sqlalchemy.orm.session import Session
+from sqlalchemy.sql.expression import or_
+from ..util.lru import LRUCache
 from ..util.personal_names import display_name_to_sort_name
 from ..util.string_helpers import native_string
 
@@ -467,3 +472,249 @@ class Contribution(Base):
         UniqueConstraint('edition_id', 'contributor_id', 'role'),
     )
 
+
+
+class ContributorResolver(object):
+    """Find or create the Contributors mentioned in many pieces of
+    metadata at once.
+
+    Contributor.lookup() takes a query or two to find each
+    Contributor. An importer can instead gather up everyone mentioned
+    on a page of a feed and resolve them all with a few queries.
+    Contributors are found and created the same way Contributor.lookup()
+    would find and create them.
+    """
+
+    def __init__(self, _db):
+        self._db = _db
+
+        # Contributors that have already been resolved, keyed by
+        # (sort_name, lc, viaf).
+        self._resolved = dict()
+
+    @classmethod
+    def key(cls, sort_name=None, lc=None, viaf=None):
+        """Turn identifying information into a key for resolve()."""
+        return (sort_name or None, lc or None, viaf or None)
+
+    def _known(self, key):
+        contributor = self._resolved.get(key)
+        # A Contributor created in a transaction that was later
+        # rolled back is no longer in the session.
+        return contributor is not None and contributor in self._db
+
+    def resolve(self, keys):
+        """Find or create a Contributor for each key.
+
+        :param keys: A list of keys as returned by key(). Missing
+            Contributors are created in the order of this list.
+        """
+        keys = [self.key(*key) for key in keys]
+        unknown = []
+        for key in keys:
+            if any(key) and not self._known(key) and key not in unknown:
+                unknown.append(key)
+        if not unknown:
+            return
+
+        # Contributors identified only by name.
+        names = set(sort_name for sort_name, lc, viaf in unknown
+                    if not lc and not viaf)
+        if names:
+            qu = self._db.query(Contributor).filter(
+                Contributor.sort_name.in_(names)
+            ).order_by(Contributor.id)
+            for contributor in qu:
+                key = self.key(contributor.sort_name)
+                if not self._known(key):
+                    self._resolved[key] = contributor
+
+        # Contributors identified by LC or VIAF number.
+        by_lc = defaultdict(list)
+        by_viaf = defaultdict(list)
+        lcs = set(lc for sort_name, lc, viaf in unknown if lc)
+        viafs = set(viaf for sort_name, lc, viaf in unknown if viaf)
+        clauses = []
+        if lcs:
+            clauses.append(Contributor.lc.in_(lcs))
+        if viafs:
+            clauses.append(Contributor.viaf.in_(viafs))
+        if clauses:
+            qu = self._db.query(Contributor).filter(
+                or_(*clauses)
+            ).order_by(Contributor.id)
+            for contributor in qu:
+                self._index(contributor, by_lc, by_viaf)
+
+        created = False
+        for key in unknown:
+            if self._known(key):
+                continue
+            sort_name, lc, viaf = key
+            contributor = None
+            if lc or viaf:
+                candidates = by_lc[lc] if lc else by_viaf[viaf]
+                for candidate in candidates:
+                    if ((not lc or candidate.lc == lc)
+                        and (not viaf or candidate.viaf == viaf)):
+                        contributor = candidate
+                        break
+            if not contributor:
+                contributor = Contributor(
+                    sort_name=sort_name, lc=lc, viaf=viaf, extra=dict()
+                )
+                self._db.add(contributor)
+                self._index(contributor, by_lc, by_viaf)
+                created = True
+            self._resolved[key] = contributor
+
+        if created:
+            flush(self._db)
+
+    def _index(self, contributor, by_lc, by_viaf):
+        if contributor.lc:
+            by_lc[contributor.lc].append(contributor)
+        if contributor.viaf:
+            by_viaf[contributor.viaf].append(contributor)
+
+    def lookup(self, sort_name=None, lc=None, viaf=None):
+        """Find or create a single Contributor.
+
+        :return: A Contributor, or None if there's no identifying
+            information.
+        """
+        key = self.key(sort_name, lc, viaf)
+        if not any(key):
+            return None
+        if not self._known(key):
+            self.resolve([key])
+        return self._resolved[key]
+
+    def add_contributions(self, edition, contributions):
+        """Give an Edition a number of Contributions with a single
+        INSERT statement.
+
+        :param contributions: A list of (Contributor, role) 2-tuples.
+        """
+        # Contributions deleted from the Edition, and new Contributors,
+        # need to be in the database first.
+        flush(self._db)
+        rows = sorted(set(
+            (contributor.id, role) for contributor, role in contributions
+        ))
+        if rows:
+            self._db.execute(
+                insert(Contribution.__table__).values([
+                    dict(edition_id=edition.id, contributor_id=contributor_id,
+                         role=role)
+                    for contributor_id, role in rows
+                ]).on_conflict_do_nothing()
+            )
+
+        # The new Contributions were added behind the ORM's back.
+        self._db.expire(edition, ['contributions'])
+        for contributor in set(c for c, role in contributions):
+            self._db.expire(contributor, ['contributions'])
+
+
+class SortNameMemo(Base):
+    """Remembers the sort name that was found for a display name.
+
+    Finding a sort name can mean a database query or a call to the
+    metadata wrangler's canonicalizer, and the same authors show up
+    over and over again in large feeds.
+    """
+    __tablename__ = 'sortnamememos'
+    id = Column(Integer, primary_key=True)
+    display_name = Column(Unicode, nullable=False, unique=True)
+    sort_name = Column(Unicode, nullable=False)
+
+    # Where the sort name came from.
+    EXISTING_CONTRIBUTOR = u'contributor'
+    CANONICALIZER = u'canonicalizer'
+    GUESS = u'guess'
+    source = Column(Unicode, nullable=False)
+
+    # Whether the canonicalizer was asked about this display name. A
+    # guess made without asking it isn't good enough once a
+    # canonicalizer is available.
+    asked_canonicalizer = Column(Boolean, nullable=False, default=False)
+
+    # Memos this process has looked up or created recently, as
+    # (sort_name, source, asked_canonicalizer), keyed by display name.
+    # Memos are forgotten when a Contributor they might have come from
+    # changes its name (see listeners.py).
+    _cache = LRUCache(100000)
+
+    @classmethod
+    def reset_cache(cls):
+        cls._cache.clear()
+
+    @classmethod
+    def lookup(cls, _db, display_name, canonicalizer_available=False):
+        """Find the sort name remembered for a display name.
+
+        :param canonicalizer_available: Whether the caller could ask
+            the canonicalizer if nothing suitable is remembered.
+        :return: A sort name, or None.
+        """
+        value = cls._cache.get(display_name)
+        if value is None:
+            # remember() writes around the ORM, so an instance in the
+            # session may be out of date.
+            with _db.no_autoflush:
+                memo = _db.query(cls).filter(
+                    cls.display_name==display_name
+                ).populate_existing().first()
+            if not memo:
+                return None
+            value = (memo.sort_name, memo.source, memo.asked_canonicalizer)
+            cls._cache.set(display_name, value)
+
+        sort_name, source, asked_canonicalizer = value
+        if (canonicalizer_available and source == cls.GUESS
+            and not asked_canonicalizer):
+            return None
+        return sort_name
+
+    @classmethod
+    def remember(cls, _db, display_name, sort_name, source,
+                 asked_canonicalizer=False):
+        """Remember the sort name found for a display name, replacing
+        anything previously remembered.
+        """
+        if not display_name or not sort_name:
+            return
+        values = dict(
+            sort_name=sort_name, source=source,
+            asked_canonicalizer=asked_canonicalizer
+        )
+        _db.execute(
+            insert(cls.__table__).values(
+                display_name=display_name, **values
+            ).on_conflict_do_update(
+                index_elements=[cls.display_name], set_=values
+            )
+        )
+        cls._cache.set(
+            display_name, (sort_name, source, asked_canonicalizer)
+        )
+
+    @classmethod
+    def forget(cls, connection, display_names=(), sort_names=()):
+        """Forget every memo for one of the given display names, or
+        that found one of the given sort names.
+        """
+        display_names = set(x for x in display_names if x)
+        sort_names = set(x for x in sort_names if x)
+        clauses = []
+        if display_names:
+            clauses.append(cls.display_name.in_(display_names))
+        if sort_names:
+            clauses.append(cls.sort_name.in_(sort_names))
+        if not clauses:
+            return
+        connection.execute(cls.__table__.delete().where(or_(*clauses)))
+        for display_name, value in cls._cache.items():
+            if display_name in display_names or value[0] in sort_names:
+                cls._cache.discard(display_name)
@@ -27,6 +27,7 @@ from licensing import (
 )
 
 from collections import defaultdict
+from hashlib import md5
 import logging
 from sqlalchemy import (
     Column,
@@ -99,6 +100,10 @@ class Edition(Base, EditionConstants):
     # group together different editions of the same work.
     permanent_work_id = Column(String(36), index=True)
 
+    # A hash of the title, author and medium that permanent_work_id
+    # was calculated from.
+    permanent_work_id_input_hash = Column(String(32))
+
     # A string depiction of the authors' names.
     author = Column(Unicode, index=True)
     sort_author = Column(Unicode, index=True)
@@ -133,6 +138,11 @@ class Edition(Base, EditionConstants):
     # would be relevant to display to a library patron.
     simple_opds_entry = Column(Unicode, default=None)
 
+    # A hash of the Metadata most recently imported into this
+    # Edition. If the same Metadata shows up again, there's no need
+    # to apply it.
+    metadata_hash = Column(String(64), default=None)
+
     # Information kept in here probably won't be used.
     extra = Column(MutableDict.as_mutable(JSON), default={})
 
@@ -582,23 +592,35 @@ class Edition(Base, EditionConstants):
             author = self.sort_author or self.author
         return author
 
-    def calculate_permanent_work_id(self, debug=False):
+    def calculate_permanent_work_id(self, debug=False, only_if_changed=False):
+        """Calculate this Edition's permanent work ID.
+
+        :param only_if_changed: Don't recalculate the ID if the title,
+            author and medium haven't changed since the last time it
+            was calculated.
+        """
         title = self.title_for_permanent_work_id
         medium = self.medium_for_permanent_work_id.get(self.medium, None)
+        author = None
+        if title and medium:
+            author = self.author_for_permanent_work_id
+
+        input_hash = self._permanent_work_id_input_hash(title, author, medium)
+        if only_if_changed and input_hash == self.permanent_work_id_input_hash:
+            return
+        self.permanent_work_id_input_hash = input_hash
+
         if not title or not medium:
             # If a book has no title or medium, it has no permanent work ID.
             self.permanent_work_id = None
             return
 
-        author = self.author_for_permanent_work_id
-
         w = WorkIDCalculator
         norm_title = w.normalize_title(title)
         norm_author = w.normalize_author(author)
 
         old_id = self.permanent_work_id
-        self.permanent_work_id = self.calculate_permanent_work_id_for_title_and_author(
-            title, author, medium)
+        self.permanent_work_id = w.permanent_id(norm_title, norm_author, medium)
         args = (
             "Permanent work ID for %d: %s/%s -> %s/%s/%s -> %s (was %s)",
             self.id, title, author, norm_title, norm_author, medium,
@@ -609,6 +631,15 @@ class Edition(Base, EditionConstants):
         elif old_id != self.permanent_work_id:
             logging.info(*args)
 
+    @classmethod
+    def _permanent_work_id_input_hash(cls, title, author, medium):
+        digest = md5()
+        for value in (title, author, medium):
+            if isinstance(value, unicode):
+                value = value.encode("utf8")
+            digest.update((value or '') + '\0')
+        return digest.hexdigest()
+
     @classmethod
     def calculate_permanent_work_id_for_title_and_author(
             cls, title, author, medium):
@@ -783,3 +814,6 @@ class Edition(Base, EditionConstants):
         )
 
 Index("ix_editions_data_source_id_identifier_id", Edition.data_source_id, Edition.primary_identifier_id, unique=True)
+
+# If the pg_trgm extension is available, there's also a trigram index
+# on Edition.title. See SessionManager.TRIGRAM_INDEXES.
@@ -25,7 +25,9 @@ from sqlalchemy import (
     String,
     UniqueConstraint,
     func,
+    text,
 )
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import joinedload, relationship
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 from sqlalchemy.orm.session import Session
@@ -34,7 +36,14 @@ from sqlalchemy.sql.expression import and_, or_
 
 from ..util.string_helpers import native_string
 from ..util.summary import SummaryEvaluator
-from . import Base, PresentationCalculationPolicy, create, get_one, get_one_or_create
+from . import (
+    Base,
+    PresentationCalculationPolicy,
+    create,
+    flush,
+    get_one,
+    get_one_or_create,
+)
 
 
 @six.add_metaclass(ABCMeta)
@@ -357,9 +366,14 @@ class Identifier(Base, IdentifierConstants):
             new_identifiers_details.add(details)
 
         # Insert new identifiers into the database, then add them to the
-        # results.
+        # results. Any that were created in the meantime by some other
+        # process will be picked up along with the rest.
         if new_identifiers:
-            _db.bulk_insert_mappings(cls, new_identifiers)
+            _db.execute(
+                insert(cls.__table__).values(
+                    new_identifiers
+                ).on_conflict_do_nothing()
+            )
             _db.commit()
         find_existing_identifiers(identifier_details.values())
 
@@ -474,7 +488,8 @@ class Identifier(Base, IdentifierConstants):
         `identifier_id_column` can be a single Identifier ID, or a column
         like `Edition.primary_identifier_id` if the query will be used as
         a subquery.
-        This uses the function defined in files/recursive_equivalents.sql.
+        This uses RecursiveEquivalencyCache if it covers `policy`, and
+        the function defined in files/recursive_equivalents.sql if not.
         """
         fn = cls._recursively_equivalent_identifier_ids_query(
             identifier_id_column, policy
@@ -486,6 +501,10 @@ class Identifier(Base, IdentifierConstants):
         cls, identifier_id_column, policy=None
     ):
         policy = policy or PresentationCalculationPolicy()
+        if RecursiveEquivalencyCache.covers(policy):
+            return RecursiveEquivalencyCache.equivalents_query(
+                identifier_id_column
+            )
         levels = policy.equivalent_identifier_levels
         threshold = policy.equivalent_identifier_threshold
         cutoff = policy.equivalent_identifier_cutoff
@@ -499,7 +518,8 @@ class Identifier(Base, IdentifierConstants):
             cls, _db, identifier_ids, policy=None):
         """All Identifier IDs equivalent to the given set of Identifier
         IDs at the given confidence threshold.
-        This uses the function defined in files/recursive_equivalents.sql.
+        This uses RecursiveEquivalencyCache if it covers `policy`, and
+        the function defined in files/recursive_equivalents.sql if not.
         Four levels is enough to go from a Gutenberg text to an ISBN.
         Gutenberg ID -> OCLC Work IS -> OCLC Number -> ISBN
         Returns a dictionary mapping each ID in the original to a
@@ -509,6 +529,8 @@ class Identifier(Base, IdentifierConstants):
            how you've chosen to make the tradeoff between performance,
            data quality, and sheer number of equivalent identifiers.
         """
+        if RecursiveEquivalencyCache.covers(policy):
+            return RecursiveEquivalencyCache.equivalents(_db, identifier_ids)
         fn = cls._recursively_equivalent_identifier_ids_query(
             Identifier.id, policy
         )
@@ -666,6 +688,78 @@ class Identifier(Base, IdentifierConstants):
         classification.weight = weight
         return classification
 
+    def classify_many(self, data_source, subjects, replace=False):
+        """Classify this Identifier under a number of Subjects at once.
+
+        This has the same effect as calling classify() on each
+        subject, but it takes the same number of queries no matter
+        how many subjects there are.
+
+        :param data_source: The DataSource doing the classifying.
+        :param subjects: A list of SubjectData objects.
+        :param replace: If this is True, classifications by
+            `data_source` that don't correspond to any of `subjects`
+            are deleted.
+        :return: True if any classifications were added, deleted, or
+            given a new weight.
+        """
+        _db = Session.object_session(self)
+        flush(_db)
+        found = Subject.lookup_many(
+            _db, [(x.type, x.identifier, x.name) for x in subjects]
+        )
+
+        # If a subject shows up more than once, the last weight wins,
+        # as it would if classify() were called on each one.
+        weights = dict()
+        for subject_data in subjects:
+            subject = found[
+                (subject_data.type, subject_data.identifier, subject_data.name)
+            ]
+            weights[subject.id] = subject_data.weight
+
+        existing = dict()
+        stale = []
+        for classification in self.classifications:
+            if classification.data_source != data_source:
+                continue
+            if classification.subject_id in weights:
+                existing[classification.subject_id] = classification
+            elif replace:
+                stale.append(classification)
+
+        if stale:
+            _db.query(Classification).filter(
+                Classification.id.in_([x.id for x in stale])
+            ).delete(synchronize_session=False)
+
+        rows = [
+            dict(identifier_id=self.id, subject_id=subject_id,
+                 data_source_id=data_source.id, weight=weight)
+            for subject_id, weight in weights.items()
+            if subject_id not in existing
+            or existing[subject_id].weight != weight
+        ]
+        if rows:
+            statement = insert(Classification.__table__).values(rows)
+            statement = statement.on_conflict_do_update(
+                index_elements=['identifier_id', 'subject_id', 'data_source_id'],
+                set_=dict(weight=statement.excluded.weight)
+            )
+            _db.execute(statement)
+
+        if not stale and not rows:
+            return False
+
+        # The database was changed behind the ORM's back, so bring the
+        # ORM up to date.
+        _db.expire(self, ['classifications'])
+        for classification in stale:
+            _db.expunge(classification)
+        for classification in existing.values():
+            _db.expire(classification, ['weight'])
+        return True
+
     @classmethod
     def resources_for_identifier_ids(self, _db, identifier_ids, rel=None,
                                      data_source=None):
@@ -688,7 +782,10 @@ class Identifier(Base, IdentifierConstants):
     def classifications_for_identifier_ids(self, _db, identifier_ids):
         classifications = _db.query(Classification).filter(
                 Classification.identifier_id.in_(identifier_ids))
-        return classifications.options(joinedload('subject'))
+        # Order matters to WorkClassifier, so make it predictable.
+        return classifications.options(joinedload('subject')).order_by(
+            Classification.id
+        )
 
     @classmethod
     def best_cover_for(cls, _db, identifier_ids, rel=None):
@@ -866,6 +963,103 @@ class Identifier(Base, IdentifierConstants):
         return (self.type, self.identifier) < (other.type, other.identifier)
 
 
+class IdentifierResolver(object):
+    """Turn URNs into Identifiers, remembering the answers.
+
+    The URNs that are going to come up during some job (e.g. every
+    URN in an OPDS feed) can be resolved up front, with a single
+    Identifier.parse_urns call. After that, identifier_for() can
+    answer questions about those URNs without going to the database.
+    """
+
+    def __init__(self, _db):
+        self._db = _db
+
+        # Maps URNs, as they were passed in, to Identifiers.
+        self.identifiers = dict()
+
+        # URNs that can't be turned into Identifiers.
+        self.failures = set()
+
+    @classmethod
+    def type_and_identifier(cls, urn):
+        """Find the Identifier type and identifier designated by a URN,
+        without going to the database.
+
+        :return: A 2-tuple (type, identifier).
+        :raise ValueError: If the URN doesn't designate a valid
+            Identifier.
+        """
+        type, identifier = Identifier.prepare_foreign_type_and_identifier(
+            *Identifier.type_and_identifier_for_urn(urn)
+        )
+        if not type or not identifier:
+            raise ValueError("Could not turn %s into an identifier." % urn)
+        return type, identifier
+
+    def resolve(self, urns, autocreate=True):
+        """Turn a batch of URNs into Identifiers.
+
+        :param urns: A list of URNs. Any that have been resolved
+            before are answered from memory.
+        :param autocreate: Create Identifiers for URNs that don't
+            have one yet.
+        :return: A 2-tuple (identifiers_by_urn, failures).
+            Unlike with Identifier.parse_urns, `identifiers_by_urn` is
+            keyed by the URNs that were passed in, not by the
+            Identifiers' canonical URNs. `failures` is a list of URNs
+            that did not become Identifiers.
+        """
+        details_by_urn = dict()
+        for urn in set(urns):
+            if urn in self.identifiers or urn in self.failures:
+                continue
+            try:
+                details_by_urn[urn] = self.type_and_identifier(urn)
+            except ValueError, e:
+                self.failures.add(urn)
+
+        if details_by_urn:
+            identifiers_by_canonical_urn, ignore = Identifier.parse_urns(
+                self._db, details_by_urn.keys(), autocreate=autocreate
+            )
+            by_details = dict(
+                ((x.type, x.identifier), x)
+                for x in identifiers_by_canonical_urn.values()
+            )
+            for urn, details in details_by_urn.items():
+                if details in by_details:
+                    identifier = by_details[details]
+                    self.identifiers[urn] = identifier
+                    # The canonical URN will probably be used to look
+                    # this Identifier up later on.
+                    self.identifiers[identifier.urn] = identifier
+
+        identifiers_by_urn = dict()
+        failures = []
+        for urn in urns:
+            if urn in self.identifiers:
+                identifiers_by_urn[urn] = self.identifiers[urn]
+            else:
+                failures.append(urn)
+        return identifiers_by_urn, failures
+
+    def identifier_for(self, urn, autocreate=True):
+        """Turn a URN into an Identifier, using the answer from an
+        earlier resolve() call if there is one.
+
+        :return: An Identifier, or None if `autocreate` is False and
+            there's no Identifier for the URN.
+        :raise ValueError: If the URN can't be turned into an
+            Identifier.
+        """
+        if urn not in self.identifiers:
+            self.resolve([urn], autocreate=autocreate)
+        if urn in self.failures:
+            raise ValueError("Could not turn %s into an identifier." % urn)
+        return self.identifiers.get(urn)
+
+
 class Equivalency(Base):
     """An assertion that two Identifiers identify the same work.
     This assertion comes with a 'strength' which represents how confident
@@ -922,3 +1116,194 @@ class Equivalency(Base):
         if exclude_ids:
             q = q.filter(~Equivalency.id.in_(exclude_ids))
         return q
+
+
+class RecursiveEquivalencyCache(Base):
+    """The transitive closure of the Equivalency graph, as calculated
+    by fn_recursive_equivalents under the default
+    PresentationCalculationPolicy.
+
+    Each row says that `identifier_id` is one of the identifiers
+    recursively equivalent to `parent_identifier_id`. An Identifier
+    is always equivalent to itself, but that isn't stored.
+
+    The rows are kept up to date whenever an Equivalency is created,
+    changed or deleted through the ORM (see listeners.py), so looking
+    up an identifier's equivalents is a single indexed query instead
+    of a recursive one.
+    """
+    __tablename__ = 'recursiveequivalentscache'
+
+    parent_identifier_id = Column(
+        Integer, ForeignKey('identifiers.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    identifier_id = Column(
+        Integer, ForeignKey('identifiers.id', ondelete='CASCADE'),
+        primary_key=True, index=True
+    )
+
+    # The closure is only materialized for these settings.
+    LEVELS = PresentationCalculationPolicy.DEFAULT_LEVELS
+    THRESHOLD = PresentationCalculationPolicy.DEFAULT_THRESHOLD
+    CUTOFF = PresentationCalculationPolicy.DEFAULT_CUTOFF
+
+    # Equivalency fields that can change the closure.
+    RELEVANT_FIELDS = ['input_id', 'output_id', 'strength', 'enabled']
+
+    REFRESH_SQL = text(
+        "DELETE FROM recursiveequivalentscache"
+        " WHERE parent_identifier_id = ANY(:ids);"
+        " INSERT INTO recursiveequivalentscache"
+        " (parent_identifier_id, identifier_id)"
+        " SELECT p.id, e.id"
+        " FROM unnest(CAST(:ids AS INTEGER[])) AS p(id),"
+        " LATERAL fn_recursive_equivalents("
+        "p.id, :levels, :threshold, :cutoff) AS e(id)"
+        " WHERE e.id != p.id"
+    )
+
+    # A transaction that changes the closure of an identifier holds
+    # an advisory lock on that identifier until it ends. Otherwise
+    # two transactions could each refresh the closure without seeing
+    # the other's new Equivalency, and an identifier that reaches
+    # both would miss some equivalents. The locks are taken in order
+    # of ID, so two transactions can't each wait for the other.
+    LOCK_KEY = 1121
+
+    LOCK_SQL = text(
+        "SELECT pg_advisory_xact_lock(:key, ids.id)"
+        " FROM (SELECT DISTINCT unnest(CAST(:ids AS INTEGER[])) AS id"
+        " ORDER BY id) AS ids"
+    )
+
+    LOCK_TABLE_SQL = text(
+        "LOCK TABLE recursiveequivalentscache IN EXCLUSIVE MODE"
+    )
+
+    @classmethod
+    def covers(cls, policy):
+        """Can equivalents found under `policy` be looked up in the
+        cache?
+        """
+        policy = policy or PresentationCalculationPolicy()
+        return (policy.equivalent_identifier_levels == cls.LEVELS
+                and policy.equivalent_identifier_threshold == cls.THRESHOLD
+                and policy.equivalent_identifier_cutoff == cls.CUTOFF)
+
+    @classmethod
+    def equivalents_query(cls, identifier_id_column):
+        """A SQL expression that returns `identifier_id_column`
+        along with all of its cached equivalents, one per row.
+
+        This can be used in place of a call to fn_recursive_equivalents.
+        """
+        cached = select(
+            [func.array_agg(cls.identifier_id)]
+        ).where(
+            cls.parent_identifier_id==identifier_id_column
+        ).as_scalar()
+        # array_append() treats a NULL array as empty.
+        return func.unnest(func.array_append(cached, identifier_id_column))
+
+    @classmethod
+    def equivalents(cls, _db, identifier_ids):
+        """Look up the cached equivalents of some Identifier IDs.
+
+        :return: A dictionary mapping each ID to a list of its
+            equivalent IDs, including itself.
+        """
+        identifier_ids = set(identifier_ids)
+        equivalents = defaultdict(list)
+        for identifier_id in identifier_ids:
+            equivalents[identifier_id].append(identifier_id)
+        if not identifier_ids:
+            return equivalents
+        query = select(
+            [cls.parent_identifier_id, cls.identifier_id]
+        ).where(
+            cls.parent_identifier_id.in_(identifier_ids)
+        )
+        for parent_id, identifier_id in _db.execute(query):
+            equivalents[parent_id].append(identifier_id)
+        return equivalents
+
+    @classmethod
+    def lock(cls, connection, identifier_ids):
+        """Wait until no other transaction is changing the closure of
+        any of `identifier_ids`, and keep it that way until this
+        transaction ends.
+
+        Once the locks are acquired, later statements see everything
+        committed by the transactions that held them before.
+        """
+        identifier_ids = sorted(set(identifier_ids))
+        if identifier_ids:
+            connection.execute(
+                cls.LOCK_SQL, dict(key=cls.LOCK_KEY, ids=identifier_ids)
+            )
+
+    @classmethod
+    def affected_by(cls, connection, identifier_ids):
+        """Find every Identifier ID whose closure might change if an
+        Equivalency touching `identifier_ids` were to change.
+
+        That's the identifiers themselves, and every identifier that
+        currently reaches any of them.
+        """
+        affected = set(identifier_ids)
+        affected.discard(None)
+        if affected:
+            query = select(
+                [cls.parent_identifier_id]
+            ).where(
+                cls.identifier_id.in_(affected)
+            )
+            affected.update(row[0] for row in connection.execute(query))
+        return affected
+
+    @classmethod
+    def refresh(cls, connection, identifier_ids):
+        """Recalculate the closure of some Identifier IDs from the
+        current contents of the equivalents table.
+        """
+        identifier_ids = sorted(set(identifier_ids))
+        if not identifier_ids:
+            return
+        connection.execute(
+            cls.REFRESH_SQL, dict(
+                ids=identifier_ids, levels=cls.LEVELS,
+                threshold=cls.THRESHOLD, cutoff=cls.CUTOFF
+            )
+        )
+
+    @classmethod
+    def equivalency_changed(cls, connection, equivalency, old_ids=()):
+        """Bring the cache up to date after a change to `equivalency`.
+
+        :param old_ids: Identifier IDs `equivalency` used to connect,
+            if it was changed to connect different identifiers.
+        """
+        ids = [equivalency.input_id, equivalency.output_id] + list(old_ids)
+        locked = set()
+        affected = cls.affected_by(connection, ids)
+        while not affected.issubset(locked):
+            cls.lock(connection, affected - locked)
+            locked.update(affected)
+            # While we were waiting, another transaction may have
+            # connected more identifiers to these ones.
+            affected = cls.affected_by(connection, ids)
+        cls.refresh(connection, affected)
+
+    @classmethod
+    def rebuild(cls, _db):
+        """Recalculate the entire cache."""
+        # Keep out every transaction that would change the cache
+        # until the new one is in place.
+        _db.execute(cls.LOCK_TABLE_SQL)
+        _db.execute(cls.__table__.delete())
+        query = select([Equivalency.input_id]).union(
+            select([Equivalency.output_id])
+        )
+        ids = [row[0] for row in _db.execute(query) if row[0] is not None]
+        cls.refresh(_db, ids)
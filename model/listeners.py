@@ -3,6 +3,7 @@ from nose.tools import set_trace
 import datetime
 from sqlalchemy import (
     event,
+    inspect,
     text,
 )
 from sqlalchemy.orm.base import NO_VALUE
@@ -14,8 +15,16 @@ from admin import (
     Admin,
     AdminRole,
 )
+from contributor import (
+    Contributor,
+    SortNameMemo,
+)
 from datasource import DataSource
 from classification import Genre
+from identifier import (
+    Equivalency,
+    RecursiveEquivalencyCache,
+)
 from collection import Collection
 from ..config import Configuration
 from configuration import (
@@ -47,6 +56,11 @@ def site_configuration_has_changed(_db, cooldown=1):
         number of seconds since the last site configuration change was
         recorded.
     """
+    # Whatever happens with the timestamp, this process's cached
+    # analytics providers may now be out of date.
+    from ..analytics import Analytics
+    Analytics.reset_registry()
+
     has_lock = site_configuration_has_changed_lock.acquire(blocking=False)
     if not has_lock:
         # Another thread is updating site configuration right now.
@@ -300,3 +314,43 @@ def last_update_time_change(target, value, oldvalue, initator):
     information changes.
     """
     target.external_index_needs_updating()
+
+# A remembered sort name may have come from a Contributor, so it's
+# forgotten when that Contributor's name changes.
+
+@event.listens_for(Contributor, 'after_update')
+def contributor_name_changed(mapper, connection, target):
+    state = inspect(target)
+    sort_name = state.attrs['_sort_name'].history
+    display_name = state.attrs['display_name'].history
+    if not sort_name.has_changes() and not display_name.has_changes():
+        return
+    SortNameMemo.forget(
+        connection,
+        display_names=list(display_name.deleted) + [target.display_name],
+        sort_names=list(sort_name.deleted),
+    )
+
+# Whenever the Equivalency graph changes, the cached closure of every
+# identifier near the change needs to be recalculated.
+
+@event.listens_for(Equivalency, 'after_insert')
+@event.listens_for(Equivalency, 'after_delete')
+def equivalency_added_or_removed(mapper, connection, target):
+    RecursiveEquivalencyCache.equivalency_changed(connection, target)
+
+@event.listens_for(Equivalency, 'after_update')
+def equivalency_changed(mapper, connection, target):
+    state = inspect(target)
+    old_ids = []
+    changed = False
+    for field in RecursiveEquivalencyCache.RELEVANT_FIELDS:
+        history = state.attrs[field].history
+        if history.has_changes():
+            changed = True
+            if field in ('input_id', 'output_id'):
+                old_ids.extend(history.deleted)
+    if changed:
+        RecursiveEquivalencyCache.equivalency_changed(
+            connection, target, old_ids
+        )
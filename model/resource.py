@@ -8,6 +8,7 @@ from . import (
     get_one_or_create,
 )
 from ..config import Configuration
+from blobstore import BlobStore
 from constants import (
     DataSourceConstants,
     IdentifierConstants,
@@ -38,6 +39,7 @@ from sqlalchemy import (
     Float,
     ForeignKey,
     Integer,
+    String,
     Unicode,
     UniqueConstraint,
 )
@@ -46,6 +48,7 @@ from sqlalchemy.ext.mutable import MutableDict
 from sqlalchemy.orm import (
     backref,
     relationship,
+    synonym,
 )
 from sqlalchemy.orm.session import Session
 from sqlalchemy.sql.expression import or_
@@ -559,14 +562,20 @@ class Representation(Base, MediaTypes):
     # The size of the representation, in bytes.
     file_size = Column(Integer)
 
+    # The SHA-256 hash of the representation, if it's kept in the
+    # BlobStore rather than in the database.
+    content_hash = Column(String(64), index=True)
+
     # If this representation is an image, the height of the image.
     image_height = Column(Integer, index=True)
 
     # If this representation is an image, the width of the image.
     image_width = Column(Integer, index=True)
 
-    # The content of the representation itself.
-    content = Column(Binary)
+    # The content of the representation itself, if it's kept in the
+    # database. Use the `content` property, which knows whether to
+    # look here or in the BlobStore.
+    _content = Column('content', Binary)
 
     # Instead of being stored in the database, the content of the
     # representation may be stored on a local file relative to the
@@ -589,6 +598,54 @@ class Representation(Base, MediaTypes):
     # BROWSER_USER_AGENT = "Mozilla/5.0 (Windows NT 6.3; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/37.0.2049.0 Safari/537.36 (Simplified)"
     BROWSER_USER_AGENT = "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:37.0) Gecko/20100101 Firefox/37.0"
 
+    def _get_content(self):
+        if self._content is not None or not self.content_hash:
+            return self._content
+
+        # Remember the content once it's been read from the store,
+        # so it can be used more than once.
+        cached = self.__dict__.get('_content_from_store')
+        if cached and cached[0] == self.content_hash:
+            return cached[1]
+
+        store = BlobStore.instance()
+        content = None
+        if store:
+            content = store.get(self.content_hash)
+        if content is None:
+            logging.error(
+                "Content %s for %s is missing from the blob store.",
+                self.content_hash, self.url
+            )
+        self.__dict__['_content_from_store'] = (self.content_hash, content)
+        return content
+
+    def _set_content(self, content):
+        store = BlobStore.instance()
+        if content is None or store is None:
+            self._content = content
+            self.content_hash = None
+        else:
+            if isinstance(content, unicode):
+                content = content.encode("utf8")
+            self.content_hash = store.put(content)
+            self._content = None
+            self.__dict__['_content_from_store'] = (self.content_hash, content)
+        self.file_size = len(content) if content is not None else None
+
+    content = synonym(
+        '_content', descriptor=property(_get_content, _set_content)
+    )
+
+    @property
+    def _has_content_bytes(self):
+        """Is there any content, either in the database or the
+        BlobStore? This doesn't actually load the content.
+        """
+        if self.content_hash:
+            return bool(self.file_size)
+        return bool(self._content)
+
     @property
     def age(self):
         if not self.fetched_at:
@@ -597,7 +654,9 @@ class Representation(Base, MediaTypes):
 
     @property
     def has_content(self):
-        if self.content and self.status_code == 200 and self.fetch_exception is None:
+        # A 304 status code means the content we got from an earlier
+        # request is still good.
+        if self._has_content_bytes and self.status_code in (200, 304) and self.fetch_exception is None:
             return True
         if self.local_content_path and os.path.exists(self.local_content_path) and self.fetch_exception is None:
             return True
@@ -625,7 +684,7 @@ class Representation(Base, MediaTypes):
         a status code that's not in the 5xx series.
         """
         if not self.fetch_exception and (
-            self.content or self.local_path or self.status_code
+            self._has_content_bytes or self.local_path or self.status_code
             and self.status_code // 100 != 5
         ):
             return True
@@ -826,11 +885,19 @@ class Representation(Base, MediaTypes):
             content = None
             media_type = None
 
+        # If we made a conditional request and the server says
+        # nothing has changed, the representation we have is still
+        # good. A 304 response usually doesn't say anything about the
+        # media type, so don't go looking for a different
+        # Representation based on what it says.
+        unchanged = (usable_representation and status_code == 304)
+
         # At this point we can create/fetch a Representation object if
         # we don't have one already, or if the URL or media type we
         # actually got from the server differs from what we thought
         # we had.
-        if (not usable_representation
+        if not unchanged and (
+            not usable_representation
             or media_type != representation.media_type
             or normalized_url != representation.url):
             representation, is_new = get_one_or_create(
@@ -847,9 +914,18 @@ class Representation(Base, MediaTypes):
         if status_code == 304:
             # The representation hasn't changed since we last checked.
             # Set its fetched_at property and return the cached
-            # version as though it were new.
+            # version as though it were new. The content is left
+            # alone.
             representation.fetched_at = fetched_at
             representation.status_code = status_code
+
+            # The server may have sent new validators to use next
+            # time.
+            for header, field in (
+                    ('etag', 'etag'),
+                    ('last-modified', 'last_modified')):
+                if headers and header in headers:
+                    setattr(representation, field, headers[header])
             return representation, False
 
         if status_code:
@@ -1284,11 +1360,19 @@ class Representation(Base, MediaTypes):
 
     def content_fh(self):
         """Return an open filehandle to the representation's contents.
-        This works whether the representation is kept in the database
-        or in a file on disk.
+        This works whether the representation is kept in the database,
+        in the BlobStore, or in a file on disk.
         """
-        if self.content:
-            return BytesIO(self.content)
+        if self._content:
+            return BytesIO(self._content)
+        elif self.content_hash and self.file_size:
+            store = BlobStore.instance()
+            fh = store and store.open(self.content_hash)
+            if not fh:
+                raise ValueError(
+                    "Content %s is missing from the blob store." % self.content_hash
+                )
+            return fh
         elif self.local_path:
             if not os.path.exists(self.local_path):
                 raise ValueError("%s does not exist." % self.local_path)
@@ -1301,7 +1385,7 @@ class Representation(Base, MediaTypes):
             raise ValueError(
                 "Cannot load non-image representation as image: type %s."
                 % self.media_type)
-        if not self.content and not self.local_path:
+        if not self._has_content_bytes and not self.local_path:
             raise ValueError("Image representation has no content.")
 
         fh = self.content_fh()
@@ -3,7 +3,10 @@
 
 import datetime
 import logging
-from collections import Counter
+from collections import (
+    Counter,
+    defaultdict,
+)
 
 from sqlalchemy import (
     Boolean,
@@ -21,7 +24,9 @@ from sqlalchemy.dialects.postgresql import INT4RANGE
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.orm import (
     contains_eager,
+    joinedload,
     relationship,
+    selectinload,
 )
 from sqlalchemy.orm.session import Session
 from sqlalchemy.sql.expression import (
@@ -86,6 +91,35 @@ class WorkGenre(Base):
         return "%s (%d%%)" % (self.genre.name, self.affinity*100)
 
 
+class PresentationCalculationStats(object):
+    """Keeps count of how often each step of presentation calculation,
+    and each product of a Work's presentation, was actually worked
+    on, and how often it was skipped because nothing it depends on
+    had changed.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.done = Counter()
+        self.skipped = Counter()
+
+    def record(self, name, done):
+        if done:
+            self.done[name] += 1
+        else:
+            self.skipped[name] += 1
+
+    def __repr__(self):
+        names = sorted(set(self.done.keys() + self.skipped.keys()))
+        return ", ".join(
+            "%s: %d done, %d skipped" % (
+                name, self.done[name], self.skipped[name]
+            ) for name in names
+        )
+
+
 class Work(Base):
     APPEALS_URI = "http://librarysimplified.org/terms/appeals/"
 
@@ -100,6 +134,9 @@ class Work(Base):
     CURRENTLY_AVAILABLE = "currently_available"
     ALL = "all"
 
+    # Counts the work done, and avoided, by calculate_presentation().
+    presentation_calculation_stats = PresentationCalculationStats()
+
     # If no quality data is available for a work, it will be assigned
     # a default quality based on where we got it.
     #
@@ -919,6 +956,10 @@ class Work(Base):
             # for the work.
             return
 
+        stats = self.presentation_calculation_stats
+        for step in policy.STEPS:
+            stats.record(step, getattr(policy, step))
+
         if policy.choose_cover or policy.set_edition_metadata:
             cover_changed = self.presentation_edition.calculate_presentation(policy)
             edition_changed = edition_changed or cover_changed
@@ -997,13 +1038,21 @@ class Work(Base):
         else:
             new_summary_text = self.summary_text
 
-        changed = (
-            edition_changed or
-            classification_changed or
-            summary != self.summary or
-            summary_text != new_summary_text or
-            float(quality) != float(self.quality)
-        )
+        changed_parts = set()
+        if edition_changed:
+            changed_parts.add(policy.EDITION)
+        if classification_changed:
+            changed_parts.add(policy.CLASSIFICATION)
+        if summary != self.summary or summary_text != new_summary_text:
+            changed_parts.add(policy.SUMMARY)
+        if quality is None or self.quality is None:
+            # A brand-new Work has no quality yet.
+            quality_changed = quality is not self.quality
+        else:
+            quality_changed = float(quality) != float(self.quality)
+        if quality_changed:
+            changed_parts.add(policy.QUALITY)
+        changed = bool(changed_parts)
 
         if changed:
             # last_update_time tracks the last time the data actually
@@ -1011,14 +1060,7 @@ class Work(Base):
             # change it.
             self.last_update_time = datetime.datetime.utcnow()
 
-        if changed or policy.regenerate_opds_entries:
-            self.calculate_opds_entries()
-
-        if changed or policy.regenerate_marc_record:
-            self.calculate_marc_record()
-
-        if (changed or policy.update_search_index) and not exclude_search:
-            self.external_index_needs_updating()
+        self._regenerate_products(changed_parts, policy, exclude_search)
 
         # Now that everything's calculated, print it out.
         if policy.verbose:
@@ -1036,6 +1078,38 @@ class Work(Base):
         # title.
         self.set_presentation_ready_based_on_content()
 
+    def _regenerate_products(self, changed_parts, policy,
+                             exclude_search=False):
+        """Regenerate whatever depends on the parts of this Work's
+        presentation that changed.
+
+        :param changed_parts: A set of the parts of the presentation
+            that changed, e.g. PresentationCalculationPolicy.QUALITY.
+        :param policy: A PresentationCalculationPolicy, which may ask
+            for some things to be regenerated even if nothing changed.
+        :param exclude_search: If this is True, the search index
+            won't be told about the Work.
+        """
+        products = policy.products_to_regenerate(changed_parts)
+        if exclude_search:
+            products.discard(policy.SEARCH_DOCUMENT)
+
+        simple = policy.OPDS_ENTRY in products
+        verbose = policy.VERBOSE_OPDS_ENTRY in products
+        if simple or verbose:
+            self.calculate_opds_entries(verbose=verbose, simple=simple)
+
+        if policy.MARC_RECORD in products:
+            self.calculate_marc_record()
+
+        if policy.SEARCH_DOCUMENT in products:
+            self.external_index_needs_updating()
+
+        for product in policy.PRODUCTS:
+            self.presentation_calculation_stats.record(
+                product, product in products
+            )
+
     def _choose_summary(
         self, direct_identifier_ids, all_identifier_ids,
         licensed_data_sources
@@ -1145,16 +1219,17 @@ class Work(Base):
         l = [_ensure(s) for s in l]
         return u"\n".join(l)
 
-    def calculate_opds_entries(self, verbose=True):
+    def calculate_opds_entries(self, verbose=True, simple=True):
         from ..opds import (
             AcquisitionFeed,
             Annotator,
             VerboseAnnotator,
         )
         _db = Session.object_session(self)
-        simple = AcquisitionFeed.single_entry(
-            _db, self, Annotator, force_create=True
-        )
+        if simple is True:
+            simple = AcquisitionFeed.single_entry(
+                _db, self, Annotator, force_create=True
+            )
         if verbose is True:
             verbose = AcquisitionFeed.single_entry(
                 _db, self, VerboseAnnotator, force_create=True
@@ -1324,16 +1399,33 @@ class Work(Base):
         :return: A boolean explaining whether or not any data actually
         changed.
         """
+        _db = Session.object_session(self)
+        classifications = Identifier.classifications_for_identifier_ids(
+            _db, identifier_ids
+        )
+        return self.assign_genres_from_classifications(
+            classifications, default_fiction=default_fiction,
+            default_audience=default_audience
+        )
+
+    def assign_genres_from_classifications(
+        self, classifications, default_fiction=False,
+        default_audience=Classifier.AUDIENCE_ADULT, current_workgenres=None
+    ):
+        """Set classification information for this work based on a
+        list of Classifications.
+
+        :param current_workgenres: This Work's WorkGenres, if they've
+            already been loaded.
+        :return: A boolean explaining whether or not any data actually
+        changed.
+        """
         classifier = WorkClassifier(self)
 
         old_fiction = self.fiction
         old_audience = self.audience
         old_target_age = self.target_age
 
-        _db = Session.object_session(self)
-        classifications = Identifier.classifications_for_identifier_ids(
-            _db, identifier_ids
-        )
         for classification in classifications:
             classifier.add(classification)
 
@@ -1343,7 +1435,7 @@ class Work(Base):
         self.target_age = tuple_to_numericrange(target_age)
 
         workgenres, workgenres_changed = self.assign_genres_from_weights(
-            genre_weights
+            genre_weights, current_workgenres
         )
 
         classification_changed = (
@@ -1355,14 +1447,15 @@ class Work(Base):
 
         return classification_changed
 
-    def assign_genres_from_weights(self, genre_weights):
+    def assign_genres_from_weights(self, genre_weights, current_workgenres=None):
         # Assign WorkGenre objects to the remainder.
         from classification import Genre
         changed = False
         _db = Session.object_session(self)
         total_genre_weight = float(sum(genre_weights.values()))
         workgenres = []
-        current_workgenres = _db.query(WorkGenre).filter(WorkGenre.work==self)
+        if current_workgenres is None:
+            current_workgenres = _db.query(WorkGenre).filter(WorkGenre.work==self)
         by_genre = dict()
         for wg in current_workgenres:
             by_genre[wg.genre] = wg
@@ -1393,6 +1486,101 @@ class Work(Base):
 
         return workgenres, changed
 
+    @classmethod
+    def classify_in_bulk(cls, _db, works, policy=None):
+        """Reclassify a batch of Works.
+
+        This has the same effect as calling calculate_presentation()
+        on each Work with a policy that only classifies. But
+        everything needed to classify the whole batch is loaded up
+        front, with a fixed number of queries, instead of with
+        several queries per Work.
+
+        :param policy: A PresentationCalculationPolicy. It's used to
+            find equivalent identifiers, and to decide whether to
+            regenerate OPDS entries, MARC records and search index
+            entries for Works whose classification didn't change.
+        """
+        from licensing import LicensePool
+        if not works:
+            return
+        policy = policy or PresentationCalculationPolicy()
+        work_ids = [work.id for work in works]
+
+        # Load every Work's LicensePools, their Collections (which
+        # supply the default audience), and presentation Editions.
+        _db.query(Work).filter(Work.id.in_(work_ids)).options(
+            selectinload(Work.license_pools).joinedload(LicensePool.collection),
+            joinedload(Work.presentation_edition),
+        ).all()
+
+        # Find the equivalent identifiers for all the Works at once.
+        direct_identifier_ids = dict(
+            (work, work._direct_identifier_ids) for work in works
+        )
+        equivalents = Identifier.recursively_equivalent_identifier_ids(
+            _db,
+            [id for ids in direct_identifier_ids.values() for id in ids],
+            policy=policy
+        )
+        all_identifier_ids = dict()
+        for work, ids in direct_identifier_ids.items():
+            all_identifier_ids[work] = set()
+            for id in ids:
+                all_identifier_ids[work].update(equivalents.get(id, []))
+
+        # Then all their classifications.
+        classifications = defaultdict(list)
+        identifier_ids = set()
+        for ids in all_identifier_ids.values():
+            identifier_ids.update(ids)
+        if identifier_ids:
+            for classification in Identifier.classifications_for_identifier_ids(
+                _db, list(identifier_ids)
+            ):
+                classifications[classification.identifier_id].append(
+                    classification
+                )
+
+        # And their current WorkGenres.
+        workgenres = defaultdict(list)
+        for wg in _db.query(WorkGenre).filter(WorkGenre.work_id.in_(work_ids)):
+            workgenres[wg.work_id].append(wg)
+
+        now = datetime.datetime.utcnow()
+        classified = []
+        for work in works:
+            if not work.presentation_edition:
+                # calculate_presentation() gives up on these Works.
+                continue
+
+            # Consider the classifications in the same order
+            # assign_genres() would.
+            work_classifications = sorted(
+                [c for id in all_identifier_ids[work]
+                 for c in classifications[id]],
+                key=lambda c: c.id
+            )
+            changed = work.assign_genres_from_classifications(
+                work_classifications,
+                default_fiction=None,
+                default_audience=work._get_default_audience(),
+                current_workgenres=workgenres[work.id]
+            )
+            classified.append(work)
+            cls.presentation_calculation_stats.record('classify', True)
+
+            changed_parts = set()
+            if changed:
+                work.last_update_time = now
+                changed_parts.add(policy.CLASSIFICATION)
+            work._regenerate_products(changed_parts, policy)
+            work.set_presentation_ready_based_on_content()
+
+        WorkCoverageRecord.bulk_add(
+            classified, operation=WorkCoverageRecord.CLASSIFY_OPERATION
+        )
+
 
     def assign_appeals(self, character, language, setting, story,
                        cutoff=0.20):
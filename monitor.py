@@ -2,15 +2,20 @@ from nose.tools import set_trace
 import datetime
 import os
 import logging
+import re
 import time
 import traceback
-from sqlalchemy.orm import defer
+from sqlalchemy.orm import (
+    defer,
+    selectinload,
+)
 from sqlalchemy.sql import select
 from sqlalchemy.sql.functions import func
 from sqlalchemy.sql.expression import (
     or_,
     and_,
     outerjoin,
+    text,
 )
 
 import log # This sets the appropriate log format and level.
@@ -24,8 +29,10 @@ from model import (
     CirculationEvent,
     Collection,
     CollectionMissing,
+    Contribution,
     CoverageRecord,
     Credential,
+    DRMDeviceIdentifier,
     Edition,
     ExternalIntegration,
     CustomListEntry,
@@ -38,6 +45,7 @@ from model import (
     Work,
     WorkCoverageRecord,
 )
+from util.worker_pools import DatabaseJob
 
 
 class Monitor(object):
@@ -406,6 +414,22 @@ class SweepMonitor(CollectionMonitor):
         self.model_class = cls.MODEL_CLASS
         super(SweepMonitor, self).__init__(_db, collection=collection)
 
+        # If this is set, this Monitor only sweeps one SweepPartition
+        # of its table, as part of a partitioned sweep.
+        self.partition = None
+
+    def set_partition(self, partition):
+        """Restrict this Monitor to a single SweepPartition of its table.
+
+        Progress through the partition is tracked in a Timestamp of
+        its own, so that each partition of a partitioned sweep can be
+        checkpointed and resumed independently.
+
+        :param partition: A SweepPartition.
+        """
+        self.partition = partition
+        self.service_name = partition.service_name(self.SERVICE_NAME)
+
     def run_once(self, *ignore):
         timestamp = self.timestamp()
         offset = timestamp.counter
@@ -435,10 +459,10 @@ class SweepMonitor(CollectionMonitor):
             )
             achievements = "Records processed: %d." % total_processed
 
-            offset = new_offset
-            if offset == 0:
+            if new_offset == 0:
                 # We completed a sweep. We're done.
                 break
+            offset = new_offset
 
             # We need to do another batch. If it should raise an exception,
             # we don't want to lose the progress we've already made.
@@ -448,6 +472,16 @@ class SweepMonitor(CollectionMonitor):
             )
             self._db.commit()
 
+        if not self.partition:
+            # The sweep is complete, so the next run should start
+            # from the beginning of the table.
+            offset = 0
+
+        # A partition keeps its final position until every partition
+        # in the sweep has completed. That way a partition that
+        # finished before another one crashed won't be swept again
+        # when the sweep is resumed.
+
         # We're done with this run. The run() method will do the final
         # update.
         return TimestampData(counter=offset, achievements=achievements)
@@ -474,8 +508,10 @@ class SweepMonitor(CollectionMonitor):
 
     def fetch_batch(self, offset):
         """Retrieve one batch of work from the database."""
-        q = self.item_query().filter(self.model_class.id > offset).order_by(
-            self.model_class.id).limit(self.batch_size)
+        q = self.item_query().filter(self.model_class.id > offset)
+        if self.partition:
+            q = self.partition.scope(q, self.model_class.id)
+        q = q.order_by(self.model_class.id).limit(self.batch_size)
         return q
 
     def item_query(self):
@@ -505,6 +541,228 @@ class SweepMonitor(CollectionMonitor):
         """Do the work that needs to be done for a given item."""
         raise NotImplementedError()
 
+    def partition_timestamps(self):
+        """Find the Timestamps kept by the partitions of this Monitor's
+        partitioned sweep, if one is in progress.
+
+        :return: A query object.
+        """
+        prefix = SweepPartition.service_name_prefix(self.service_name)
+        return self._db.query(Timestamp).filter(
+            Timestamp.service.startswith(prefix, autoescape=True)
+        ).filter(
+            Timestamp.service_type==Timestamp.MONITOR_TYPE
+        ).filter(
+            Timestamp.collection_id==self.collection_id
+        )
+
+    def partitions(self, count):
+        """Divide this Monitor's table into ranges of IDs that can be
+        swept independently.
+
+        If a previous partitioned sweep was interrupted, the partitions
+        of that sweep are returned instead, so that the sweep can pick
+        up where each of its partitions left off.
+
+        A Timestamp is created for each new partition before any of
+        them are run. Otherwise, if the sweep was interrupted before a
+        partition got started, that partition would be left out when
+        the sweep was resumed.
+
+        :param count: Divide the table into this many partitions.
+        :return: A list of SweepPartition objects.
+        """
+        partitions = []
+        for timestamp in self.partition_timestamps():
+            partition = SweepPartition.from_service_name(
+                self.service_name, timestamp.service
+            )
+            if partition:
+                partitions.append(partition)
+        if partitions:
+            self.log.info(
+                "Resuming partitioned sweep with %d partition(s).",
+                len(partitions)
+            )
+            return sorted(partitions, key=lambda x: x.lower)
+
+        id_field = self.model_class.id
+        qu = self.item_query().order_by(None).with_entities(
+            func.min(id_field), func.max(id_field)
+        )
+        lower, upper = qu.one()
+        if lower is None:
+            # There's nothing in the table to be swept.
+            return []
+        partitions = SweepPartition.divide(lower, upper, count)
+        collection = self.collection
+        for partition in partitions:
+            get_one_or_create(
+                self._db, Timestamp,
+                service=partition.service_name(self.service_name),
+                service_type=Timestamp.MONITOR_TYPE,
+                collection=collection,
+                create_method_kwargs=dict(
+                    start=None, finish=None, counter=self.default_counter
+                )
+            )
+        return partitions
+
+    def finish_partitioned_sweep(self, partitions, started_at):
+        """Wrap up a partitioned sweep once every partition has been run.
+
+        If every partition completed its part of the sweep, the
+        partition Timestamps are deleted, so that the next partitioned
+        sweep will start from scratch, and this Monitor's own
+        Timestamp is updated. Otherwise the partition Timestamps are
+        left alone, so that the sweep can be resumed.
+
+        :param partitions: The SweepPartitions that were run.
+        :param started_at: The time the partitions started running.
+        :return: True if the sweep is complete, False otherwise.
+        """
+        timestamps = dict(
+            (x.service, x) for x in self.partition_timestamps()
+        )
+        incomplete = []
+        for partition in partitions:
+            timestamp = timestamps.get(
+                partition.service_name(self.service_name)
+            )
+            if (not timestamp or timestamp.exception
+                or not timestamp.start or timestamp.start < started_at):
+                incomplete.append(partition)
+        if incomplete:
+            self.log.warn(
+                "%d of %d partition(s) did not complete. The sweep will "
+                "resume from their checkpoints next time.",
+                len(incomplete), len(partitions)
+            )
+            return False
+
+        for timestamp in timestamps.values():
+            self._db.delete(timestamp)
+        progress = TimestampData(
+            counter=0,
+            achievements="Partitions swept: %d." % len(partitions)
+        )
+        progress.finalize(
+            service=self.service_name,
+            service_type=Timestamp.MONITOR_TYPE,
+            collection=self.collection,
+            start=started_at,
+            exception=None,
+        )
+        progress.apply(self._db)
+        self._db.commit()
+        return True
+
+
+class SweepPartition(object):
+    """A range of database IDs swept by one worker as part of a
+    partitioned sweep.
+
+    The range is encoded in the service name of the partition's
+    Timestamp. This means an interrupted sweep can always be resumed
+    with the same partitions, even if rows have been added to or
+    removed from the table in the meantime.
+    """
+
+    SERVICE_NAME_FORMAT = u"%s (ids %d-%d)"
+    SERVICE_NAME_PREFIX = u"%s (ids "
+    SERVICE_NAME_RE = re.compile(r" \(ids ([0-9]+)-([0-9]+)\)$")
+
+    def __init__(self, lower, upper):
+        """Constructor.
+
+        :param lower: The lowest ID in this partition.
+        :param upper: The highest ID in this partition.
+        """
+        self.lower = lower
+        self.upper = upper
+
+    def __repr__(self):
+        return "<SweepPartition %d-%d>" % (self.lower, self.upper)
+
+    def __eq__(self, other):
+        return (isinstance(other, SweepPartition)
+                and (self.lower, self.upper) == (other.lower, other.upper))
+
+    def __ne__(self, other):
+        return not self == other
+
+    @classmethod
+    def service_name_prefix(cls, base_service_name):
+        return cls.SERVICE_NAME_PREFIX % base_service_name
+
+    def service_name(self, base_service_name):
+        """The name under which this partition tracks its Timestamp."""
+        return self.SERVICE_NAME_FORMAT % (
+            base_service_name, self.lower, self.upper
+        )
+
+    @classmethod
+    def from_service_name(cls, base_service_name, service_name):
+        """Reconstruct a SweepPartition from the service name of its
+        Timestamp.
+
+        :return: A SweepPartition, or None if `service_name` is not the
+            name of a partition of `base_service_name`.
+        """
+        if not service_name.startswith(
+            cls.service_name_prefix(base_service_name)
+        ):
+            return None
+        match = cls.SERVICE_NAME_RE.search(service_name)
+        if not match:
+            return None
+        lower, upper = match.groups()
+        return cls(int(lower), int(upper))
+
+    @classmethod
+    def divide(cls, lower, upper, count):
+        """Divide the range of IDs from `lower` to `upper` (inclusive)
+        into `count` partitions of roughly equal size.
+
+        :return: A list of SweepPartitions.
+        """
+        count = max(1, min(count, upper - lower + 1))
+        size = (upper - lower + 1) / float(count)
+        partitions = []
+        for i in range(count):
+            partition_lower = lower + int(round(i * size))
+            partition_upper = lower + int(round((i+1) * size)) - 1
+            partitions.append(cls(partition_lower, partition_upper))
+        return partitions
+
+    def scope(self, qu, id_field):
+        """Restrict a query to items in this partition."""
+        return qu.filter(id_field >= self.lower).filter(id_field <= self.upper)
+
+
+class SweepPartitionJob(DatabaseJob):
+    """Run a SweepMonitor over one partition of its table, in a worker
+    thread with its own database session.
+    """
+
+    def __init__(self, monitor_class, collection, partition, **monitor_kwargs):
+        self.monitor_class = monitor_class
+        self.collection_id = None
+        if collection:
+            self.collection_id = collection.id
+        self.partition = partition
+        self.monitor_kwargs = monitor_kwargs
+
+    def do_run(self, _db):
+        collection = None
+        if self.collection_id:
+            collection = get_one(_db, Collection, id=self.collection_id)
+        monitor = self.monitor_class(
+            _db, collection=collection, **self.monitor_kwargs
+        )
+        monitor.set_partition(self.partition)
+        monitor.run()
+
 
 class IdentifierSweepMonitor(SweepMonitor):
     """A Monitor that does some work for every Identifier."""
@@ -640,8 +898,30 @@ class PermanentWorkIDRefreshMonitor(EditionSweepMonitor):
     """
     SERVICE_NAME = "Permanent work ID refresh"
 
+    def __init__(self, _db, collection=None, batch_size=None,
+                 only_changed=False):
+        """:param only_changed: Only recalculate the permanent work IDs
+        of Editions whose title, author or medium changed since their
+        IDs were last calculated. A full sweep is still needed after
+        the rules in WorkIDCalculator change.
+        """
+        super(PermanentWorkIDRefreshMonitor, self).__init__(
+            _db, collection=collection, batch_size=batch_size
+        )
+        self.only_changed = only_changed
+
+    def item_query(self):
+        # An Edition's author is found through its Contributions, so
+        # load them along with the Editions.
+        qu = super(PermanentWorkIDRefreshMonitor, self).item_query()
+        return qu.options(
+            selectinload(Edition.contributions).joinedload(
+                Contribution.contributor
+            )
+        )
+
     def process_item(self, edition):
-        edition.calculate_permanent_work_id()
+        edition.calculate_permanent_work_id(only_if_changed=self.only_changed)
 
 
 class MakePresentationReadyMonitor(NotPresentationReadyWorkSweepMonitor):
@@ -758,6 +1038,12 @@ class ReaperMonitor(Monitor):
     * BATCH_SIZE - The number of rows to fetch for deletion in a single
     batch. The default is 1000.
 
+    * BULK_DELETE - If True, rows will be deleted in batches with a
+    single DELETE statement per batch, rather than being loaded and
+    deleted one at a time. Only set this if deleting a row doesn't
+    require any per-row work -- a custom delete() implementation or
+    ORM-level cascades.
+
     If your model class has fields that might contain a lot of data
     and aren't important to the reaping process, put their field names
     into a list called LARGE_FIELDS and the Reaper will avoid fetching
@@ -767,6 +1053,7 @@ class ReaperMonitor(Monitor):
     TIMESTAMP_FIELD = None
     MAX_AGE = None
     BATCH_SIZE = 1000
+    BULK_DELETE = False
 
     REGISTRY = []
 
@@ -798,6 +1085,17 @@ class ReaperMonitor(Monitor):
         return self.timestamp_field < self.cutoff
 
     def run_once(self, *args, **kwargs):
+        if self.BULK_DELETE:
+            rows_deleted = self.bulk_delete()
+        else:
+            rows_deleted = self.delete_one_at_a_time()
+        return TimestampData(achievements="Items deleted: %d" % rows_deleted)
+
+    def delete_one_at_a_time(self):
+        """Load each row to be reaped and pass it into delete().
+
+        :return: The number of rows deleted.
+        """
         rows_deleted = 0
         qu = self.query()
         to_defer = getattr(self.MODEL_CLASS, 'LARGE_FIELDS', [])
@@ -812,7 +1110,47 @@ class ReaperMonitor(Monitor):
                 rows_deleted += 1
             self._db.commit()
             count = qu.count()
-        return TimestampData(achievements="Items deleted: %d" % rows_deleted)
+        return rows_deleted
+
+    def bulk_delete(self):
+        """Delete the rows to be reaped in batches, without loading them.
+
+        Each batch is deleted with a single statement, along the lines of
+        DELETE FROM table WHERE id IN (SELECT id ... LIMIT BATCH_SIZE),
+        and the number of rows deleted is taken from the statement
+        itself.
+
+        :return: The number of rows deleted.
+        """
+        self.prepare_bulk_delete()
+        table = self.MODEL_CLASS.__table__
+        rows_deleted = 0
+        while True:
+            batch = self.query().with_entities(
+                self.MODEL_CLASS.id
+            ).limit(self.BATCH_SIZE).subquery()
+            delete = table.delete().where(
+                table.c.id.in_(select([batch.c.id]))
+            )
+            deleted = self._db.execute(delete).rowcount
+            self._db.commit()
+            if not deleted:
+                break
+            rows_deleted += deleted
+            self.log.info(
+                "Deleted %d row(s), %d so far", deleted, rows_deleted
+            )
+            if deleted < self.BATCH_SIZE:
+                # That was the final batch.
+                break
+        return rows_deleted
+
+    def prepare_bulk_delete(self):
+        """Do any set-based work necessary before the rows to be reaped
+        can be deleted with bulk DELETE statements -- for instance,
+        clearing foreign keys that refer to them.
+        """
+        pass
 
     def delete(self, row):
         """Delete a row from the database.
@@ -833,6 +1171,7 @@ class CachedFeedReaper(ReaperMonitor):
     MODEL_CLASS = CachedFeed
     TIMESTAMP_FIELD = 'timestamp'
     MAX_AGE = 30
+    BULK_DELETE = True
 ReaperMonitor.REGISTRY.append(CachedFeedReaper)
 
 
@@ -841,6 +1180,19 @@ class CredentialReaper(ReaperMonitor):
     MODEL_CLASS = Credential
     TIMESTAMP_FIELD = 'expires'
     MAX_AGE = 1
+    BULK_DELETE = True
+
+    def prepare_bulk_delete(self):
+        """Disassociate DRMDeviceIdentifiers from the Credentials that are
+        about to be deleted, just as deleting the Credentials through
+        the ORM would have done.
+        """
+        expired = select([Credential.id]).where(self.where_clause)
+        table = DRMDeviceIdentifier.__table__
+        update = table.update().where(
+            table.c.credential_id.in_(expired)
+        ).values(credential_id=None)
+        self._db.execute(update)
 ReaperMonitor.REGISTRY.append(CredentialReaper)
 
 class PatronRecordReaper(ReaperMonitor):
@@ -962,9 +1314,91 @@ class CirculationEventLocationScrubber(ScrubberMonitor):
     TIMESTAMP_FIELD = 'start'
     MAX_AGE = 365
     SCRUB_FIELD = 'location'
+
+    def run_once(self, *args, **kwargs):
+        """Scrub every monthly partition that lies entirely before the
+        cutoff as a unit, committing after each one, then scrub
+        whatever is left over.
+        """
+        cutoff = self.cutoff
+        rows_scrubbed = 0
+        scrubbed_through = None
+        for name, lower, upper in CirculationEvent.partitions(self._db):
+            if upper > cutoff:
+                break
+            # Every event in this partition is old enough to be
+            # scrubbed, so there's no need to check the dates.
+            result = self._db.execute(
+                "update %s set %s = null where %s is not null" % (
+                    name, self.SCRUB_FIELD, self.SCRUB_FIELD
+                )
+            )
+            self._db.commit()
+            rows_scrubbed += result.rowcount
+            scrubbed_through = upper
+
+        clause = self.where_clause
+        if scrubbed_through:
+            # Don't look at the partitions we just scrubbed.
+            clause = and_(clause, self.timestamp_field >= scrubbed_through)
+
+            # The default partition can hold events from any month,
+            # including months before scrubbed_through, so it's always
+            # checked against the real cutoff.
+            result = self._db.execute(
+                text(
+                    "update %s set %s = null where %s is not null "
+                    "and %s < :cutoff" % (
+                        CirculationEvent.DEFAULT_PARTITION, self.SCRUB_FIELD,
+                        self.SCRUB_FIELD, self.TIMESTAMP_FIELD
+                    )
+                ),
+                dict(cutoff=cutoff)
+            )
+            rows_scrubbed += result.rowcount
+        update = CirculationEvent.__table__.update().where(clause).values(
+            {self.SCRUB_FIELD : None}
+        )
+        rows_scrubbed += self._db.execute(update).rowcount
+        self._db.commit()
+        return TimestampData(achievements="Items scrubbed: %d" % rows_scrubbed)
 ReaperMonitor.REGISTRY.append(CirculationEventLocationScrubber)
 
 
+class CirculationEventPartitionMonitor(Monitor):
+    """Make sure the circulationevents table has monthly partitions
+    for the current month and the next few months, as well as for any
+    month whose events ended up in the default partition.
+    """
+    SERVICE_NAME = "Circulation event partition maintenance"
+
+    # Create partitions this many months in advance.
+    MONTHS_AHEAD = 2
+
+    def run_once(self, *args, **kwargs):
+        if not CirculationEvent.is_partitioned(self._db):
+            return TimestampData(
+                achievements="The circulationevents table is not partitioned."
+            )
+        existing = set(x[0] for x in CirculationEvent.partitions(self._db))
+        months = CirculationEvent.months_in_default_partition(self._db)
+        month = datetime.datetime.utcnow()
+        for i in range(self.MONTHS_AHEAD + 1):
+            months.append(month)
+            month = CirculationEvent.month_bounds(month)[1]
+
+        created = []
+        for month in months:
+            name = CirculationEvent.create_partition(self._db, month)
+            if name not in existing:
+                existing.add(name)
+                created.append(name)
+            self._db.commit()
+        return TimestampData(
+            achievements="Partitions created: %d" % len(created)
+        )
+
+
 class PatronNeighborhoodScrubber(ScrubberMonitor):
     """Scrub cached neighborhood information from patrons who haven't been
     seen in a while.
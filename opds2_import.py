@@ -37,6 +37,7 @@ from .model import (
 )
 from .opds_import import OPDSImporter, OPDSImportMonitor
 from .util.http import BadResponseException
+from .util.json_stream import iterate_array, scan_object
 from .util.opds_writer import OPDSFeed
 
 
@@ -47,6 +48,10 @@ class OPDS2Importer(OPDSImporter):
     DESCRIPTION = _(u"Import books from a publicly-accessible OPDS 2.0 feed.")
     NEXT_LINK_RELATION = u"next"
 
+    # When a feed is parsed one publication at a time, these parts of
+    # the feed are read incrementally.
+    STREAMED_KEYS = (u"publications", u"groups")
+
     def __init__(
         self,
         db,
@@ -58,6 +63,9 @@ class OPDS2Importer(OPDSImporter):
         content_modifier=None,
         map_from_collection=None,
         mirrors=None,
+        stream_publications=False,
+        worker_processes=1,
+        skip_unchanged=False,
     ):
         """Initialize a new instance of OPDS2Importer class.
 
@@ -91,6 +99,17 @@ class OPDS2Importer(OPDSImporter):
 
         :param mirrors: A dictionary of different MirrorUploader objects for different purposes
         :type mirrors: Dict[MirrorUploader]
+
+        :param stream_publications: Boolean value indicating whether to parse feeds one publication at a time,
+            rather than turning an entire feed into Python objects before processing any of it
+        :type stream_publications: bool
+
+        :param worker_processes: Number of worker processes to divide the entries on each page of the feed between
+        :type worker_processes: int
+
+        :param skip_unchanged: Boolean value indicating whether to skip publications whose metadata
+            hasn't changed since they were last imported
+        :type skip_unchanged: bool
         """
         super(OPDS2Importer, self).__init__(
             db,
@@ -102,9 +121,12 @@ class OPDS2Importer(OPDSImporter):
             content_modifier,
             map_from_collection,
             mirrors,
+            worker_processes=worker_processes,
+            skip_unchanged=skip_unchanged,
         )
 
         self._logger = logging.getLogger(__name__)
+        self.stream_publications = stream_publications
 
     def _extract_subjects(self, subjects):
         """Extract a list of SubjectData objects from the webpub-manifest-parser's subject.
@@ -734,11 +756,29 @@ class OPDS2Importer(OPDSImporter):
 
         return open_access_rights_link
 
+    @staticmethod
+    def _read_feed(feed):
+        """Read the feed out of a file, if that's where it is.
+
+        :param feed: OPDS 2.0 feed, or an open file containing it,
+            probably one spooled by OPDSImportMonitor
+        :type feed: Union[str, file, opds2_ast.OPDS2Feed]
+
+        :return: The feed, as a string if it was read from a file
+        :rtype: Union[str, opds2_ast.OPDS2Feed]
+        """
+        if hasattr(feed, "read"):
+            # The same file may be read more than once.
+            feed.seek(0)
+            feed = feed.read()
+
+        return feed
+
     def _parse_feed(self, feed, silent=True):
         """Parses the feed into OPDS2Feed object.
 
-        :param feed: OPDS 2.0 feed
-        :type feed: Union[str, opds2_ast.OPDS2Feed]
+        :param feed: OPDS 2.0 feed, or an open file containing it
+        :type feed: Union[str, file, opds2_ast.OPDS2Feed]
 
         :param silent: Boolean value indicating whether to raise
         :type silent: bool
@@ -747,6 +787,7 @@ class OPDS2Importer(OPDSImporter):
         :rtype: opds2_ast.OPDS2Feed
         """
         parsed_feed = None
+        feed = self._read_feed(feed)
 
         if is_string(feed):
             try:
@@ -775,20 +816,126 @@ class OPDS2Importer(OPDSImporter):
             parsed_feed = feed
         else:
             raise ValueError(
-                "Feed argument must be either string or OPDS2Feed instance"
+                "Feed argument must be either string, file or OPDS2Feed instance"
             )
 
         return parsed_feed
 
+    def _stream_publications(self, feed):
+        """Parse an OPDS 2.0 feed one publication at a time.
+
+        Only the feed's top-level metadata and links, plus a single
+        publication (or group), are held in memory as Python objects
+        at any one time.
+
+        :param feed: OPDS 2.0 feed
+        :type feed: str
+
+        :return: An iterable list of 2-tuples (feed, publication). Each feed contains the original feed's
+            metadata and links, and only the one publication or the
+            one group the publication belongs to
+        :rtype: Iterable[Tuple[opds2_ast.OPDS2Feed, opds2_ast.OPDS2Publication]]
+        """
+        skeleton, offsets = scan_object(feed, self.STREAMED_KEYS)
+
+        def documents():
+            if u"publications" in offsets:
+                for publication in iterate_array(feed, offsets[u"publications"]):
+                    document = dict(skeleton)
+                    document[u"publications"] = [publication]
+                    yield document
+
+            if u"groups" in offsets:
+                # A group is parsed as a whole, so it's validated
+                # the same way it would be as part of the whole feed.
+                for group in iterate_array(feed, offsets[u"groups"]):
+                    document = dict(skeleton)
+                    document[u"groups"] = [group]
+                    yield document
+
+        parsed_any = False
+        for document in documents():
+            parsed_feed = self._parse_feed(document, silent=False)
+            parsed_any = True
+
+            for publication in self._get_publications(parsed_feed):
+                yield parsed_feed, publication
+
+        if not parsed_any:
+            # There were no publications or groups, but the rest of
+            # the feed still has to be valid.
+            document = dict(skeleton)
+            for key in offsets:
+                document[key] = []
+            self._parse_feed(document, silent=False)
+
+    def _get_feeds_and_publications(self, feed, silent=True):
+        """Return all the publications in the feed, along with the feed they belong to.
+
+        :param feed: OPDS 2.0 feed, or an open file containing it
+        :type feed: Union[str, file, opds2_ast.OPDS2Feed]
+
+        :param silent: Boolean value indicating whether to raise
+        :type silent: bool
+
+        :return: An iterable list of 2-tuples (feed, publication)
+        :rtype: Iterable[Tuple[opds2_ast.OPDS2Feed, opds2_ast.OPDS2Publication]]
+        """
+        feed = self._read_feed(feed)
+
+        if self.stream_publications and is_string(feed):
+            try:
+                for feed_and_publication in self._stream_publications(feed):
+                    yield feed_and_publication
+            except (BaseError, ValueError):
+                self._logger.exception("Failed to parse the OPDS 2.0 feed")
+
+                if not silent:
+                    raise
+            return
+
+        parsed_feed = self._parse_feed(feed, silent)
+
+        if not parsed_feed:
+            return
+
+        for publication in self._get_publications(parsed_feed):
+            yield parsed_feed, publication
+
     def extract_next_links(self, feed):
         """Extracts "next" links from the feed.
 
-        :param feed: OPDS 2.0 feed
-        :type feed: Union[str, opds2_ast.OPDS2Feed]
+        :param feed: OPDS 2.0 feed, or an open file containing it
+        :type feed: Union[str, file, opds2_ast.OPDS2Feed]
 
         :return: List of "next" links
         :rtype: List[str]
         """
+        feed = self._read_feed(feed)
+
+        if self.stream_publications and is_string(feed):
+            # Only the links are needed, but a feed that doesn't parse
+            # has no next links, so every publication and group is
+            # still validated, one at a time.
+            try:
+                for _ in self._stream_publications(feed):
+                    pass
+                skeleton, _ = scan_object(feed, self.STREAMED_KEYS)
+            except (BaseError, ValueError):
+                self._logger.exception("Failed to parse the OPDS 2.0 feed")
+
+                return []
+
+            next_links = []
+            for link in skeleton.get(u"links") or []:
+                rels = link.get(u"rel")
+                if not isinstance(rels, list):
+                    rels = [rels]
+                if self.NEXT_LINK_RELATION in rels and link.get(u"href"):
+                    next_links.append(link[u"href"])
+
+            return next_links
+
         parsed_feed = self._parse_feed(feed)
 
         if not parsed_feed:
@@ -802,20 +949,15 @@ class OPDS2Importer(OPDSImporter):
     def extract_last_update_dates(self, feed):
         """Extract last update date of the feed.
 
-        :param feed: OPDS 2.0 feed
-        :type feed: Union[str, opds2_ast.OPDS2Feed]
+        :param feed: OPDS 2.0 feed, or an open file containing it
+        :type feed: Union[str, file, opds2_ast.OPDS2Feed]
 
         :return: A list of 2-tuples containing publication's identifiers and their last modified dates
         :rtype: List[Tuple[str, datetime.datetime]]
         """
-        parsed_feed = self._parse_feed(feed)
-
-        if not parsed_feed:
-            return []
-
         dates = [
             (publication.metadata.identifier, publication.metadata.modified)
-            for publication in self._get_publications(parsed_feed)
+            for _, publication in self._get_feeds_and_publications(feed)
             if publication.metadata.modified
         ]
 
@@ -824,17 +966,16 @@ class OPDS2Importer(OPDSImporter):
     def extract_feed_data(self, feed, feed_url=None):
         """Turn an OPDS 2.0 feed into lists of Metadata and CirculationData objects.
 
-        :param feed: OPDS 2.0 feed
-        :type feed: Union[str, opds2_ast.OPDS2Feed]
+        :param feed: OPDS 2.0 feed, or an open file containing it
+        :type feed: Union[str, file, opds2_ast.OPDS2Feed]
 
         :param feed_url: Feed URL used to resolve relative links
         :type feed_url: Optional[str]f
         """
-        feed = self._parse_feed(feed, silent=False)
         publication_metadata_dictionary = {}
         failures = {}
 
-        for publication in self._get_publications(feed):
+        for feed, publication in self._get_feeds_and_publications(feed, silent=False):
             publication_metadata = self._extract_publication_metadata(
                 feed, publication, self.data_source_name
             )
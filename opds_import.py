@@ -1,11 +1,18 @@
 import datetime
+import hashlib
 import logging
+import multiprocessing
+import sys
+import tempfile
 import traceback
 import urllib
 from io import BytesIO, StringIO
 
 import dateutil
 import feedparser
+import requests
+from requests.adapters import HTTPAdapter
+from analytics import Analytics
 from config import CannotLoadConfiguration, IntegrationException
 from coverage import CoverageFailure
 from flask_babel import lazy_gettext as _
@@ -24,6 +31,7 @@ from metadata_layer import (
 from mirror import MirrorUploader
 from model import (
     Collection,
+    ContributorResolver,
     CoverageRecord,
     DataSource,
     Edition,
@@ -31,23 +39,28 @@ from model import (
     ExternalIntegration,
     Hyperlink,
     Identifier,
+    IdentifierResolver,
     LicensePool,
     Measurement,
     Representation,
     RightsStatus,
+    SessionManager,
     Subject,
+    Work,
     get_one,
 )
 from model.configuration import ExternalIntegrationLink
+from model.hasfulltablecache import HasFullTableCache
 from monitor import CollectionMonitor
 from nose.tools import set_trace
 from selftest import HasSelfTests, SelfTestResult
 from six.moves.urllib.parse import urljoin, urlparse
 from sqlalchemy.orm import aliased
 from sqlalchemy.orm.session import Session
-from util.http import HTTP, BadResponseException
+from util.http import HTTP, BadResponseException, HostLimiter
 from util.opds_writer import OPDSFeed, OPDSMessage
 from util.string_helpers import base64
+from util.worker_pools import Pool
 from util.xmlparser import XMLParser
 
 from .classifier import Classifier
@@ -441,9 +454,50 @@ class OPDSXMLParser(XMLParser):
                    "schema" : "http://schema.org/",
                    "atom" : "http://www.w3.org/2005/Atom",
                    "drm": "http://librarysimplified.org/terms/drm",
+                   "bibframe": "http://bibframe.org/vocab/",
     }
 
 
+class ImportWorkerError(Exception):
+    """A worker process couldn't be set up to import part of a feed."""
+
+
+# What a worker process needs to import part of a feed: the
+# OPDSImporter, the Metadata objects, and the database URL. This is
+# set just before the worker processes are forked.
+_parallel_import = None
+
+# The traceback of the exception raised while setting up this worker
+# process, if any.
+_import_worker_error = None
+
+# The database session and connection pool this worker process
+# inherited from the parent process. They're kept here so they never
+# get used or garbage-collected in the worker.
+_inherited_from_parent = []
+
+def _start_import_worker():
+    """Set up a newly forked worker process.
+
+    If a multiprocessing.Pool initializer raises an exception, the
+    pool replaces the worker and tries again forever, so any exception
+    is saved and reported to the parent process when the worker is
+    given something to do.
+    """
+    global _import_worker_error
+    importer, metadata_objs, url = _parallel_import
+    try:
+        importer.start_worker(url)
+    except Exception, e:
+        _import_worker_error = traceback.format_exc()
+
+def _import_partition(keys):
+    importer, metadata_objs, url = _parallel_import
+    if _import_worker_error:
+        raise ImportWorkerError(_import_worker_error)
+    return importer.import_in_worker(keys, metadata_objs)
+
+
 class OPDSImporter(object):
     """ Imports editions and license pools from an OPDS feed.
     Creates Edition, LicensePool and Work rows in the database, if those
@@ -502,6 +556,10 @@ class OPDSImporter(object):
         },
     ]
 
+    # The number of requests OPDSImportMonitor may have in flight to
+    # a single host.
+    MAX_CONCURRENT_REQUESTS = u"max_concurrent_requests"
+
     # These settings are used by 'regular' OPDS but not by OPDS For
     # Distributors, which has its own way of doing authentication.
     SETTINGS = BASE_SETTINGS + [
@@ -515,6 +573,13 @@ class OPDSImporter(object):
             "label": _("Password"),
             "description": _("If HTTP Basic authentication is required to access the OPDS feed (it usually isn't), enter the password here."),
         },
+        {
+            "key": MAX_CONCURRENT_REQUESTS,
+            "label": _("Concurrent requests"),
+            "description": _("When a page of the OPDS feed links to several other pages, request up to this many of them from the same server at once."),
+            "type": "number",
+            "default": 1,
+        },
     ]
 
     # Subclasses of OPDSImporter may define a different parser class that's
@@ -527,10 +592,36 @@ class OPDSImporter(object):
     # when they show up in <simplified:message> tags.
     SUCCESS_STATUS_CODES = None
 
+    # By default, a feed is parsed once, with lxml. Subclasses that
+    # rely on feedparser's interpretation of the feed (for instance,
+    # by overriding _data_detail_for_feedparser_entry) can set this to
+    # True to parse every feed with feedparser and then again with
+    # lxml, and combine the results.
+    PARSE_WITH_FEEDPARSER = False
+
+    # These methods only matter when a feed is parsed with feedparser.
+    # A subclass that overrides any of them gets its feeds parsed with
+    # feedparser, as though it had set PARSE_WITH_FEEDPARSER.
+    FEEDPARSER_HOOKS = [
+        'extract_data_from_feedparser',
+        'data_detail_for_feedparser_entry',
+        '_data_detail_for_feedparser_entry',
+        'rights_uri_from_feedparser_entry',
+    ]
+
+    # Maps the Atom text construct types to the media types
+    # feedparser would report for them.
+    ATOM_TEXT_MEDIA_TYPES = {
+        'text': 'text/plain',
+        'html': 'text/html',
+        'xhtml': 'application/xhtml+xml',
+    }
+
     def __init__(self, _db, collection, data_source_name=None,
                  identifier_mapping=None, http_get=None,
                  metadata_client=None, content_modifier=None,
-                 map_from_collection=None, mirrors=None
+                 map_from_collection=None, mirrors=None,
+                 worker_processes=1, skip_unchanged=False
     ):
         """:param collection: LicensePools created by this OPDS import
         will be associated with the given Collection. If this is None,
@@ -556,6 +647,16 @@ class OPDSImporter(object):
         :param content_modifier: A function that may modify-in-place
         representations (such as images and EPUB documents) as they
         come in from the network.
+
+        :param worker_processes: If this is more than 1, the entries
+        in a feed will be divided up between this many worker
+        processes, each with its own database session, and imported
+        in parallel.
+
+        :param skip_unchanged: If an entry's metadata is exactly the
+        same as the last time it was imported, don't apply it
+        again. This means linked resources such as covers won't be
+        checked for changes either.
         """
         self._db = _db
         self.log = logging.getLogger("OPDS Importer")
@@ -575,6 +676,7 @@ class OPDSImporter(object):
             data_source_name = data_source_name or DataSource.METADATA_WRANGLER
         self.data_source_name = data_source_name
         self.identifier_mapping = identifier_mapping
+        self.identifier_resolver = IdentifierResolver(_db)
         try:
             self.metadata_client = metadata_client or MetadataWranglerOPDSLookup.from_config(_db, collection=collection)
         except CannotLoadConfiguration:
@@ -607,6 +709,31 @@ class OPDSImporter(object):
         # gutenberg.org.
         self.http_get = http_get or Representation.cautious_http_get
         self.map_from_collection = map_from_collection
+        self.worker_processes = max(worker_processes or 1, 1)
+        self.skip_unchanged = skip_unchanged
+
+        # Finds the Contributors mentioned on the page of a feed
+        # currently being imported.
+        self.contributor_resolver = None
+
+        self.overrides_feedparser_hooks = self._overridden_feedparser_hooks()
+        if self.overrides_feedparser_hooks and not self.PARSE_WITH_FEEDPARSER:
+            self.log.warn(
+                "%s overrides %s, so its feeds will be parsed with feedparser. Set PARSE_WITH_FEEDPARSER to True to make this explicit.",
+                self.__class__.__name__,
+                ", ".join(self.overrides_feedparser_hooks)
+            )
+
+    def _overridden_feedparser_hooks(self):
+        """Find the FEEDPARSER_HOOKS overridden by this importer's class."""
+        overridden = []
+        for cls in type(self).__mro__:
+            if cls is OPDSImporter:
+                break
+            for name in self.FEEDPARSER_HOOKS:
+                if name in cls.__dict__ and name not in overridden:
+                    overridden.append(name)
+        return overridden
 
     @property
     def collection(self):
@@ -712,6 +839,20 @@ class OPDSImporter(object):
         # If parsing the overall feed throws an exception, we should address that before
         # moving on. Let the exception propagate.
         metadata_objs, failures = self.extract_feed_data(feed, feed_url)
+        self.contributor_resolver = None
+        if self.worker_processes > 1:
+            return self.import_in_parallel(metadata_objs, failures)
+
+        # Look up everyone mentioned on this page who can be
+        # identified without a trip to the metadata wrangler.
+        self.contributor_resolver = ContributorResolver(self._db)
+        self.contributor_resolver.resolve(
+            (contributor.sort_name, contributor.lc, contributor.viaf)
+            for key, metadata in sorted(metadata_objs.items())
+            if key not in failures
+            for contributor in metadata.contributors
+        )
+
         # make editions.  if have problem, make sure associated pool and work aren't created.
         for key, metadata in metadata_objs.iteritems():
             # key is identifier.urn here
@@ -729,7 +870,7 @@ class OPDSImporter(object):
                 # Rather than scratch the whole import, treat this as a failure that only applies
                 # to this item.
                 self.log.error("Error importing an OPDS item", exc_info=e)
-                identifier, ignore = Identifier.parse_urn(self._db, key)
+                identifier = self.identifier_resolver.identifier_for(key)
                 data_source = self.data_source
                 failure = CoverageFailure(identifier, traceback.format_exc(), data_source=data_source, transient=False)
                 failures[key] = failure
@@ -746,13 +887,188 @@ class OPDSImporter(object):
                 if work:
                     works[key] = work
             except Exception, e:
-                identifier, ignore = Identifier.parse_urn(self._db, key)
+                identifier = self.identifier_resolver.identifier_for(key)
                 data_source = self.data_source
                 failure = CoverageFailure(identifier, traceback.format_exc(), data_source=data_source, transient=False)
                 failures[key] = failure
 
         return imported_editions.values(), pools.values(), works.values(), failures
 
+    def import_in_parallel(self, metadata_objs, failures):
+        """Import Metadata objects extracted from a feed by dividing
+        them up between worker processes.
+
+        :return: The same 4-tuple as import_from_feed().
+        """
+        global _parallel_import
+
+        keys = sorted(key for key in metadata_objs if key not in failures)
+        if not keys:
+            return [], [], [], failures
+
+        # Hash the Metadata objects before create_shared_rows() fills
+        # in any missing information, so the hashes are the same as
+        # they'd be in a single-process import.
+        for key in keys:
+            metadata_objs[key].content_hash()
+
+        # Rows that might be needed by more than one entry are created
+        # here, before the work is divided up, so that the workers
+        # find them rather than racing each other to create them.
+        self.create_shared_rows([metadata_objs[key] for key in keys])
+        self._db.commit()
+
+        # The same feed is always divided up the same way.
+        partitions = [
+            keys[i::self.worker_processes]
+            for i in range(self.worker_processes)
+        ]
+        partitions = [x for x in partitions if x]
+
+        # The workers inherit everything they need when they're
+        # forked, so the Metadata objects don't have to be pickled.
+        _parallel_import = (
+            self, metadata_objs, self._db.get_bind().engine.url
+        )
+        pool = multiprocessing.Pool(
+            len(partitions), initializer=_start_import_worker
+        )
+        try:
+            results = pool.map(_import_partition, partitions)
+        finally:
+            pool.terminate()
+            pool.join()
+            _parallel_import = None
+
+        return self.gather_results(
+            [x for partition in results for x in partition], failures
+        )
+
+    def create_shared_rows(self, metadatas):
+        """Make sure the Identifiers, Contributors and Subjects
+        mentioned in a number of Metadata objects exist, so they can
+        be shared between processes that apply the Metadata objects.
+
+        Rows are created in sorted order, so two importers working
+        through similar feeds lock them in the same order.
+        """
+        identifiers = set()
+        contributors = set()
+        subjects = set()
+        for metadata in metadatas:
+            for identifier in [metadata.primary_identifier] + metadata.identifiers:
+                if identifier:
+                    identifiers.add((identifier.type, identifier.identifier))
+            for contributor in metadata.contributors:
+                # Settle on a sort name now, so every worker that
+                # sees this contributor looks up the same one.
+                if contributor.display_name and not contributor.sort_name:
+                    contributor.find_sort_name(
+                        self._db, metadata.identifiers, self.metadata_client
+                    )
+                if contributor.sort_name or contributor.lc or contributor.viaf:
+                    contributors.add(
+                        (contributor.sort_name, contributor.lc, contributor.viaf)
+                    )
+            for subject in metadata.subjects:
+                if subject.type and (subject.identifier or subject.name):
+                    subjects.add((subject.type, subject.identifier, subject.name))
+
+        for type, identifier in sorted(identifiers):
+            Identifier.for_foreign_id(self._db, type, identifier)
+        ContributorResolver(self._db).resolve(sorted(contributors))
+        Subject.lookup_many(self._db, sorted(subjects))
+
+    def start_worker(self, url):
+        """Give this importer, in a newly forked worker process, its
+        own database session.
+
+        :param url: The URL of the database.
+        """
+        # Cached ORM objects belong to the parent process's session.
+        for cls in HasFullTableCache.__subclasses__():
+            cls.reset_cache()
+        Analytics.reset_registry()
+
+        # So do the parent's database connections. Closing one here,
+        # even by disposing of its engine, would tell the database
+        # server to end it for the parent as well, so set them aside
+        # and give the parent's engine a fresh pool in case anything
+        # in this process still uses it.
+        bind = self._db.get_bind()
+        engine = getattr(bind, 'engine', bind)
+        _inherited_from_parent.extend([self._db, engine.pool])
+        engine.pool = engine.pool.recreate()
+
+        _db = Session(SessionManager.engine(url))
+        self._db = _db
+        self.identifier_resolver = IdentifierResolver(_db)
+
+    def import_in_worker(self, keys, metadata_objs):
+        """Import some of the Metadata objects extracted from a feed,
+        as one of several processes working on the same feed.
+
+        Each item is committed as soon as it's imported, so locks on
+        shared rows are held only briefly.
+
+        :return: A list of 5-tuples (urn, Edition ID, LicensePool ID,
+            Work ID, traceback). The traceback is None if nothing went
+            wrong.
+        """
+        results = []
+        for key in keys:
+            edition = pool = work = None
+            error = None
+            transaction = self._db.begin_nested()
+            try:
+                edition = self.import_edition_from_metadata(metadata_objs[key])
+                transaction.commit()
+            except Exception, e:
+                self.log.error("Error importing an OPDS item", exc_info=e)
+                error = traceback.format_exc()
+                transaction.rollback()
+                edition = None
+
+            if edition:
+                transaction = self._db.begin_nested()
+                try:
+                    pool, work = self.update_work_for_edition(edition)
+                    transaction.commit()
+                except Exception, e:
+                    error = traceback.format_exc()
+                    transaction.rollback()
+                    pool = work = None
+            self._db.commit()
+            results.append(
+                (key,) + tuple(x.id if x else None for x in (edition, pool, work))
+                + (error,)
+            )
+        return results
+
+    def gather_results(self, results, failures):
+        """Turn the results of import_in_worker() into objects in
+        this importer's database session.
+
+        :return: The same 4-tuple as import_from_feed().
+        """
+        imported_editions = []
+        pools = []
+        works = []
+        for key, edition_id, pool_id, work_id, error in results:
+            if edition_id:
+                imported_editions.append(get_one(self._db, Edition, id=edition_id))
+            if pool_id:
+                pools.append(get_one(self._db, LicensePool, id=pool_id))
+            if work_id:
+                works.append(get_one(self._db, Work, id=work_id))
+            if error:
+                identifier = self.identifier_resolver.identifier_for(key)
+                failures[key] = CoverageFailure(
+                    identifier, error, data_source=self.data_source,
+                    transient=False
+                )
+        return imported_editions, pools, works, failures
+
     def import_edition_from_metadata(
             self, metadata
     ):
@@ -763,6 +1079,17 @@ class OPDSImporter(object):
         # Locate or create an Edition for this book.
         edition, is_new_edition = metadata.edition(self._db)
 
+        content_hash = self.content_hash(metadata)
+        if (self.skip_unchanged and not is_new_edition
+            and edition.metadata_hash == content_hash
+            and not self._circulation_missing(metadata, edition)):
+            # This exact metadata was applied the last time this book
+            # was imported. Applying it again would only mark the Work
+            # as needing its presentation recalculated and its search
+            # document updated.
+            self.log.debug("Metadata for %r is unchanged.", edition)
+            return edition
+
         policy = ReplacementPolicy(
             subjects=True,
             links=True,
@@ -773,14 +1100,36 @@ class OPDSImporter(object):
             mirrors=self.mirrors,
             content_modifier=self.content_modifier,
             http_get=self.http_get,
+            contributor_resolver=self.contributor_resolver,
         )
         metadata.apply(
             edition=edition, collection=self.collection,
             metadata_client=self.metadata_client, replace=policy
         )
+        edition.metadata_hash = content_hash
 
         return edition
 
+    def content_hash(self, metadata):
+        """Calculate a hash of a Metadata object as it would be
+        imported into this importer's Collection.
+        """
+        return hashlib.sha256(
+            "%s %s" % (self._collection_id, metadata.content_hash())
+        ).hexdigest()
+
+    def _circulation_missing(self, metadata, edition):
+        """Has a LicensePool that should exist for this Metadata
+        gone missing since it was last imported?
+        """
+        if not metadata.circulation or not self.collection:
+            return False
+        pool = get_one(
+            self._db, LicensePool, identifier=edition.primary_identifier,
+            collection=self.collection
+        )
+        return pool is None
+
     def update_work_for_edition(self, edition):
         """If possible, ensure that there is a presentation-ready Work for the
         given edition's primary identifier.
@@ -856,8 +1205,8 @@ class OPDSImporter(object):
             return
 
         mapping = dict()
-        identifiers_by_urn, failures = Identifier.parse_urns(
-            self._db, external_urns, autocreate=False
+        identifiers_by_urn, failures = self.identifier_resolver.resolve(
+            external_urns, autocreate=False
         )
         external_identifiers = identifiers_by_urn.values()
 
@@ -879,29 +1228,50 @@ class OPDSImporter(object):
     def extract_feed_data(self, feed, feed_url=None):
         """Turn an OPDS feed into lists of Metadata and CirculationData objects,
         with associated messages and next_links.
+
+        :param feed: The feed document, or an open file containing it.
         """
         data_source = self.data_source
-        fp_metadata, fp_failures = self.extract_data_from_feedparser(feed=feed, data_source=data_source)
-        # gets: medium, measurements, links, contributors, etc.
-        xml_data_meta, xml_failures = self.extract_metadata_from_elementtree(
-            feed, data_source=data_source, feed_url=feed_url, do_get=self.http_get
-        )
+        if self.PARSE_WITH_FEEDPARSER or self.overrides_feedparser_hooks:
+            if hasattr(feed, 'read'):
+                feed = feed.read()
+            entry_data, entry_failures = self.extract_data_from_feedparser(feed=feed, data_source=data_source)
+            # gets: medium, measurements, links, contributors, etc.
+            xml_data_meta, xml_failures = self.extract_metadata_from_elementtree(
+                feed, data_source=data_source, feed_url=feed_url, do_get=self.http_get
+            )
+            failures = entry_failures.items() + xml_failures.items()
+        else:
+            # A single lxml pass gets everything, so there's nothing
+            # to combine with the data for each entry.
+            entry_data, entry_failures = self.extract_data_from_elementtree(
+                feed, data_source=data_source, feed_url=feed_url, do_get=self.http_get
+            )
+            xml_data_meta = {}
+            failures = entry_failures.items()
 
+        # Every URN in the feed is going to be turned into an
+        # Identifier. Do it all at once, and keep the answers around
+        # until the next feed comes in.
+        self.identifier_resolver = IdentifierResolver(self._db)
         if self.map_from_collection:
             # Build the identifier_mapping based on the Collection.
-            self.build_identifier_mapping(fp_metadata.keys() + fp_failures.keys())
+            self.build_identifier_mapping(entry_data.keys() + entry_failures.keys())
+        self.identifier_resolver.resolve(
+            entry_data.keys() + [urn for urn, failure in failures]
+        )
 
         # translate the id in failures to identifier.urn
         identified_failures = {}
-        for urn, failure in fp_failures.items() + xml_failures.items():
+        for urn, failure in failures:
             identifier, failure = self.handle_failure(urn, failure)
             identified_failures[identifier.urn] = failure
 
         # Use one loop for both, since the id will be the same for both dictionaries.
         metadata = {}
         circulationdata = {}
-        for id, m_data_dict in fp_metadata.items():
-            external_identifier, ignore = Identifier.parse_urn(self._db, id)
+        for id, m_data_dict in entry_data.items():
+            external_identifier = self.identifier_resolver.identifier_for(id)
             if self.identifier_mapping:
                 internal_identifier = self.identifier_mapping.get(
                     external_identifier, external_identifier)
@@ -979,7 +1349,7 @@ class OPDSImporter(object):
         that what a normal OPDSImporter would consider 'failure' is
         considered success.
         """
-        external_identifier, ignore = Identifier.parse_urn(self._db, urn)
+        external_identifier = self.identifier_resolver.identifier_for(urn)
         if self.identifier_mapping:
             # The identifier found in the OPDS feed is different from
             # the identifier we want to export.
@@ -1124,6 +1494,265 @@ class OPDSImporter(object):
                     values[identifier] = detail
         return values, failures
 
+    @classmethod
+    def extract_data_from_elementtree(cls, feed, data_source, feed_url=None, do_get=None):
+        """Parse an OPDS feed with lxml, in a single pass, and extract
+        everything that extract_data_from_feedparser and
+        extract_metadata_from_elementtree would extract between them.
+
+        The feed is read with iterparse, and each <entry> tag is
+        thrown away once its data has been extracted, so a large feed
+        never has to be held in memory as a complete tree.
+
+        :return: A 2-tuple (values, failures). `values` maps IDs to
+            dictionaries that can be used as keyword arguments to the
+            Metadata constructor. `failures` maps IDs to
+            CoverageFailures (or Identifiers, for <simplified:message>
+            tags that signal success).
+
+        :param feed: The feed document, or an open file containing it.
+        """
+        values = {}
+        failures = {}
+        parser = cls.PARSER_CLASS()
+        if hasattr(feed, 'read'):
+            # This is an open file, probably one spooled by
+            # OPDSImportMonitor. It can be parsed as-is.
+            inp = feed
+        else:
+            if isinstance(feed, unicode):
+                # NOTE: etree will not parse certain Unicode strings.
+                # It's generally better to feed it a bytestring.
+                feed = feed.encode("utf8")
+            inp = BytesIO(feed)
+
+        namespaces = OPDSXMLParser.NAMESPACES
+        feed_tag_name = '{%s}feed' % namespaces['atom']
+        entry_tag_name = '{%s}entry' % namespaces['atom']
+        link_tag_name = '{%s}link' % namespaces['atom']
+        message_tag_name = '{%s}message' % namespaces['simplified']
+
+        tags = etree.iterparse(
+            inp, events=('end',),
+            tag=(entry_tag_name, link_tag_name, message_tag_name)
+        )
+        for event, tag in tags:
+            parent = tag.getparent()
+            if (parent is None or parent.tag != feed_tag_name
+                or parent.getparent() is not None):
+                # This tag is inside an <entry> or a <message>. It
+                # will be processed along with its parent.
+                continue
+
+            if tag.tag == link_tag_name:
+                # Some OPDS feeds (eg Standard Ebooks) contain
+                # relative urls, so we need the feed's self URL to
+                # extract links. If none was passed in, we still
+                # might be able to guess. Feed-level links come
+                # before the entries in practice, so this will be
+                # known by the time it's needed.
+                if not feed_url and tag.get('rel') == 'self':
+                    feed_url = tag.get('href')
+            elif tag.tag == message_tag_name:
+                # Turn a Simplified <message> tag into a
+                # CoverageFailure object.
+                message = cls.message_from_tag(parser, tag)
+                failure = cls.coveragefailure_from_message(
+                    data_source, message
+                )
+                if isinstance(failure, Identifier):
+                    # The Simplified <message> tag does not actually
+                    # represent a failure -- it was turned into an
+                    # Identifier instead of a CoverageFailure.
+                    failures[failure.urn] = failure
+                elif failure:
+                    failures[failure.obj.urn] = failure
+            else:
+                # Turn an Atom <entry> tag into a Metadata object.
+                identifier, detail, failure = cls.data_detail_for_elementtree_entry(
+                    parser, tag, data_source, feed_url, do_get=do_get
+                )
+                if identifier:
+                    if failure:
+                        failures[identifier] = failure
+                    elif detail:
+                        values[identifier] = detail
+                else:
+                    logging.error(
+                        "Tried to parse an element without a valid identifier.  feed_url=%s" % feed_url
+                    )
+
+            # We're done with this tag, and with everything that came
+            # before it.
+            tag.clear()
+            while tag.getprevious() is not None:
+                del parent[0]
+        return values, failures
+
+    @classmethod
+    def data_detail_for_elementtree_entry(
+            cls, parser, entry_tag, data_source, feed_url=None, do_get=None
+    ):
+        """Turn an <atom:entry> tag into a dictionary that combines the
+        data found by _data_detail_for_elementtree_entry and
+        _detail_for_elementtree_entry.
+
+        :return: A 3-tuple (identifier, kwargs for Metadata constructor, failure)
+        """
+        identifier = parser._xpath1(entry_tag, 'atom:id')
+        if identifier is None or not identifier.text:
+            return None, None, None
+        identifier = identifier.text
+
+        try:
+            data = cls._data_detail_for_elementtree_entry(
+                parser, entry_tag, data_source
+            )
+            detail = cls._detail_for_elementtree_entry(
+                parser, entry_tag, feed_url, do_get=do_get
+            )
+            # The CirculationData gets the same links as the
+            # Metadata.
+            data['circulation']['links'].extend(detail['links'])
+            return identifier, cls.combine(data, detail), None
+        except Exception, e:
+            _db = Session.object_session(data_source)
+            identifier_obj, ignore = Identifier.parse_urn(_db, identifier)
+            failure = CoverageFailure(
+                identifier_obj, traceback.format_exc(), data_source,
+                transient=True
+            )
+            return identifier, None, failure
+
+    @classmethod
+    def _data_detail_for_elementtree_entry(cls, parser, entry_tag, metadata_data_source):
+        """Extract from an <atom:entry> tag the information
+        _data_detail_for_feedparser_entry would extract from
+        feedparser's version of the same entry.
+        """
+        def text(*paths):
+            # Find the first of these subtags that contains some
+            # text. Like feedparser, ignore surrounding whitespace.
+            for path in paths:
+                value = parser.text_of_optional_subtag(entry_tag, path)
+                if value and value.strip():
+                    return value.strip()
+            return None
+
+        title = text('atom:title')
+        if title == OPDSFeed.NO_TITLE:
+            title = None
+        subtitle = text('schema:alternativeHeadline')
+
+        # See _data_detail_for_feedparser_entry for an explanation
+        # of <bibframe:distribution>.
+        circulation_data_source_name = None
+        circulation_data_source_tag = parser._xpath1(
+            entry_tag, 'bibframe:distribution'
+        )
+        if circulation_data_source_tag is not None:
+            for key, value in circulation_data_source_tag.attrib.items():
+                # feedparser doesn't care about the case of attribute
+                # names, so neither do we.
+                if etree.QName(key).localname.lower() == 'providername':
+                    circulation_data_source_name = value
+        circulation_data_source = cls._circulation_data_source(
+            metadata_data_source, circulation_data_source_name
+        )
+
+        # Like feedparser, fall back to the publication date if the
+        # entry doesn't say when it was updated.
+        last_opds_update = cls._datetime_from_string(
+            text('atom:updated', 'dcterms:modified',
+                 'atom:published', 'dcterms:issued')
+        )
+
+        publisher = text('dc:publisher', 'dcterms:publisher')
+        language = text('dc:language', 'dcterms:language')
+
+        links = []
+        description_tags = (
+            parser._xpath(entry_tag, 'atom:summary')[:1]
+            + parser._xpath(entry_tag, 'atom:content')
+        )
+        for description_tag in description_tags:
+            link = cls._description_link_from_tag(description_tag)
+            if link:
+                links.append(link)
+
+        rights_uri = cls.rights_uri(text('atom:rights', 'dc:rights') or "")
+
+        kwargs_meta = dict(
+            title=title,
+            subtitle=subtitle,
+            language=language,
+            publisher=publisher,
+            links=links,
+            # refers to when was updated in opds feed, not our db
+            data_source_last_updated=last_opds_update,
+        )
+
+        # Although we always provide the CirculationData, it will only
+        # be used if the OPDSImporter has a Collection to hold the
+        # LicensePool that will result from importing it.
+        kwargs_circ = dict(
+            data_source=circulation_data_source.name,
+            links=list(links),
+            default_rights_uri=rights_uri,
+        )
+        kwargs_meta['circulation'] = kwargs_circ
+        return kwargs_meta
+
+    @classmethod
+    def _description_link_from_tag(cls, tag):
+        """Turn an <atom:summary> or <atom:content> tag into a LinkData
+        for the book's description.
+        """
+        atom_type = tag.get('type', 'text')
+        media_type = cls.ATOM_TEXT_MEDIA_TYPES.get(atom_type, atom_type)
+        if media_type == 'application/xhtml+xml':
+            # The description is the markup inside the tag (normally
+            # a single <div>).
+            container = tag
+            if len(tag) == 1 and not (tag.text or '').strip():
+                container = tag[0]
+            content = (container.text or '') + ''.join(
+                etree.tostring(child, encoding=unicode)
+                for child in container
+            )
+        else:
+            content = tag.text
+        if content:
+            content = content.strip()
+        if not content:
+            return None
+        if media_type in ('text/html', 'application/xhtml+xml'):
+            # Clean up the HTML exactly the way feedparser would.
+            content = feedparser._sanitizeHTML(content, 'utf-8', media_type)
+        return cls.make_link_data(
+            rel=Hyperlink.DESCRIPTION,
+            media_type=media_type,
+            content=content
+        )
+
+    @classmethod
+    def _datetime_from_string(cls, value):
+        """Turn a date string from an OPDS feed into a naive UTC datetime,
+        precise to the second, like the ones _datetime gets from
+        feedparser.
+        """
+        if not value:
+            return None
+        # A string that only has a year is taken to mean January 1.
+        default = datetime.datetime(datetime.datetime.now().year, 1, 1)
+        try:
+            value = dateutil.parser.parse(value, default=default)
+        except (ValueError, OverflowError), e:
+            return None
+        if value.tzinfo is not None:
+            value = (value - value.utcoffset()).replace(tzinfo=None)
+        return value.replace(microsecond=0)
+
     @classmethod
     def _datetime(cls, entry, key):
         value = entry.get(key, None)
@@ -1188,27 +1817,15 @@ class OPDSImporter(object):
         # The open-access content server uses a
         # <bibframe:distribution> tag to keep track of which data
         # source provides the circulation data.
-        circulation_data_source = metadata_data_source
+        circulation_data_source_name = None
         circulation_data_source_tag = entry.get('bibframe_distribution')
         if circulation_data_source_tag:
             circulation_data_source_name = circulation_data_source_tag.get(
                 'bibframe:providername'
             )
-            if circulation_data_source_name:
-                _db = Session.object_session(metadata_data_source)
-                # We know this data source offers licenses because
-                # that's what the <bibframe:distribution> is there
-                # to say.
-                circulation_data_source = DataSource.lookup(
-                    _db, circulation_data_source_name, autocreate=True,
-                    offers_licenses=True
-                )
-                if not circulation_data_source:
-                    raise ValueError(
-                        "Unrecognized circulation data source: %s" % (
-                            circulation_data_source_name
-                        )
-                    )
+        circulation_data_source = cls._circulation_data_source(
+            metadata_data_source, circulation_data_source_name
+        )
         last_opds_update = cls._datetime(entry, 'updated_parsed')
 
         publisher = entry.get('publisher', None)
@@ -1268,6 +1885,33 @@ class OPDSImporter(object):
         kwargs_meta['circulation'] = kwargs_circ
         return kwargs_meta
 
+    @classmethod
+    def _circulation_data_source(cls, metadata_data_source,
+                                 circulation_data_source_name):
+        """Find the DataSource that provides circulation data for an
+        entry.
+
+        :param circulation_data_source_name: The ProviderName of the
+            entry's <bibframe:distribution> tag, if it has one.
+        """
+        if not circulation_data_source_name:
+            return metadata_data_source
+        _db = Session.object_session(metadata_data_source)
+        # We know this data source offers licenses because
+        # that's what the <bibframe:distribution> is there
+        # to say.
+        circulation_data_source = DataSource.lookup(
+            _db, circulation_data_source_name, autocreate=True,
+            offers_licenses=True
+        )
+        if not circulation_data_source:
+            raise ValueError(
+                "Unrecognized circulation data source: %s" % (
+                    circulation_data_source_name
+                )
+            )
+        return circulation_data_source
+
     @classmethod
     def rights_uri(cls, rights_string):
         """Determine the URI that best encapsulates the rights status of
@@ -1301,33 +1945,37 @@ class OPDSImporter(object):
         """
         path = '/atom:feed/simplified:message'
         for message_tag in parser._xpath(feed_tag, path):
+            yield cls.message_from_tag(parser, message_tag)
 
-            # First thing to do is determine which Identifier we're
-            # talking about.
-            identifier_tag = parser._xpath1(message_tag, 'atom:id')
-            if identifier_tag is None:
-                urn = None
-            else:
-                urn = identifier_tag.text
+    @classmethod
+    def message_from_tag(cls, parser, message_tag):
+        """Convert a <simplified:message> tag into an OPDSMessage."""
+        # First thing to do is determine which Identifier we're
+        # talking about.
+        identifier_tag = parser._xpath1(message_tag, 'atom:id')
+        if identifier_tag is None:
+            urn = None
+        else:
+            urn = identifier_tag.text
 
-            # What status code is associated with the message?
-            status_code_tag = parser._xpath1(message_tag, 'simplified:status_code')
-            if status_code_tag is None:
+        # What status code is associated with the message?
+        status_code_tag = parser._xpath1(message_tag, 'simplified:status_code')
+        if status_code_tag is None:
+            status_code = None
+        else:
+            try:
+                status_code = int(status_code_tag.text)
+            except ValueError:
                 status_code = None
-            else:
-                try:
-                    status_code = int(status_code_tag.text)
-                except ValueError:
-                    status_code = None
-
-            # What is the human-readable message?
-            description_tag = parser._xpath1(message_tag, 'schema:description')
-            if description_tag is None:
-                description = ''
-            else:
-                description = description_tag.text
 
-            yield OPDSMessage(urn, status_code, description)
+        # What is the human-readable message?
+        description_tag = parser._xpath1(message_tag, 'schema:description')
+        if description_tag is None:
+            description = ''
+        else:
+            description = description_tag.text
+
+        return OPDSMessage(urn, status_code, description)
 
     @classmethod
     def coveragefailures_from_messages(cls, data_source, parser, feed_tag):
@@ -1735,8 +2383,26 @@ class OPDSImportMonitor(CollectionMonitor, HasSelfTests):
     # specialize OPDS import should override this.
     PROTOCOL = ExternalIntegration.OPDS_IMPORT
 
+    # If a server tells us to come back later (with a 429 or 503
+    # status code and a Retry-After header), we'll try again this
+    # many times...
+    MAX_RETRIES = 3
+
+    # ...as long as it doesn't want us to wait longer than this
+    # many seconds.
+    MAX_RETRY_AFTER = 300
+
     def __init__(self, _db, collection, import_class,
-                 force_reimport=False, **import_class_kwargs):
+                 force_reimport=False, spool_feeds=False,
+                 **import_class_kwargs):
+        """Constructor.
+
+        :param force_reimport: Import every page of the feed, even
+            if it seems like it was already imported.
+        :param spool_feeds: Store each page of the feed in a temporary
+            file between the time it's downloaded and the time it's
+            imported, rather than keeping every page in memory.
+        """
         if not collection:
             raise ValueError(
                 "OPDSImportMonitor can only be run in the context of a Collection."
@@ -1758,8 +2424,30 @@ class OPDSImportMonitor(CollectionMonitor, HasSelfTests):
         self.external_integration_id = collection.external_integration.id
         self.feed_url = self.opds_url(collection)
         self.force_reimport = force_reimport
+        self.spool_feeds = spool_feeds
+
+        # Keep connections open between requests, and keep track of
+        # how many requests are going to each host.
+        self.max_concurrent_requests = max(
+            collection.external_integration.setting(
+                OPDSImporter.MAX_CONCURRENT_REQUESTS
+            ).int_value or 1,
+            1
+        )
+        self.http_session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_maxsize=self.max_concurrent_requests
+        )
+        self.http_session.mount('http://', adapter)
+        self.http_session.mount('https://', adapter)
+        self.host_limiter = HostLimiter(self.max_concurrent_requests)
+        self._fetch_pool = None
         self.username = collection.external_integration.username
         self.password = collection.external_integration.password
+        # Unless we were told to import everything from scratch (or
+        # told otherwise), don't apply metadata that hasn't changed
+        # since it was last imported.
+        import_class_kwargs.setdefault('skip_unchanged', not force_reimport)
         self.importer = import_class(
             _db, collection=collection, **import_class_kwargs
         )
@@ -1796,8 +2484,26 @@ class OPDSImportMonitor(CollectionMonitor, HasSelfTests):
         Long timeout, raise error on anything but 2xx or 3xx.
         """
         headers = self._update_headers(headers)
-        kwargs = dict(timeout=120, allowed_response_codes=['2xx', '3xx'])
-        response = HTTP.get_with_timeout(url, headers=headers, **kwargs)
+        kwargs = dict(
+            timeout=120, allowed_response_codes=['2xx', '3xx', 429, 503],
+            session=self.http_session
+        )
+        for attempt in range(self.MAX_RETRIES+1):
+            with self.host_limiter.request(url):
+                response = HTTP.get_with_timeout(url, headers=headers, **kwargs)
+            if response.status_code not in (429, 503):
+                break
+
+            # The server wants us to slow down.
+            delay = HTTP.retry_after(response)
+            if (delay is None or delay > self.MAX_RETRY_AFTER
+                or attempt == self.MAX_RETRIES):
+                raise BadResponseException.bad_status_code(url, response)
+            self.log.info(
+                "%s asked us to wait %d seconds before trying again.",
+                url, delay
+            )
+            self.host_limiter.back_off(url, delay)
         return response.status_code, response.headers, response.content
 
     def _get_accept_header(self):
@@ -1850,24 +2556,74 @@ class OPDSImportMonitor(CollectionMonitor, HasSelfTests):
         # For every item in the last page of the feed, check when that
         # item was last updated.
         last_update_dates = self.importer.extract_last_update_dates(feed)
+        return len(self.urns_needing_import(last_update_dates)) > 0
 
-        new_data = False
-        for identifier, remote_updated in last_update_dates:
+    def urns_needing_import(self, last_update_dates):
+        """Find the entries on a page of an OPDS feed that have new
+        information, with one query for the Identifiers and one for
+        their CoverageRecords.
 
-            identifier, ignore = Identifier.parse_urn(self._db, identifier)
-            if not identifier:
+        :param last_update_dates: A list of 2-tuples (urn, last
+            updated), as returned by
+            OPDSImporter.extract_last_update_dates.
+
+        :return: A set of URNs from `last_update_dates`.
+        """
+        details_by_urn = dict()
+        for urn, remote_updated in last_update_dates:
+            try:
+                details = Identifier.prepare_foreign_type_and_identifier(
+                    *Identifier.type_and_identifier_for_urn(urn)
+                )
+            except ValueError, e:
+                details = None
+            if not details or not all(details):
                 # Maybe this is new, maybe not, but we can't associate
                 # the information with an Identifier, so we can't do
                 # anything about it.
                 self.log.info(
-                    "Ignoring %s because unable to turn into an Identifier."
+                    "Ignoring %s because unable to turn into an Identifier.",
+                    urn
                 )
                 continue
+            details_by_urn[urn] = details
 
-            if self.identifier_needs_import(identifier, remote_updated):
-                new_data = True
-                break
-        return new_data
+        # An entry whose Identifier isn't in the database yet can't
+        # have been imported, so there's no need to create it here.
+        identifiers_by_urn, ignore = Identifier.parse_urns(
+            self._db, details_by_urn.keys(),
+            autocreate=False
+        )
+        identifiers_by_details = dict(
+            ((x.type, x.identifier), x) for x in identifiers_by_urn.values()
+        )
+
+        records_by_identifier_id = dict()
+        if identifiers_by_details:
+            qu = self._db.query(CoverageRecord).filter(
+                CoverageRecord.identifier_id.in_(
+                    [x.id for x in identifiers_by_details.values()]
+                ),
+                CoverageRecord.data_source==self.importer.data_source,
+                CoverageRecord.operation==CoverageRecord.IMPORT_OPERATION,
+                CoverageRecord.collection==None,
+            )
+            for record in qu:
+                records_by_identifier_id.setdefault(record.identifier_id, record)
+
+        needs_import = set()
+        for urn, remote_updated in last_update_dates:
+            if urn not in details_by_urn:
+                continue
+            identifier = identifiers_by_details.get(details_by_urn[urn])
+            record = None
+            if identifier:
+                record = records_by_identifier_id.get(identifier.id)
+            if self.coverage_record_needs_import(
+                identifier or urn, record, remote_updated
+            ):
+                needs_import.add(urn)
+        return needs_import
 
     def identifier_needs_import(self, identifier, last_updated_remote):
         """Does the remote side have new information about this Identifier?
@@ -1883,7 +2639,23 @@ class OPDSImportMonitor(CollectionMonitor, HasSelfTests):
             identifier, self.importer.data_source,
             operation=CoverageRecord.IMPORT_OPERATION
         )
+        return self.coverage_record_needs_import(
+            identifier, record, last_updated_remote
+        )
 
+    def coverage_record_needs_import(self, identifier, record,
+                                     last_updated_remote):
+        """Given the CoverageRecord for an earlier attempt to import an
+        Identifier, decide whether the remote side has new information
+        about it.
+
+        :param identifier: An Identifier, or the URN of an Identifier
+            that's not in the database. Used only in log messages.
+        :param record: The IMPORT_OPERATION CoverageRecord for the
+            Identifier, or None if there isn't one.
+        :param last_update_remote: The last time the remote side updated
+            the OPDS entry for this Identifier.
+        """
         if not record:
             # We have no record of importing this Identifier. Import
             # it now.
@@ -1968,6 +2740,43 @@ class OPDSImportMonitor(CollectionMonitor, HasSelfTests):
             self.log.info("No new data.")
             return [], None
 
+    def follow_links(self, links):
+        """Follow a number of links.
+
+        If the collection allows it, the pages are requested
+        concurrently, but they're processed one at a time, in order.
+
+        :return: A list of 2-tuples (next_links, feed), one for each
+            link, as returned by follow_one_link.
+        """
+        if self.max_concurrent_requests <= 1 or len(links) <= 1:
+            return [self.follow_one_link(link) for link in links]
+
+        if not self._fetch_pool:
+            self._fetch_pool = Pool(self.max_concurrent_requests)
+
+        responses = {}
+        errors = {}
+        def fetch(url):
+            try:
+                responses[url] = self._get(url, {})
+            except Exception, e:
+                errors[url] = sys.exc_info()
+
+        for link in links:
+            self._fetch_pool.put(lambda link=link: fetch(link))
+        self._fetch_pool.join()
+
+        def prefetched(url, headers):
+            if url in errors:
+                # The request raised an exception. Raise it again,
+                # as though the request were happening now.
+                exc_type, exc_value, exc_traceback = errors[url]
+                raise exc_type, exc_value, exc_traceback
+            return responses[url]
+
+        return [self.follow_one_link(link, do_get=prefetched) for link in links]
+
     def import_one_feed(self, feed):
         """Import every book mentioned in an OPDS feed."""
 
@@ -2004,12 +2813,17 @@ class OPDSImportMonitor(CollectionMonitor, HasSelfTests):
         while queue:
             new_queue = []
 
+            links = []
             for link in queue:
-                if link in seen_links:
+                if link in seen_links or link in links:
                     continue
-                next_links, feed = self.follow_one_link(link)
+                links.append(link)
+
+            for link, (next_links, feed) in zip(links, self.follow_links(links)):
                 new_queue.extend(next_links)
                 if feed:
+                    if self.spool_feeds:
+                        feed = self.spool(feed)
                     feeds.append((link, feed))
                 seen_links.add(link)
 
@@ -2021,17 +2835,44 @@ class OPDSImportMonitor(CollectionMonitor, HasSelfTests):
 
         return feeds
 
+    def spool(self, feed):
+        """Write a page of an OPDS feed to a temporary file.
+
+        :return: The temporary file, ready to be read from the start.
+            The file goes away when it's closed.
+        """
+        if isinstance(feed, unicode):
+            feed = feed.encode("utf8")
+        spooled = tempfile.TemporaryFile()
+        spooled.write(feed)
+        spooled.seek(0)
+        return spooled
+
     def run_once(self, progress_ignore):
-        feeds = self._get_feeds()
+        feeds = []
         total_imported = 0
         total_failures = 0
 
-        for link, feed in feeds:
-            self.log.info("Importing next feed: %s", link)
-            imported_editions, failures = self.import_one_feed(feed)
-            total_imported += len(imported_editions)
-            total_failures += len(failures)
-            self._db.commit()
+        try:
+            feeds = list(self._get_feeds())
+            for link, feed in feeds:
+                self.log.info("Importing next feed: %s", link)
+                imported_editions, failures = self.import_one_feed(feed)
+                total_imported += len(imported_editions)
+                total_failures += len(failures)
+                self._db.commit()
+                if self.spool_feeds:
+                    feed.close()
+        finally:
+            if self.spool_feeds:
+                # Get rid of any pages we didn't get to.
+                for link, feed in feeds:
+                    feed.close()
+            if self._fetch_pool:
+                # The threads that fetched the pages aren't needed
+                # anymore.
+                self._fetch_pool.shutdown()
+                self._fetch_pool = None
 
         achievements = "Items imported: %d. Failures: %d." % (
             total_imported, total_failures
@@ -2,6 +2,7 @@ import functools
 import logging
 import urllib
 from contextlib import contextmanager
+from io import BytesIO
 from urlparse import urlsplit
 
 import boto3
@@ -15,7 +16,10 @@ from enum import Enum
 from flask_babel import lazy_gettext as _
 
 from mirror import MirrorUploader
-from model import ExternalIntegration
+from model import (
+    BlobStore,
+    ExternalIntegration,
+)
 from model.configuration import ConfigurationOption, ConfigurationGrouping, ConfigurationMetadata, \
     ConfigurationAttributeType
 
@@ -724,6 +728,63 @@ class MinIOUploader(S3Uploader):
 MirrorUploader.IMPLEMENTATION_REGISTRY[MinIOUploader.NAME] = MinIOUploader
 
 
+class S3BlobStore(BlobStore):
+    """Keeps Representation content in an S3 bucket, so it can be
+    shared between hosts that don't share a blob store directory.
+
+    Install one with BlobStore.set_instance().
+    """
+
+    # The error codes S3 uses to say an object doesn't exist.
+    NOT_FOUND = ('404', 'NoSuchKey', 'NotFound')
+
+    def __init__(self, uploader, bucket, prefix=u'blobs/'):
+        """Constructor.
+
+        :param uploader: An S3Uploader whose client will be used to
+            talk to S3.
+        :param bucket: The name of the bucket to store content in.
+        :param prefix: Keys in the bucket will start with this string.
+        """
+        self.client = uploader.client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _object_key(self, key):
+        return self.prefix + key
+
+    @classmethod
+    def _not_found(cls, e):
+        return e.response.get('Error', {}).get('Code') in cls.NOT_FOUND
+
+    def exists(self, key):
+        try:
+            self.client.head_object(
+                Bucket=self.bucket, Key=self._object_key(key)
+            )
+        except ClientError, e:
+            if self._not_found(e):
+                return False
+            raise
+        return True
+
+    def open(self, key):
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket, Key=self._object_key(key)
+            )
+        except ClientError, e:
+            if self._not_found(e):
+                return None
+            raise
+        return response['Body']
+
+    def _put(self, key, content):
+        self.client.put_object(
+            Bucket=self.bucket, Key=self._object_key(key), Body=content
+        )
+
+
 class MockS3Uploader(S3Uploader):
     """A dummy uploader for use in tests."""
 
@@ -805,6 +866,7 @@ class MockS3Client(object):
         self.config = config
         self.uploads = []
         self.parts = []
+        self.objects = {}
         self.fail_with = None
 
     def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, **kwargs):
@@ -840,3 +902,24 @@ class MockS3Client(object):
             ExpiresIn=3600,
             HttpMethod=None):
         return None
+
+    def _missing(self, operation):
+        return ClientError(
+            dict(Error=dict(Code='404', Message='Not Found')), operation
+        )
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self._missing('HeadObject')
+        return dict(ContentLength=len(self.objects[(Bucket, Key)]))
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self._missing('GetObject')
+        return dict(Body=BytesIO(self.objects[(Bucket, Key)]))
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if self.fail_with:
+            raise self.fail_with
+        self.objects[(Bucket, Key)] = Body
+        return dict(ETag="etag")
@@ -77,6 +77,7 @@ from model.configuration import ExternalIntegrationLink
 from monitor import (
     CollectionMonitor,
     ReaperMonitor,
+    SweepPartitionJob,
 )
 from opds_import import (
     OPDSImportMonitor,
@@ -318,6 +319,73 @@ class RunCollectionMonitorScript(RunMultipleMonitorsScript):
         return self.monitor_class.all(self._db, **kwargs)
 
 
+class RunPartitionedSweepMonitorScript(Script):
+    """Run a SweepMonitor on every relevant Collection, splitting each
+    sweep into ranges of IDs that are swept in parallel threads.
+
+    Each range is checkpointed separately, so if the script crashes,
+    the next run resumes every unfinished range where it left off.
+    """
+
+    DEFAULT_PARTITIONS = 4
+
+    def __init__(self, monitor_class, partitions=None, _db=None,
+                 **monitor_kwargs):
+        """Constructor.
+
+        :param monitor_class: A class object that derives from
+            SweepMonitor.
+        :param partitions: Split each sweep into this many ranges of IDs,
+            each swept in its own thread.
+        :param monitor_kwargs: Keyword arguments to pass into the
+            `monitor_class` constructor each time it's called.
+        """
+        super(RunPartitionedSweepMonitorScript, self).__init__(_db)
+        self.monitor_class = monitor_class
+        self.name = self.monitor_class.SERVICE_NAME
+        self.partition_count = partitions or self.DEFAULT_PARTITIONS
+        self.monitor_kwargs = monitor_kwargs
+        self.session_factory = SessionManager.sessionmaker(session=self._db)
+
+        # Use a database from the factory.
+        if not _db:
+            # Close the new, autogenerated database session.
+            self._session.close()
+        self._session = self.session_factory()
+
+    def do_run(self, pool=None):
+        """Run a partitioned sweep for every relevant Collection.
+
+        :param pool: A DatabasePool (or other) object for use in testing
+            environments.
+        """
+        for monitor in self.monitor_class.all(
+            self._db, **self.monitor_kwargs
+        ):
+            partitions = monitor.partitions(self.partition_count)
+            if not partitions:
+                continue
+            started_at = datetime.datetime.utcnow()
+
+            # Without a commit, the workers may block on the queries
+            # that found the partitions.
+            self._db.commit()
+            with (
+                pool or DatabasePool(len(partitions), self.session_factory)
+            ) as job_queue:
+                for partition in partitions:
+                    job = SweepPartitionJob(
+                        self.monitor_class, monitor.collection, partition,
+                        **self.monitor_kwargs
+                    )
+                    job_queue.put(job)
+
+            # The workers have their own sessions, so make sure we
+            # see what they wrote.
+            self._db.expire_all()
+            monitor.finish_partitioned_sweep(partitions, started_at)
+
+
 class RunReaperMonitorsScript(RunMultipleMonitorsScript):
     """Run all the monitors found in ReaperMonitor.REGISTRY"""
 
@@ -1524,17 +1592,10 @@ class AddClassificationScript(IdentifierInputScript):
         )
 
     def do_run(self):
-        policy = PresentationCalculationPolicy(
-            choose_edition=False,
-            set_edition_metadata=False,
-            classify=True,
-            choose_summary=False,
-            calculate_quality=False,
-            choose_cover=False,
-            regenerate_opds_entries=True,
-            regenerate_marc_record=True,
-            update_search_index=True,
-            verbose=True,
+        # Only the classification needs to be recalculated. If it
+        # changes, everything generated from it will be regenerated.
+        policy = PresentationCalculationPolicy.for_changes(
+            PresentationCalculationPolicy.SUBJECT_CHANGE, verbose=True
         )
         if self.subject:
             for identifier in self.identifiers:
@@ -1619,12 +1680,16 @@ class WorkProcessingScript(IdentifierInputScript):
         offset = 0
         while works:
             works = self.query.offset(offset).limit(self.batch_size).all()
-            for work in works:
-                self.process_work(work)
+            self.process_works(works)
             offset += self.batch_size
             self._db.commit()
         self._db.commit()
 
+    def process_works(self, works):
+        """Process a batch of Works."""
+        for work in works:
+            self.process_work(work)
+
     def process_work(self, work):
         raise NotImplementedError()
 
@@ -1700,6 +1765,11 @@ class WorkClassificationScript(WorkPresentationScript):
         update_search_index=False,
     )
 
+    def process_works(self, works):
+        # Classify the whole batch at once rather than one Work at
+        # a time.
+        Work.classify_in_bulk(self._db, works, policy=self.policy)
+
 
 class ReclassifyWorksForUncheckedSubjectsScript(WorkClassificationScript):
     """Reclassify all Works whose current classifications appear to
@@ -1845,18 +1915,40 @@ class OPDSImportScript(CollectionInputScript):
             help='Import the feed from scratch, even if it seems like it was already imported.',
             dest='force', action='store_true'
         )
+        parser.add_argument(
+            '--spool-feeds',
+            help='Keep downloaded pages of the feed in temporary files rather than in memory until they are imported.',
+            dest='spool_feeds', action='store_true'
+        )
+        parser.add_argument(
+            '--processes',
+            help='Divide the entries on each page of the feed between this many worker processes.',
+            dest='worker_processes', type=int, default=1
+        )
         return parser
 
     def do_run(self, cmd_args=None):
         parsed = self.parse_command_line(self._db, cmd_args=cmd_args)
         collections = parsed.collections or Collection.by_protocol(self._db, self.protocol)
         for collection in collections:
-            self.run_monitor(collection, force=parsed.force)
+            self.run_monitor(
+                collection, force=parsed.force, spool_feeds=parsed.spool_feeds,
+                worker_processes=parsed.worker_processes
+            )
 
-    def run_monitor(self, collection, force=None):
+    def run_monitor(self, collection, force=None, spool_feeds=False,
+                    worker_processes=1):
+        kwargs = dict(force_reimport=force)
+        # Leave these out unless they're needed, so monitor and
+        # importer classes that don't accept them keep working.
+        if spool_feeds:
+            kwargs['spool_feeds'] = spool_feeds
+        if worker_processes > 1:
+            # This is passed through to the importer.
+            kwargs['worker_processes'] = worker_processes
         monitor = self.monitor_class(
             self._db, collection, import_class=self.importer_class,
-            force_reimport=force
+            **kwargs
         )
         monitor.run()
 
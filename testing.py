@@ -17,6 +17,7 @@ from nose.tools import (
 # from psycopg2.errors import UndefinedTable
 from sqlalchemy.orm.session import Session
 from sqlalchemy.exc import ProgrammingError
+from analytics import Analytics
 from config import Configuration
 
 from lane import (
@@ -32,6 +33,7 @@ from model import (
 )
 
 from model import (
+    BlobStore,
     CoverageRecord,
     Classification,
     Collection,
@@ -57,7 +59,9 @@ from model import (
     Representation,
     Resource,
     RightsStatus,
+    SortNameMemo,
     Subject,
+    SubjectClassificationMemo,
     Work,
     WorkCoverageRecord,
 )
@@ -204,6 +208,7 @@ class DatabaseTest(object):
         cls.old_data_dir = Configuration.data_directory
         cls.tmp_data_dir = tempfile.mkdtemp(dir="/tmp")
         Configuration.instance[Configuration.DATA_DIRECTORY] = cls.tmp_data_dir
+        BlobStore.reset()
 
         # Avoid CannotLoadConfiguration errors related to CDN integrations.
         Configuration.instance[Configuration.INTEGRATIONS] = Configuration.instance.get(
@@ -271,6 +276,15 @@ class DatabaseTest(object):
         ExternalIntegration.reset_cache()
         Genre.reset_cache()
         Library.reset_cache()
+        SortNameMemo.reset_cache()
+        SubjectClassificationMemo.reset_cache()
+        Analytics.reset_registry()
+
+        # The blob store may have been replaced for this test.
+        BlobStore.reset()
+
+        # Start counting presentation calculation work from zero.
+        Work.presentation_calculation_stats.reset()
 
         # Also roll back any record of those changes in the
         # Configuration instance.
@@ -75,6 +75,25 @@ class TestGenreData(object):
 
 class TestClassifier(object):
 
+    def test_version(self):
+        version = Classifier.version()
+        eq_(40, len(version))
+
+        # The version is only calculated once.
+        eq_(version, Classifier._version)
+        eq_(version, Classifier.version())
+
+        # If the rules can't be read, there's no version.
+        old_resources = Classifier.RULES_RESOURCES
+        try:
+            Classifier._version = None
+            Classifier.RULES_RESOURCES = ["no-such-file"]
+            eq_(None, Classifier.version())
+        finally:
+            Classifier.RULES_RESOURCES = old_resources
+            Classifier._version = None
+        eq_(version, Classifier.version())
+
     def test_default_target_age_for_audience(self):
 
         eq_(
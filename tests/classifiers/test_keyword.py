@@ -2,7 +2,10 @@ from nose.tools import eq_, set_trace
 from ... import classifier
 from ...classifier import *
 from ...classifier.keyword import (
+    Eg,
     KeywordBasedClassifier as Keyword,
+    KeywordTable,
+    match_kw,
     LCSHClassifier as LCSH,
     FASTClassifier as FAST,
 )
@@ -107,6 +110,57 @@ class TestKeyword(object):
         (genre, match) = Keyword.genre_match("cats")
         eq_(None, genre)
 
+    def test_match_kw(self):
+        search = match_kw("fiction", Eg("stories"))["search"]
+        eq_("Fiction", search("Science Fiction").group())
+        eq_("stories", search("Short stories").group())
+        eq_(None, search("Short stories", exclude_examples=True))
+        eq_(None, search("Fictional"))
+
+        # A list made entirely of examples never matches when
+        # examples are excluded.
+        search = match_kw(Eg("stories"))["search"]
+        eq_(None, search("Short stories", exclude_examples=True))
+
+    def test_matching_genres(self):
+        table = KeywordTable({
+            classifier.Science_Fiction: match_kw("science fiction"),
+            classifier.Military_SF: match_kw(
+                "science fiction.*military", Eg("space warfare")
+            ),
+            classifier.History: match_kw("history (modern)"),
+            None: match_kw("children of"),
+            classifier.Horror: None,
+        })
+
+        # Every matching genre is found, even when their keywords
+        # overlap.
+        eq_(
+            set([classifier.Science_Fiction, classifier.Military_SF]),
+            table.matching_genres("science fiction / military")
+        )
+        eq_(set([classifier.History]), table.matching_genres("History Modern"))
+        eq_(set([None]), table.matching_genres("children of the corn"))
+
+        eq_(set([classifier.Military_SF]), table.matching_genres("space warfare"))
+        eq_(set(), table.matching_genres("space warfare", exclude_examples=True))
+
+        eq_(set(), table.matching_genres("cooking"))
+        eq_(set(), table.matching_genres(None))
+
+        # The real tables agree with searching for each genre's
+        # keywords separately.
+        for name in ["science fiction military", "world history",
+                     "asian history", "cats", "social life and customs"]:
+            for table in [Keyword.LEVEL_3_KEYWORDS, Keyword.LEVEL_2_KEYWORDS,
+                          Keyword.CATCHALL_KEYWORDS]:
+                for exclude_examples in (True, False):
+                    expect = set(
+                        genre for genre, keywords in table.items()
+                        if keywords and keywords["search"](name, exclude_examples)
+                    )
+                    eq_(expect, table.matching_genres(name, exclude_examples))
+
     def test_improvements(self):
         """A place to put tests for miscellaneous improvements added
         since the original work.
@@ -0,0 +1,124 @@
+# encoding: utf-8
+from nose.tools import (
+    eq_,
+    set_trace,
+)
+import mmap
+import os
+import shutil
+import tempfile
+
+from .. import DatabaseTest
+from ...config import Configuration
+from ...model.blobstore import (
+    BlobStore,
+    LocalBlobStore,
+    MappedFile,
+)
+
+class TestLocalBlobStore(object):
+
+    def setup(self):
+        self.root = tempfile.mkdtemp()
+        self.store = LocalBlobStore(self.root)
+
+    def teardown(self):
+        shutil.rmtree(self.root)
+
+    def test_put_and_get(self):
+        content = b"some content"
+        key = self.store.put(content)
+        eq_(BlobStore.key(content), key)
+
+        # The content is stored in a file named after the key.
+        path = self.store.path(key)
+        eq_(os.path.join(self.root, key[:2], key[2:4], key), path)
+        eq_(content, open(path, "rb").read())
+
+        eq_(True, self.store.exists(key))
+        eq_(content, self.store.get(key))
+
+        # Content that isn't there is treated as missing.
+        eq_(False, self.store.exists("nosuchkey"))
+        eq_(None, self.store.open("nosuchkey"))
+        eq_(None, self.store.get("nosuchkey"))
+
+    def test_put_is_deduplicated(self):
+        key = self.store.put(b"content")
+        path = self.store.path(key)
+        mtime = os.stat(path).st_mtime
+
+        class NoWrites(LocalBlobStore):
+            def _put(self, key, content):
+                raise Exception("Content was written twice.")
+
+        # Putting the same content again doesn't write it again.
+        eq_(key, NoWrites(self.root).put(b"content"))
+        eq_(mtime, os.stat(path).st_mtime)
+
+        # Different content gets a different key.
+        assert self.store.put(b"other content") != key
+
+        # No temporary files were left behind.
+        eq_([key], os.listdir(os.path.dirname(path)))
+
+    def test_open(self):
+        key = self.store.put(b"some content")
+        fh = self.store.open(key)
+
+        # The file is memory-mapped, not read into memory.
+        assert isinstance(fh, MappedFile)
+        assert isinstance(fh.mmap, mmap.mmap)
+
+        # It can be read like a file.
+        eq_(b"some", fh.read(4))
+        eq_(b" content", fh.read())
+        eq_(b"", fh.read())
+        fh.seek(0)
+        eq_(b"some content", fh.read())
+        fh.close()
+
+        # An empty file can't be memory-mapped, but it can still be
+        # opened.
+        key = self.store.put(b"")
+        eq_(b"", self.store.open(key).read())
+
+
+class TestBlobStoreInstance(DatabaseTest):
+
+    def _configure(self, directory):
+        Configuration.instance[Configuration.BLOB_STORE_DIRECTORY] = directory
+        BlobStore.reset()
+
+    def teardown(self):
+        Configuration.instance.pop(Configuration.BLOB_STORE_DIRECTORY, None)
+        super(TestBlobStoreInstance, self).teardown()
+
+    def test_instance(self):
+        # By default, there's no blob store, and content is kept in
+        # the database.
+        self._configure(None)
+        eq_(None, BlobStore.instance())
+
+        # A blob store is used once a directory is configured for it.
+        directory = os.path.join(self.tmp_data_dir, "blobs")
+        self._configure(directory)
+        store = BlobStore.instance()
+        assert isinstance(store, LocalBlobStore)
+        eq_(directory, store.root)
+
+        # The same store is used every time.
+        assert store is BlobStore.instance()
+
+        # Another store can be installed.
+        other = LocalBlobStore(self.tmp_data_dir)
+        BlobStore.set_instance(other)
+        assert other is BlobStore.instance()
+
+        # Or content can be kept in the database.
+        BlobStore.set_instance(None)
+        eq_(None, BlobStore.instance())
+
+        # reset() goes back to the configured store.
+        BlobStore.reset()
+        eq_(directory, BlobStore.instance().root)
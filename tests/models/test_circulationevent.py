@@ -11,7 +11,10 @@ from ...model import (
     create,
     get_one_or_create
 )
-from ...model.circulationevent import CirculationEvent
+from ...model.circulationevent import (
+    CirculationEvent,
+    CirculationEventBuffer,
+)
 from ...model.datasource import DataSource
 from ...model.identifier import Identifier
 from ...model.licensing import LicensePool
@@ -220,3 +223,104 @@ class TestCirculationEvent(DatabaseTest):
             **kwargs
         )
         self._db.rollback()
+
+    def test_bulk_log(self):
+        pool = self._licensepool(edition=None)
+        library = self._default_library
+        start = datetime.datetime(2019, 1, 1)
+        end = datetime.datetime(2019, 1, 2)
+
+        # An event that's already in the database.
+        existing, ignore = CirculationEvent.log(
+            self._db, pool, CirculationEvent.DISTRIBUTOR_CHECKOUT, 10, 8,
+            start=start, library=library
+        )
+
+        events = [
+            # The same event, reported again with different values.
+            dict(license_pool=pool,
+                 event_name=CirculationEvent.DISTRIBUTOR_CHECKOUT,
+                 old_value=500, new_value=200, start=start, library=library),
+
+            # A new event with no library.
+            dict(license_pool=pool,
+                 event_name=CirculationEvent.DISTRIBUTOR_CHECKIN,
+                 old_value=8, new_value=9, start=start, end=end,
+                 location="Westgate Branch"),
+        ]
+
+        # Only the new event was recorded.
+        eq_(1, CirculationEvent.bulk_log(self._db, events))
+        eq_(0, CirculationEvent.bulk_log(self._db, []))
+        self._db.expire_all()
+
+        eq_(-2, existing.delta)
+        [new] = self._db.query(CirculationEvent).filter(
+            CirculationEvent.type==CirculationEvent.DISTRIBUTOR_CHECKIN
+        ).all()
+        eq_(pool, new.license_pool)
+        eq_(None, new.library)
+        eq_(1, new.delta)
+        eq_(start, new.start)
+        eq_(end, new.end)
+        eq_("Westgate Branch", new.location)
+
+    def test_buffer(self):
+        pool = self._licensepool(edition=None)
+        buffer = CirculationEventBuffer(self._db, batch_size=2)
+        start = datetime.datetime(2019, 1, 1)
+        with buffer:
+            buffer.log(pool, CirculationEvent.DISTRIBUTOR_CHECKOUT, 1, 0,
+                       start=start)
+            eq_(1, len(buffer.events))
+            eq_(0, self._db.query(CirculationEvent).count())
+
+            # Reaching the batch size flushes the buffer. This event is
+            # a duplicate of the first one, so it's ignored.
+            buffer.log(pool, CirculationEvent.DISTRIBUTOR_CHECKOUT, 1, 0,
+                       start=start)
+            eq_([], buffer.events)
+            eq_(1, buffer.recorded)
+
+            buffer.log(pool, CirculationEvent.DISTRIBUTOR_CHECKIN, 0, 1,
+                       start=start)
+
+        # Leaving the context manager recorded the remaining event.
+        eq_([], buffer.events)
+        eq_(2, buffer.recorded)
+        eq_(2, self._db.query(CirculationEvent).count())
+
+    def test_month_bounds(self):
+        m = CirculationEvent.month_bounds
+        eq_((datetime.datetime(2019, 5, 1), datetime.datetime(2019, 6, 1)),
+            m(datetime.datetime(2019, 5, 17, 12, 30)))
+        eq_((datetime.datetime(2019, 12, 1), datetime.datetime(2020, 1, 1)),
+            m(datetime.date(2019, 12, 31)))
+
+    def test_create_partition(self):
+        eq_(True, CirculationEvent.is_partitioned(self._db))
+
+        # An event is logged for a month that doesn't have a
+        # partition, so it goes into the default partition.
+        pool = self._licensepool(edition=None)
+        start = datetime.datetime(1999, 5, 17)
+        event, ignore = CirculationEvent.log(
+            self._db, pool, CirculationEvent.DISTRIBUTOR_CHECKOUT, 1, 0,
+            start=start
+        )
+        eq_([datetime.datetime(1999, 5, 1)],
+            CirculationEvent.months_in_default_partition(self._db))
+
+        # Creating a partition for that month moves the event into
+        # the new partition.
+        name = CirculationEvent.create_partition(self._db, start)
+        eq_("circulationevents_1999_05", name)
+        assert (name, datetime.datetime(1999, 5, 1),
+                datetime.datetime(1999, 6, 1)) in CirculationEvent.partitions(self._db)
+        eq_([], CirculationEvent.months_in_default_partition(self._db))
+        self._db.expire_all()
+        eq_([event], self._db.query(CirculationEvent).filter(
+            CirculationEvent.start==start).all())
+
+        # Creating it again does nothing.
+        eq_(name, CirculationEvent.create_partition(self._db, start))
@@ -8,6 +8,7 @@ from nose.tools import (
 from psycopg2.extras import NumericRange
 from sqlalchemy.exc import IntegrityError
 from .. import DatabaseTest
+from ... import classifier
 from ...classifier import Classifier
 from ...model import (
     create,
@@ -16,6 +17,7 @@ from ...model import (
 )
 from ...model.classification import (
     Subject,
+    SubjectClassificationMemo,
     Genre,
 )
 
@@ -70,6 +72,47 @@ class TestSubject(DatabaseTest):
         assert subject in [s1, s2]
         eq_(False, is_new)
 
+    def test_lookup_many(self):
+        existing = self._subject(Subject.TAG, "existing")
+        by_name = self._subject(Subject.TAG, "i1")
+        by_name.name = "A tag"
+
+        keys = [
+            (Subject.TAG, "existing", "A name for an existing subject"),
+            (Subject.TAG, "new", None),
+            (Subject.TAG, "new", "A name for a new subject"),
+            (Subject.DDC, "new", None),
+            (Subject.TAG, None, "A tag"),
+        ]
+        subjects = Subject.lookup_many(self._db, keys)
+        eq_(set(keys), set(subjects.keys()))
+
+        # An existing Subject was found, and got a name.
+        eq_(existing, subjects[keys[0]])
+        eq_("A name for an existing subject", existing.name)
+
+        # A new Subject was created, and also got a name.
+        new = subjects[keys[1]]
+        eq_(new, subjects[keys[2]])
+        eq_((Subject.TAG, "new", "A name for a new subject"),
+            (new.type, new.identifier, new.name))
+        eq_(False, new.checked)
+
+        # Type and identifier together identify a Subject.
+        assert subjects[keys[3]] != new
+        eq_(Subject.DDC, subjects[keys[3]].type)
+
+        # A Subject can be looked up by name alone.
+        eq_(by_name, subjects[keys[4]])
+
+        # Looking up the same Subjects again finds the same Subjects.
+        eq_(subjects, Subject.lookup_many(self._db, keys))
+
+        assert_raises_regexp(
+            ValueError, "Cannot look up Subject with no type.",
+            Subject.lookup_many, self._db, [(None, "identifier", "name")]
+        )
+
     def test_assign_to_genre_can_remove_genre(self):
         # Here's a Subject that identifies children's books.
         subject, was_new = Subject.lookup(self._db, Subject.TAG, "Children's books", None)
@@ -88,6 +131,91 @@ class TestSubject(DatabaseTest):
         eq_(None, subject.genre)
         eq_(None, subject.fiction)
 
+class TestSubjectClassificationMemo(DatabaseTest):
+
+    def test_classify(self):
+        calls = []
+        class MockClassifier(Classifier):
+            @classmethod
+            def classify(cls, subject):
+                calls.append(subject)
+                return (
+                    classifier.Science_Fiction, Classifier.AUDIENCE_YOUNG_ADULT,
+                    (14, 17), True
+                )
+        expect = (
+            classifier.Science_Fiction, Classifier.AUDIENCE_YOUNG_ADULT,
+            (14, 17), True
+        )
+
+        subject = self._subject(Subject.TAG, "a tag")
+        eq_(expect, SubjectClassificationMemo.classify(MockClassifier, subject))
+        eq_([subject], calls)
+
+        # The answer was stored in the database.
+        [memo] = self._db.query(SubjectClassificationMemo).all()
+        eq_((Subject.TAG, "a tag", "", Classifier.version()),
+            (memo.type, memo.identifier, memo.name, memo.classifier_version))
+        eq_("Science Fiction", memo.genre)
+        eq_(expect, memo.result)
+
+        # The next time, the answer comes from memory.
+        eq_(expect, SubjectClassificationMemo.classify(MockClassifier, subject))
+        eq_(1, len(calls))
+
+        # Once the answer has been forgotten by this process, it's
+        # found in the database.
+        SubjectClassificationMemo.reset_cache()
+        eq_(expect, SubjectClassificationMemo.classify(MockClassifier, subject))
+        eq_(1, len(calls))
+
+        # A subject with a different name gets classified.
+        subject.name = "a name"
+        SubjectClassificationMemo.classify(MockClassifier, subject)
+        eq_(2, len(calls))
+
+        # So does the same subject, once the classification rules
+        # change.
+        SubjectClassificationMemo.reset_cache()
+        old_version = Classifier._version
+        try:
+            Classifier._version = u"a new version"
+            SubjectClassificationMemo.classify(MockClassifier, subject)
+            eq_(3, len(calls))
+        finally:
+            Classifier._version = old_version
+        eq_(3, self._db.query(SubjectClassificationMemo).count())
+
+    def test_result(self):
+        memo = SubjectClassificationMemo(
+            genre=None, audience=None, target_age=None, fiction=None
+        )
+        eq_((None, None, None, None), memo.result)
+
+        memo.target_age = NumericRange(None, None, '[]')
+        eq_((None, None), memo.result[2])
+
+        memo.target_age = NumericRange(5, 9, '[)')
+        memo.genre = "Drama"
+        eq_((classifier.Drama, None, (5, 8), None), memo.result)
+
+    def test_assign_to_genres(self):
+        # Subjects classified by assign_to_genres use the stored
+        # answers, which are looked up in one batch.
+        subject = self._subject(Subject.TAG, "Science Fiction")
+        subject.assign_to_genre()
+        eq_("Science Fiction", subject.genre.name)
+        eq_(1, self._db.query(SubjectClassificationMemo).count())
+
+        SubjectClassificationMemo.reset_cache()
+        subject.checked = False
+        subject.genre = None
+        Subject.assign_to_genres(self._db)
+        eq_(True, subject.checked)
+        eq_("Science Fiction", subject.genre.name)
+        eq_(1, SubjectClassificationMemo._cache.hits)
+
+
 class TestGenre(DatabaseTest):
 
     def test_full_table_cache(self):
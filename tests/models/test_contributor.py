@@ -5,7 +5,12 @@ from nose.tools import (
 )
 from .. import DatabaseTest
 from ...model import get_one_or_create
-from ...model.contributor import Contributor
+from ...model.contributor import (
+    Contribution,
+    Contributor,
+    ContributorResolver,
+    SortNameMemo,
+)
 from ...model.datasource import DataSource
 from ...model.edition import Edition
 from ...model.identifier import Identifier
@@ -205,3 +210,160 @@ class TestContributor(DatabaseTest):
         # test that human name parser doesn't die badly on foreign names
         bob, ignore = self._contributor(sort_name=u"Боб  Битшифтер")
         eq_(u"Битшифтер, Боб", bob.sort_name)
+
+
+class TestContributorResolver(DatabaseTest):
+
+    def test_resolve(self):
+        # Two Contributors share a name; another has a VIAF number.
+        bob1, ignore = self._contributor(sort_name=u"Bitshifter, Bob")
+        bob2 = Contributor(sort_name=u"Bitshifter, Bob")
+        self._db.add(bob2)
+        [viaf], ignore = Contributor.lookup(
+            self._db, sort_name=u"Viaf, Vera", viaf=u"123"
+        )
+
+        resolver = ContributorResolver(self._db)
+        resolver.resolve([
+            (u"Bitshifter, Bob", None, None),
+            (u"Someone Else", u"", None),
+            (None, None, u"123"),
+            (u"Lc, Larry", u"456", None),
+            (u"Lc, Lawrence", u"456", None),
+            (None, None, None),
+        ])
+
+        # A name lookup finds the first Contributor with that name,
+        # just as Contributor.lookup does.
+        eq_(bob1, resolver.lookup(u"Bitshifter, Bob"))
+
+        # A Contributor is found by VIAF number no matter what name
+        # is given.
+        eq_(viaf, resolver.lookup(None, None, u"123"))
+        eq_(viaf, resolver.lookup(u"Another Name", None, u"123"))
+
+        # Contributors that didn't exist were created. Two keys with
+        # the same LC number got the same new Contributor.
+        #
+        # A new Contributor's sort name goes through the same
+        # Contributor.sort_name setter as one created by
+        # Contributor.lookup, so a name given in display order is
+        # stored in sort order. The resolver still finds it under the
+        # name it was given.
+        someone = resolver.lookup(u"Someone Else")
+        eq_(u"Else, Someone", someone.sort_name)
+        eq_([someone], self._db.query(Contributor).filter(
+            Contributor.sort_name==u"Else, Someone").all())
+        larry = resolver.lookup(u"Lc, Larry", u"456")
+        eq_((u"Lc, Larry", u"456"), (larry.sort_name, larry.lc))
+        eq_(larry, resolver.lookup(u"Lc, Lawrence", u"456"))
+        assert larry.id is not None
+
+        # A key with no identifying information is ignored.
+        eq_(None, resolver.lookup())
+
+    def test_add_contributions(self):
+        edition = self._edition()
+        [existing] = edition.contributions
+        author = existing.contributor
+        illustrator, ignore = self._contributor()
+
+        resolver = ContributorResolver(self._db)
+        resolver.add_contributions(edition, [
+            (author, existing.role),
+            (illustrator, Contributor.ILLUSTRATOR_ROLE),
+            (illustrator, Contributor.ILLUSTRATOR_ROLE),
+        ])
+
+        # The existing Contribution was left alone, and the
+        # duplicate was ignored.
+        eq_(
+            set([(author, existing.role),
+                 (illustrator, Contributor.ILLUSTRATOR_ROLE)]),
+            set((x.contributor, x.role) for x in edition.contributions)
+        )
+        eq_(2, len(edition.contributions))
+        [contribution] = illustrator.contributions
+        eq_(edition, contribution.edition)
+
+class TestSortNameMemo(DatabaseTest):
+
+    def test_lookup_and_remember(self):
+        eq_(None, SortNameMemo.lookup(self._db, u"Mark Twain"))
+
+        SortNameMemo.remember(
+            self._db, u"Mark Twain", u"Twain, Mark", SortNameMemo.GUESS
+        )
+        eq_(u"Twain, Mark", SortNameMemo.lookup(self._db, u"Mark Twain"))
+
+        # A guess made without asking the canonicalizer doesn't count
+        # if the canonicalizer could be asked.
+        eq_(None, SortNameMemo.lookup(
+            self._db, u"Mark Twain", canonicalizer_available=True
+        ))
+
+        # The memo is in the database, not just in this process.
+        SortNameMemo.reset_cache()
+        [memo] = self._db.query(SortNameMemo).all()
+        eq_((u"Mark Twain", u"Twain, Mark", SortNameMemo.GUESS, False),
+            (memo.display_name, memo.sort_name, memo.source,
+             memo.asked_canonicalizer))
+
+        # Remembering a better answer replaces the old one.
+        SortNameMemo.remember(
+            self._db, u"Mark Twain", u"Clemens, Samuel",
+            SortNameMemo.CANONICALIZER, asked_canonicalizer=True
+        )
+        SortNameMemo.reset_cache()
+        eq_(u"Clemens, Samuel", SortNameMemo.lookup(
+            self._db, u"Mark Twain", canonicalizer_available=True
+        ))
+        eq_(1, self._db.query(SortNameMemo).count())
+
+        # Nothing is remembered without a sort name.
+        SortNameMemo.remember(
+            self._db, u"Nobody", None, SortNameMemo.GUESS
+        )
+        eq_(None, SortNameMemo.lookup(self._db, u"Nobody"))
+
+    def test_forgotten_when_contributor_changes(self):
+        twain, ignore = self._contributor(sort_name=u"Twain, Mark")
+        twain.display_name = u"Mark Twain"
+        self._db.flush()
+        SortNameMemo.remember(
+            self._db, u"Mark Twain", u"Twain, Mark",
+            SortNameMemo.EXISTING_CONTRIBUTOR
+        )
+        SortNameMemo.remember(
+            self._db, u"M. Twain", u"Twain, Mark", SortNameMemo.CANONICALIZER
+        )
+        SortNameMemo.remember(
+            self._db, u"Jane Doe", u"Doe, Jane", SortNameMemo.GUESS
+        )
+        eq_(u"Twain, Mark", SortNameMemo.lookup(self._db, u"Mark Twain"))
+
+        # Changing something other than the Contributor's name
+        # doesn't affect any memos.
+        twain.viaf = u"50566653"
+        self._db.flush()
+        eq_(3, self._db.query(SortNameMemo).count())
+
+        # When the Contributor's sort name changes, memos for its
+        # display name, and memos that found its old sort name, are
+        # forgotten -- both in the database and in this process.
+        twain.sort_name = u"Clemens, Samuel"
+        self._db.flush()
+        eq_(None, SortNameMemo.lookup(self._db, u"Mark Twain"))
+        eq_(None, SortNameMemo.lookup(self._db, u"M. Twain"))
+        eq_(u"Doe, Jane", SortNameMemo.lookup(self._db, u"Jane Doe"))
+        eq_([u"Jane Doe"],
+            [x.display_name for x in self._db.query(SortNameMemo)])
+
+        # The same happens when the display name changes.
+        SortNameMemo.remember(
+            self._db, u"Mark Twain", u"Clemens, Samuel",
+            SortNameMemo.EXISTING_CONTRIBUTOR
+        )
+        twain.display_name = u"Samuel Clemens"
+        self._db.flush()
+        eq_(None, SortNameMemo.lookup(self._db, u"Mark Twain"))
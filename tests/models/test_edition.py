@@ -502,6 +502,28 @@ class TestEdition(DatabaseTest):
         edition.calculate_permanent_work_id()
         eq_(None, edition.permanent_work_id)
 
+    def test_calculate_permanent_work_id_only_if_changed(self):
+        edition = self._edition(title=u"The Title", authors=u"Author, An")
+        edition.calculate_permanent_work_id()
+        original = edition.permanent_work_id
+        assert original is not None
+        assert edition.permanent_work_id_input_hash is not None
+
+        # If the inputs haven't changed, the ID isn't recalculated.
+        edition.permanent_work_id = u"not recalculated"
+        edition.calculate_permanent_work_id(only_if_changed=True)
+        eq_(u"not recalculated", edition.permanent_work_id)
+
+        # If they have, it is.
+        edition.title = u"A New Title"
+        edition.calculate_permanent_work_id(only_if_changed=True)
+        assert edition.permanent_work_id not in (original, u"not recalculated")
+
+        # Losing the title counts as a change.
+        edition.title = None
+        edition.calculate_permanent_work_id(only_if_changed=True)
+        eq_(None, edition.permanent_work_id)
+
     def test_choose_cover_can_choose_full_image_and_thumbnail_separately(self):
         edition = self._edition()
 
@@ -8,15 +8,29 @@ from nose.tools import (
 import datetime
 import feedparser
 from lxml import etree
+from sqlalchemy import func
+from sqlalchemy.sql import (
+    select,
+    text,
+)
 from .. import DatabaseTest
-from ...model import PresentationCalculationPolicy
+from ...model import (
+    PresentationCalculationPolicy,
+    get_one,
+)
+from ...model.classification import Subject
 from ...model.datasource import DataSource
 from ...model.edition import Edition
-from ...model.identifier import Identifier
+from ...model.identifier import (
+    Identifier,
+    IdentifierResolver,
+    RecursiveEquivalencyCache,
+)
 from ...model.resource import (
     Hyperlink,
     Representation,
 )
+from ...metadata_layer import SubjectData
 
 class TestIdentifier(DatabaseTest):
 
@@ -470,6 +484,55 @@ class TestIdentifier(DatabaseTest):
                  level_3_equivalent.id]),
             set(equivalent_ids))
 
+    def test_classify_many(self):
+        identifier = self._identifier()
+        source = DataSource.lookup(self._db, DataSource.OVERDRIVE)
+        other_source = DataSource.lookup(self._db, DataSource.AXIS_360)
+        kept = identifier.classify(source, Subject.TAG, "kept", weight=10)
+        reweighted = identifier.classify(source, Subject.TAG, "reweighted")
+        stale = identifier.classify(source, Subject.TAG, "stale")
+        other = identifier.classify(other_source, Subject.TAG, "stale")
+
+        subjects = [
+            SubjectData(Subject.TAG, "kept", weight=10),
+            SubjectData(Subject.TAG, "reweighted", weight=5),
+            SubjectData(Subject.TAG, "new", "A new subject", weight=2),
+        ]
+        eq_(True, identifier.classify_many(source, subjects))
+
+        def current():
+            return sorted(
+                (x.data_source.name, x.subject.identifier, x.weight)
+                for x in identifier.classifications
+            )
+        expect = [
+            (DataSource.AXIS_360, "stale", 1),
+            (DataSource.OVERDRIVE, "kept", 10),
+            (DataSource.OVERDRIVE, "new", 2),
+            (DataSource.OVERDRIVE, "reweighted", 5),
+            (DataSource.OVERDRIVE, "stale", 1),
+        ]
+        eq_(expect, current())
+
+        # The existing Classification objects were updated.
+        eq_(5, reweighted.weight)
+        assert kept in identifier.classifications
+
+        # Doing it again changes nothing.
+        eq_(False, identifier.classify_many(source, subjects))
+
+        # Replacing the classifications from a data source removes
+        # the old ones from that source, but not from other sources.
+        eq_(True, identifier.classify_many(source, subjects, replace=True))
+        expect.remove((DataSource.OVERDRIVE, "stale", 1))
+        eq_(expect, current())
+        assert stale not in self._db
+        assert other in identifier.classifications
+
+        # Replacing with nothing removes everything from that source.
+        eq_(True, identifier.classify_many(source, [], replace=True))
+        eq_([(DataSource.AXIS_360, "stale", 1)], current())
+
     def test_licensed_through_collection(self):
         c1 = self._default_collection
         c2 = self._collection()
@@ -681,3 +744,226 @@ class TestIdentifier(DatabaseTest):
         # And the updated time has been changed accordingly.
         expected = thumbnail.resource.representation.mirrored_at
         eq_(format_timestamp(even_later), entry.updated)
+
+
+class TestIdentifierResolver(DatabaseTest):
+
+    def test_resolve(self):
+        existing = self._identifier()
+        isbn10_urn = "urn:isbn:1453219536"
+        new_urn = Identifier.URN_SCHEME_PREFIX + "Overdrive%20ID/nosuchidentifier"
+        fake_urn = "what_even_is_this"
+        urns = [existing.urn, isbn10_urn, new_urn, fake_urn]
+
+        resolver = IdentifierResolver(self._db)
+
+        # Without autocreate, only the existing Identifier is found.
+        identifiers_by_urn, failures = resolver.resolve(
+            urns, autocreate=False
+        )
+        eq_({existing.urn: existing}, identifiers_by_urn)
+        eq_(sorted([isbn10_urn, new_urn, fake_urn]), sorted(failures))
+
+        # With autocreate, Identifiers are created for every URN
+        # except the one that doesn't make sense.
+        identifiers_by_urn, failures = resolver.resolve(urns)
+        eq_([fake_urn], failures)
+        eq_(existing, identifiers_by_urn[existing.urn])
+
+        # The results are keyed by the URNs that were passed in, even
+        # when they're not the Identifier's canonical URN.
+        isbn = identifiers_by_urn[isbn10_urn]
+        eq_(Identifier.ISBN, isbn.type)
+        eq_("9781453219539", isbn.identifier)
+        assert isbn.urn != isbn10_urn
+        eq_(isbn, get_one(self._db, Identifier, identifier="9781453219539"))
+
+        overdrive = identifiers_by_urn[new_urn]
+        eq_(Identifier.OVERDRIVE_ID, overdrive.type)
+        eq_("nosuchidentifier", overdrive.identifier)
+
+        # The answers are remembered, under the URNs that were passed
+        # in and under the canonical URNs.
+        eq_(isbn, resolver.identifiers[isbn10_urn])
+        eq_(isbn, resolver.identifiers[isbn.urn])
+        eq_(set([fake_urn]), resolver.failures)
+
+    def test_identifier_for(self):
+        resolver = IdentifierResolver(self._db)
+        urn = Identifier.URN_SCHEME_PREFIX + "Overdrive%20ID/nosuchidentifier"
+
+        # A URN that hasn't been resolved yet is resolved on demand.
+        eq_(None, resolver.identifier_for(urn, autocreate=False))
+        identifier = resolver.identifier_for(urn)
+        eq_("nosuchidentifier", identifier.identifier)
+
+        # After that, the answer comes from memory.
+        resolver.identifiers[urn] = "cached"
+        eq_("cached", resolver.identifier_for(urn))
+
+        # A URN that can't become an Identifier raises ValueError,
+        # like Identifier.parse_urn does.
+        assert_raises_regexp(
+            ValueError, "Could not turn what_even_is_this into",
+            resolver.identifier_for, "what_even_is_this"
+        )
+
+
+class TestRecursiveEquivalencyCache(DatabaseTest):
+
+    def _function_equivalents(self, identifier):
+        """Find equivalents the slow way, with the recursive function."""
+        fn = func.fn_recursive_equivalents(
+            identifier.id, RecursiveEquivalencyCache.LEVELS,
+            RecursiveEquivalencyCache.THRESHOLD,
+            RecursiveEquivalencyCache.CUTOFF
+        )
+        return set(r[0] for r in self._db.execute(select([fn])))
+
+    def _cached_equivalents(self, identifier):
+        return set(
+            RecursiveEquivalencyCache.equivalents(
+                self._db, [identifier.id]
+            )[identifier.id]
+        )
+
+    def test_cache_follows_equivalencies(self):
+        data_source = DataSource.lookup(self._db, DataSource.MANUAL)
+        a = self._identifier()
+        b = self._identifier()
+        c = self._identifier()
+        weak = self._identifier()
+        unrelated = self._identifier()
+        ab = a.equivalent_to(data_source, b, 0.9)
+        bc = b.equivalent_to(data_source, c, 0.9)
+        a.equivalent_to(data_source, weak, 0.2)
+        self._db.flush()
+
+        everything = [a, b, c, weak, unrelated]
+
+        def check():
+            # The cache always agrees with the recursive function.
+            for identifier in everything:
+                eq_(self._function_equivalents(identifier),
+                    self._cached_equivalents(identifier))
+
+        check()
+        eq_(set([a.id, b.id, c.id]), self._cached_equivalents(a))
+        eq_(set([unrelated.id]), self._cached_equivalents(unrelated))
+
+        # Weakening an equivalency breaks the chain.
+        ab.strength = 0.1
+        self._db.flush()
+        check()
+        eq_(set([a.id]), self._cached_equivalents(a))
+        eq_(set([b.id, c.id]), self._cached_equivalents(c))
+
+        # So does disabling one.
+        ab.strength = 0.9
+        bc.enabled = False
+        self._db.flush()
+        check()
+        eq_(set([a.id, b.id]), self._cached_equivalents(a))
+
+        # Pointing an equivalency at a different identifier updates
+        # the closure of both the old and new identifiers.
+        bc.enabled = True
+        bc.output = unrelated
+        self._db.flush()
+        check()
+        eq_(set([a.id, b.id, unrelated.id]), self._cached_equivalents(a))
+        eq_(set([c.id]), self._cached_equivalents(c))
+
+        # Deleting an equivalency removes it from the closure.
+        self._db.delete(ab)
+        self._db.flush()
+        check()
+        eq_(set([a.id]), self._cached_equivalents(a))
+
+        # The whole cache can be rebuilt from scratch.
+        a.equivalent_to(data_source, c, 1)
+        self._db.flush()
+        self._db.execute(RecursiveEquivalencyCache.__table__.delete())
+        eq_(set([a.id]), self._cached_equivalents(a))
+        RecursiveEquivalencyCache.rebuild(self._db)
+        check()
+        eq_(set([a.id, c.id]), self._cached_equivalents(a))
+
+    def test_changes_hold_locks(self):
+        def locked_ids():
+            return set(r[0] for r in self._db.execute(
+                text(
+                    "select objid from pg_locks where locktype='advisory'"
+                    " and classid=:key and objsubid=2"
+                    " and pid=pg_backend_pid()"
+                ), dict(key=RecursiveEquivalencyCache.LOCK_KEY)
+            ))
+        eq_(set(), locked_ids())
+
+        # Once a transaction has changed the closure of some
+        # identifiers, no other transaction can change their closure
+        # until this one ends.
+        data_source = DataSource.lookup(self._db, DataSource.MANUAL)
+        a = self._identifier()
+        b = self._identifier()
+        c = self._identifier()
+        a.equivalent_to(data_source, b, 1)
+        self._db.flush()
+        eq_(set([a.id, b.id]), locked_ids())
+
+        # Identifiers that reach the changed ones are locked too.
+        b.equivalent_to(data_source, c, 1)
+        self._db.flush()
+        eq_(set([a.id, b.id, c.id]), locked_ids())
+
+    def test_default_policy_uses_cache(self):
+        data_source = DataSource.lookup(self._db, DataSource.MANUAL)
+        a = self._identifier()
+        b = self._identifier()
+        a.equivalent_to(data_source, b, 1)
+        self._db.flush()
+
+        # The cache is only good for the default number of levels,
+        # threshold and cutoff.
+        eq_(True, RecursiveEquivalencyCache.covers(None))
+        eq_(False, RecursiveEquivalencyCache.covers(
+            PresentationCalculationPolicy(equivalent_identifier_cutoff=5)
+        ))
+        eq_(False, RecursiveEquivalencyCache.covers(
+            PresentationCalculationPolicy(equivalent_identifier_levels=5)
+        ))
+        eq_(False, RecursiveEquivalencyCache.covers(
+            PresentationCalculationPolicy(equivalent_identifier_threshold=0.1)
+        ))
+
+        # Tamper with the cache to prove it's being used.
+        self._db.execute(RecursiveEquivalencyCache.__table__.delete())
+        equivs = Identifier.recursively_equivalent_identifier_ids(
+            self._db, [a.id, b.id]
+        )
+        eq_([a.id], equivs[a.id])
+        eq_([b.id], equivs[b.id])
+
+        query = Identifier.recursively_equivalent_identifier_ids_query(
+            Identifier.id
+        ).where(Identifier.id==a.id)
+        eq_([a.id], [r[0] for r in self._db.execute(query)])
+
+        # A policy the cache doesn't cover still uses the function.
+        policy = PresentationCalculationPolicy(equivalent_identifier_levels=5)
+        equivs = Identifier.recursively_equivalent_identifier_ids(
+            self._db, [a.id], policy
+        )
+        eq_(set([a.id, b.id]), set(equivs[a.id]))
+
+        # Once the cache is rebuilt, the default policy finds the
+        # equivalents again.
+        RecursiveEquivalencyCache.rebuild(self._db)
+        equivs = Identifier.recursively_equivalent_identifier_ids(
+            self._db, [a.id]
+        )
+        eq_(set([a.id, b.id]), set(equivs[a.id]))
+        query = Identifier.recursively_equivalent_identifier_ids_query(
+            Identifier.id
+        ).where(Identifier.id==a.id)
+        eq_(set([a.id, b.id]), set(r[0] for r in self._db.execute(query)))
@@ -7,6 +7,7 @@ from nose.tools import (
 import datetime
 from psycopg2.extras import NumericRange
 from sqlalchemy import not_
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm.exc import MultipleResultsFound
 
 from .. import DatabaseTest
@@ -18,6 +19,7 @@ from ...model import (
     Edition,
     Genre,
     get_one,
+    PresentationCalculationPolicy,
     SessionManager,
     Timestamp,
     numericrange_to_tuple,
@@ -71,6 +73,29 @@ class TestDatabaseInterface(DatabaseTest):
         SessionManager.initialize_data(self._db)
         eq_(old_timestamp, timestamp.finish)
 
+    def test_initialize_trigram_indexes(self):
+        class MockEngine(object):
+            def __init__(self, fail):
+                self.fail = fail
+                self.statements = []
+            def execute(self, sql):
+                self.statements.append(sql)
+                if self.fail:
+                    raise DBAPIError(sql, None, Exception("permission denied"))
+
+        # If the pg_trgm extension can be enabled, the trigram
+        # indexes are created.
+        engine = MockEngine(fail=False)
+        eq_(True, SessionManager.initialize_trigram_indexes(engine))
+        eq_(["CREATE EXTENSION IF NOT EXISTS pg_trgm"]
+            + SessionManager.TRIGRAM_INDEXES, engine.statements)
+
+        # If not, the indexes are skipped rather than making schema
+        # setup fail.
+        engine = MockEngine(fail=True)
+        eq_(False, SessionManager.initialize_trigram_indexes(engine))
+        eq_(["CREATE EXTENSION IF NOT EXISTS pg_trgm"], engine.statements)
+
 
 class TestNumericRangeConversion(object):
     """Test the helper functions that convert between tuples and NumericRange
@@ -105,3 +130,62 @@ class TestNumericRangeConversion(object):
         eq_((2,6), m(two_to_six_inclusive))
         two_to_six_exclusive = NumericRange(2,6, '()')
         eq_((3,5), m(two_to_six_exclusive))
+
+
+class TestPresentationCalculationPolicy(object):
+
+    def test_for_changes(self):
+        m = PresentationCalculationPolicy.for_changes
+        P = PresentationCalculationPolicy
+
+        def steps(policy):
+            return set(x for x in P.STEPS if getattr(policy, x))
+
+        # A new measurement only affects quality.
+        eq_(set(['calculate_quality']), steps(m(P.MEASUREMENT_CHANGE)))
+
+        # A new description only affects the summary.
+        eq_(set(['choose_summary']), steps(m(P.DESCRIPTION_CHANGE)))
+
+        # Changes can be combined.
+        eq_(set(['classify', 'choose_cover']),
+            steps(m(P.SUBJECT_CHANGE, P.COVER_CHANGE)))
+
+        # Everything gathered from equivalent identifiers depends on
+        # the equivalencies.
+        eq_(set(['choose_cover', 'classify', 'choose_summary',
+                 'calculate_quality']),
+            steps(m(P.EQUIVALENCY_CHANGE)))
+
+        # Other constructor arguments are passed through, and can
+        # override the choice of steps.
+        policy = m(P.MEASUREMENT_CHANGE, classify=True,
+                   update_search_index=True)
+        eq_(set(['calculate_quality', 'classify']), steps(policy))
+        eq_(True, policy.update_search_index)
+        eq_(False, policy.regenerate_opds_entries)
+
+    def test_products_to_regenerate(self):
+        P = PresentationCalculationPolicy
+        policy = P.for_changes()
+        everything = set(P.PRODUCTS)
+
+        # If nothing changed, nothing needs to be regenerated.
+        eq_(set(), policy.products_to_regenerate(set()))
+
+        # Only some products mention a Work's quality.
+        eq_(set([P.VERBOSE_OPDS_ENTRY, P.SEARCH_DOCUMENT]),
+            policy.products_to_regenerate(set([P.QUALITY])))
+
+        # Everything mentions the summary.
+        eq_(everything, policy.products_to_regenerate(set([P.SUMMARY])))
+
+        # A policy can ask for products to be regenerated anyway.
+        policy = P.for_changes(
+            regenerate_opds_entries=True, update_search_index=True
+        )
+        eq_(set([P.OPDS_ENTRY, P.VERBOSE_OPDS_ENTRY, P.SEARCH_DOCUMENT]),
+            policy.products_to_regenerate(set()))
+        eq_(everything, P.recalculate_everything().products_to_regenerate(
+            set()
+        ))
@@ -4,12 +4,17 @@ from nose.tools import (
     eq_,
     set_trace,
 )
+import datetime
 import os
 from .. import (
     DatabaseTest,
     DummyHTTPClient,
 )
-from ...model import create
+from ...model import (
+    BlobStore,
+    LocalBlobStore,
+    create,
+)
 from ...model.datasource import DataSource
 from ...model.edition import Edition
 from ...model.identifier import Identifier
@@ -285,6 +290,44 @@ class TestRepresentation(DatabaseTest):
         representation.set_fetched_content("some text")
         eq_(b"some text", representation.content_fh().read())
 
+    def test_content_in_blob_store(self):
+        store = LocalBlobStore(os.path.join(self.tmp_data_dir, "blobs"))
+        BlobStore.set_instance(store)
+        representation, ignore = self._representation(self._url, "text/plain")
+        representation.set_fetched_content(u"some text")
+
+        # The content was put in the blob store, not the database.
+        eq_(None, representation._content)
+        eq_(BlobStore.key(b"some text"), representation.content_hash)
+        eq_(9, representation.file_size)
+        eq_(b"some text", store.get(representation.content_hash))
+
+        eq_(b"some text", representation.content)
+        eq_(True, representation.has_content)
+        eq_(b"some text", representation.content_fh().read())
+
+        # Another representation with the same content shares the
+        # stored copy.
+        other, ignore = self._representation(self._url, "text/plain")
+        other.content = b"some text"
+        eq_(representation.content_hash, other.content_hash)
+
+        # Representations with content in the database still work.
+        BlobStore.set_instance(None)
+        other.content = b"other text"
+        eq_(b"other text", other._content)
+        eq_(None, other.content_hash)
+        eq_(b"other text", other.content_fh().read())
+
+        # So do representations that were stored before the store
+        # went away, but their content can't be found.
+        representation.__dict__.pop('_content_from_store')
+        eq_(None, representation.content)
+        assert_raises_regexp(
+            ValueError, "missing from the blob store",
+            representation.content_fh
+        )
+
     def test_set_fetched_content_file_on_disk(self):
         filename = "set_fetched_content_file_on_disk.txt"
         path = os.path.join(self.tmp_data_dir, filename)
@@ -402,6 +445,73 @@ class TestRepresentation(DatabaseTest):
             self._db, url, do_get=h.do_get)
         eq_(False, cached)
 
+    def test_conditional_get(self):
+        h = DummyHTTPClient()
+        request_headers = []
+        def do_get(url, headers):
+            request_headers.append(dict(headers))
+            return h.do_get(url, headers)
+
+        url = "http://example.com/document.txt"
+        h.queue_response(
+            200, media_type="text/plain", content="the content",
+            other_headers={"ETag": "etag-1",
+                           "Last-Modified": "Thu, 01 Jan 2015 00:00:00 GMT"}
+        )
+        representation, cached = Representation.get(
+            self._db, url, do_get=do_get
+        )
+        eq_(False, cached)
+        eq_("etag-1", representation.etag)
+        eq_("Thu, 01 Jan 2015 00:00:00 GMT", representation.last_modified)
+
+        # The first request wasn't conditional.
+        assert 'If-None-Match' not in request_headers[0]
+        assert 'If-Modified-Since' not in request_headers[0]
+
+        # Once the representation is stale, the next request is
+        # conditional on the representation having changed.
+        long_ago = datetime.datetime(2015, 1, 1)
+        representation.fetched_at = long_ago
+        h.queue_response(
+            304, media_type=None, other_headers={"ETag": "etag-2"}
+        )
+        representation2, cached = Representation.get(
+            self._db, url, do_get=do_get, max_age=0
+        )
+        eq_("etag-1", request_headers[1]['If-None-Match'])
+        eq_("Thu, 01 Jan 2015 00:00:00 GMT",
+            request_headers[1]['If-Modified-Since'])
+
+        # The server said nothing has changed, so the same
+        # Representation is refreshed. Even though the 304 response
+        # didn't specify a media type, no new Representation was
+        # created.
+        eq_(representation, representation2)
+        eq_(1, self._db.query(Representation).filter(
+            Representation.url==url).count())
+        eq_(304, representation.status_code)
+        assert representation.fetched_at > long_ago
+
+        # The content is still there and still considered good.
+        eq_("the content", representation.content)
+        eq_("text/plain", representation.media_type)
+        eq_(True, representation.has_content)
+
+        # The server sent a new ETag, which will be used next time.
+        eq_("etag-2", representation.etag)
+        eq_("Thu, 01 Jan 2015 00:00:00 GMT", representation.last_modified)
+
+        # If the content has changed, it's replaced.
+        h.queue_response(200, media_type="text/plain", content="new content")
+        representation3, cached = Representation.get(
+            self._db, url, do_get=do_get, max_age=0
+        )
+        eq_("etag-2", request_headers[2]['If-None-Match'])
+        eq_(representation, representation3)
+        eq_(200, representation.status_code)
+        eq_("new content", representation.content)
+
     def test_response_reviewer_impacts_representation(self):
         h = DummyHTTPClient()
         h.queue_response(200, media_type='text/html')
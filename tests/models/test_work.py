@@ -18,6 +18,7 @@ from ...classifier import (
     Science_Fiction,
 )
 from ...model import (
+    PresentationCalculationPolicy,
     get_one_or_create,
     tuple_to_numericrange,
 )
@@ -32,12 +33,14 @@ from ...model.datasource import DataSource
 from ...model.edition import Edition
 from ...model.identifier import Identifier
 from ...model.licensing import LicensePool
+from ...model.measurement import Measurement
 from ...model.resource import (
     Hyperlink,
     Representation,
     Resource,
 )
 from ...model.work import (
+    PresentationCalculationStats,
     Work,
     WorkGenre,
 )
@@ -399,6 +402,112 @@ class TestWork(DatabaseTest):
         work.calculate_presentation()
         eq_(True, work.presentation_ready)
 
+    def test_calculate_presentation_only_regenerates_what_changed(self):
+        P = PresentationCalculationPolicy
+        work = self._work(with_license_pool=True)
+        identifier = work.license_pools[0].identifier
+        wrangler = DataSource.lookup(self._db, DataSource.METADATA_WRANGLER)
+        stats = Work.presentation_calculation_stats
+
+        def reset():
+            stats.reset()
+            work.simple_opds_entry = "old simple entry"
+            work.verbose_opds_entry = "old verbose entry"
+            work.marc_record = "old MARC record"
+
+        def steps_done():
+            return dict(
+                (k, v) for k, v in stats.done.items() if k in P.STEPS
+            )
+
+        # A new quality measurement comes in.
+        identifier.add_measurement(wrangler, Measurement.QUALITY, 0.8)
+        reset()
+        work.calculate_presentation(P.for_changes(P.MEASUREMENT_CHANGE))
+
+        # Only the quality was recalculated.
+        eq_(0.8, round(float(work.quality), 3))
+        eq_(dict(calculate_quality=1), steps_done())
+        for step in P.STEPS:
+            if step != 'calculate_quality':
+                eq_(1, stats.skipped[step])
+
+        # The quality is only mentioned in the verbose OPDS entry
+        # and the search document, so only those were regenerated.
+        eq_("old simple entry", work.simple_opds_entry)
+        assert work.verbose_opds_entry.startswith("<entry")
+        eq_("old MARC record", work.marc_record)
+        eq_(1, stats.done[P.SEARCH_DOCUMENT])
+        eq_(1, stats.skipped[P.OPDS_ENTRY])
+        eq_(1, stats.skipped[P.MARC_RECORD])
+        [index_record] = [
+            x for x in work.coverage_records
+            if x.operation == WorkCoverageRecord.UPDATE_SEARCH_INDEX_OPERATION
+        ]
+        eq_(WorkCoverageRecord.REGISTERED, index_record.status)
+
+        # If the quality doesn't actually change, nothing is
+        # regenerated.
+        reset()
+        work.calculate_presentation(P.for_changes(P.MEASUREMENT_CHANGE))
+        eq_("old verbose entry", work.verbose_opds_entry)
+        for product in P.PRODUCTS:
+            eq_(1, stats.skipped[product])
+
+        # A new description comes in.
+        staff = DataSource.lookup(self._db, DataSource.LIBRARY_STAFF)
+        identifier.add_link(
+            Hyperlink.DESCRIPTION, None, staff, content="A new summary"
+        )
+        reset()
+        work.calculate_presentation(P.for_changes(P.DESCRIPTION_CHANGE))
+        eq_("A new summary", work.summary_text)
+        eq_(dict(choose_summary=1), steps_done())
+
+        # Everything mentions the summary, so everything was
+        # regenerated.
+        assert work.simple_opds_entry.startswith("<entry")
+        assert work.verbose_opds_entry.startswith("<entry")
+        assert work.marc_record != "old MARC record"
+        for product in P.PRODUCTS:
+            eq_(1, stats.done[product])
+
+        # A policy can still insist that things be regenerated.
+        reset()
+        work.calculate_presentation(
+            P.for_changes(regenerate_opds_entries=True)
+        )
+        assert work.simple_opds_entry.startswith("<entry")
+        eq_("old MARC record", work.marc_record)
+
+    def test_calculate_presentation_for_new_work(self):
+        # A Work that was just created has no quality, summary or
+        # classification, and calculating its presentation fills
+        # them in.
+        edition, pool = self._edition(with_license_pool=True)
+        work = Work()
+        self._db.add(work)
+        work.license_pools.append(pool)
+        eq_(None, work.quality)
+
+        Work.presentation_calculation_stats.reset()
+        work.calculate_presentation()
+        eq_(edition, work.presentation_edition)
+        assert work.quality is not None
+        assert work.simple_opds_entry.startswith("<entry")
+        for product in PresentationCalculationPolicy.PRODUCTS:
+            eq_(1, Work.presentation_calculation_stats.done[product])
+
+    def test_presentation_calculation_stats(self):
+        stats = PresentationCalculationStats()
+        stats.record("classify", True)
+        stats.record("classify", False)
+        stats.record("choose_summary", False)
+        eq_("choose_summary: 0 done, 1 skipped, classify: 1 done, 1 skipped",
+            repr(stats))
+        stats.reset()
+        eq_("", repr(stats))
+
     def test_calculate_presentation_uses_default_audience_set_as_collection_setting(self):
         default_audience = Classifier.AUDIENCE_ADULT
         collection = self._default_collection
@@ -582,6 +691,91 @@ class TestWork(DatabaseTest):
         after = sorted((x.genre.name, x.affinity) for x in work.work_genres)
         eq_([(u'Romance', 0.25), (u'Science Fiction', 0.75)], after)
 
+    def test_classify_in_bulk(self):
+        source = DataSource.lookup(self._db, DataSource.OVERDRIVE)
+        staff = DataSource.lookup(self._db, DataSource.LIBRARY_STAFF)
+
+        def make_works():
+            works = []
+
+            sf = self._work(with_license_pool=True)
+            identifier = sf.license_pools[0].identifier
+            identifier.classify(
+                source, Subject.BISAC, "FICTION/Science Fiction/Time Travel",
+                None, 6
+            )
+            identifier.classify(source, Subject.OVERDRIVE, "Romance", None, 2)
+            works.append(sf)
+
+            # This Work's classification comes from an equivalent
+            # identifier.
+            juvenile = self._work(with_license_pool=True)
+            equivalent = self._identifier()
+            juvenile.license_pools[0].identifier.equivalent_to(
+                source, equivalent, 1
+            )
+            equivalent.classify(
+                source, Subject.BISAC, "JUVENILE FICTION/Fantasy & Magic"
+            )
+            equivalent.classify(source, Subject.AGE_RANGE, "9-12")
+            works.append(juvenile)
+
+            # Library staff have overridden this Work's classification.
+            overridden = self._work(with_license_pool=True)
+            identifier = overridden.license_pools[0].identifier
+            identifier.classify(
+                source, Subject.BISAC, "FICTION/Science Fiction/Time Travel"
+            )
+            identifier.classify(staff, Subject.SIMPLIFIED_GENRE, "Fantasy")
+            identifier.classify(
+                staff, Subject.SIMPLIFIED_FICTION_STATUS, "Fiction"
+            )
+            works.append(overridden)
+
+            # This Work has no classifications at all, and was once
+            # classified under Romance.
+            unclassified = self._work(with_license_pool=True)
+            unclassified.assign_genres_from_weights({Romance : 100})
+            works.append(unclassified)
+            return works
+
+        def summarize(work):
+            return (
+                sorted((wg.genre.name, round(wg.affinity, 2))
+                       for wg in work.work_genres),
+                work.fiction, work.audience, work.target_age
+            )
+
+        # Classify one set of Works one at a time...
+        policy = PresentationCalculationPolicy(
+            choose_edition=False, set_edition_metadata=False,
+            classify=True, choose_summary=False, calculate_quality=False,
+            choose_cover=False, regenerate_opds_entries=False,
+            regenerate_marc_record=False, update_search_index=False,
+        )
+        one_at_a_time = make_works()
+        for work in one_at_a_time:
+            work.calculate_presentation(policy=policy)
+        self._db.commit()
+
+        # ...and an identical set all at once.
+        in_bulk = make_works()
+        Work.classify_in_bulk(self._db, in_bulk, policy=policy)
+        self._db.commit()
+
+        # The results are the same.
+        for expect, work in zip(one_at_a_time, in_bulk):
+            eq_(summarize(expect), summarize(work))
+        eq_([], in_bulk[-1].work_genres)
+
+        # Each Work got a coverage record for the classification.
+        for work in in_bulk:
+            [record] = [x for x in work.coverage_records
+                        if x.operation==WorkCoverageRecord.CLASSIFY_OPERATION]
+
+        # An empty batch is fine.
+        Work.classify_in_bulk(self._db, [], policy=policy)
+
     def test_classifications_with_genre(self):
         work = self._work(with_open_access_download=True)
         identifier = work.presentation_edition.primary_identifier
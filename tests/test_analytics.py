@@ -1,4 +1,5 @@
 from nose.tools import (
+    assert_raises,
     eq_,
     set_trace,
 )
@@ -6,7 +7,10 @@ from ..config import (
     Configuration,
     temp_config,
 )
-from ..analytics import Analytics
+from ..analytics import (
+    Analytics,
+    BufferedAnalytics,
+)
 from ..mock_analytics_provider import MockAnalyticsProvider
 from ..local_analytics_provider import LocalAnalyticsProvider
 from . import DatabaseTest
@@ -17,7 +21,11 @@ from ..model import (
     create,
     get_one
 )
+import datetime
+import fcntl
 import json
+import os
+import tempfile
 
 # We can't import mock_analytics_provider from within a test,
 # and we can't tell Analytics to do so either. We need to tell
@@ -103,6 +111,38 @@ class TestAnalytics(DatabaseTest):
         eq_(False, Analytics.GLOBAL_ENABLED)
         eq_(set([l2.id]), Analytics.LIBRARY_ENABLED)
 
+    def test_registry_is_cached(self):
+        integration, ignore = create(
+            self._db, ExternalIntegration,
+            goal=ExternalIntegration.ANALYTICS_GOAL,
+            protocol=MOCK_PROTOCOL
+        )
+        analytics = Analytics(self._db)
+        registry = Analytics.registry(self._db)
+
+        # Creating another Analytics object reuses the same registry,
+        # and the same provider objects.
+        analytics2 = Analytics(self._db)
+        eq_(registry, Analytics.registry(self._db))
+        eq_(analytics.sitewide_providers, analytics2.sitewide_providers)
+
+        # Changing the site configuration throws the registry away.
+        url = self._url
+        integration.url = url
+        self._db.flush()
+        analytics3 = Analytics(self._db)
+        assert registry != Analytics.registry(self._db)
+        eq_(url, analytics3.sitewide_providers[0].url)
+
+        # So does learning that the site configuration was changed
+        # by some other process.
+        registry = Analytics.registry(self._db)
+        with temp_config():
+            Configuration.site_configuration_last_update(
+                self._db, known_value=datetime.datetime.utcnow()
+            )
+            assert registry != Analytics.registry(self._db)
+
     def test_is_configured(self):
         # If the Analytics constructor has not been called, then
         # is_configured() calls it so that the values are populated.
@@ -199,4 +239,201 @@ class TestAnalytics(DatabaseTest):
         )
 
         eq_(local_analytics_2.id, local_analytics.id)
-        eq_(local_analytics_2.name, local_analytics.name)
\ No newline at end of file
+        eq_(local_analytics_2.name, local_analytics.name)
+
+class TestBufferedAnalytics(DatabaseTest):
+
+    def setup(self):
+        super(TestBufferedAnalytics, self).setup()
+        integration, ignore = create(
+            self._db, ExternalIntegration,
+            goal=ExternalIntegration.ANALYTICS_GOAL,
+            protocol=MOCK_PROTOCOL
+        )
+        work = self._work(with_license_pool=True)
+        [self.pool] = work.license_pools
+        self.library = self._default_library
+
+    def test_collect_event_is_queued(self):
+        analytics = BufferedAnalytics(self._db)
+        [provider] = analytics.sitewide_providers
+        time = datetime.datetime(2019, 1, 1, 12, 30)
+
+        analytics.collect_event(
+            self.library, self.pool, CirculationEvent.CM_CHECKOUT, time,
+            neighborhood="Gormenghast"
+        )
+
+        # The provider hasn't heard about the event yet.
+        eq_(0, provider.count)
+        eq_(1, analytics.metrics['queue_depth'])
+        eq_(1, analytics.metrics['events_queued'])
+
+        # Flushing the queue delivers the event.
+        eq_(1, analytics.flush())
+        eq_(1, provider.count)
+        eq_(CirculationEvent.CM_CHECKOUT, provider.event_type)
+        eq_(time, provider.time)
+
+        metrics = analytics.metrics
+        eq_(0, metrics['queue_depth'])
+        eq_(1, metrics['events_dispatched'])
+        assert metrics['last_latency'] >= 0
+
+    def test_spill_to_disk(self):
+        spill_path = os.path.join(tempfile.mkdtemp(), "spill")
+        analytics = BufferedAnalytics(
+            self._db, max_queue_size=1, spill_path=spill_path
+        )
+        [provider] = analytics.sitewide_providers
+        for i in range(3):
+            analytics.collect_event(
+                self.library, self.pool, CirculationEvent.CM_CHECKOUT
+            )
+
+        # One event went into the queue; the others were written to
+        # disk.
+        metrics = analytics.metrics
+        eq_(1, metrics['queue_depth'])
+        eq_(2, metrics['spilled_depth'])
+        eq_(2, metrics['events_spilled'])
+
+        # A different BufferedAnalytics using the same spill file can
+        # deliver the spilled events. (The two objects share the same
+        # provider, since providers are cached for the whole process.)
+        other = BufferedAnalytics(self._db, spill_path=spill_path)
+        eq_([provider], other.sitewide_providers)
+        eq_(2, other.flush())
+        eq_(2, provider.count)
+        eq_(False, os.path.exists(spill_path))
+
+        eq_(1, analytics.flush())
+        eq_(3, provider.count)
+
+    def test_full_queue_without_spill_file(self):
+        # If the queue is full and there's nowhere to spill events,
+        # they're delivered immediately.
+        analytics = BufferedAnalytics(self._db, max_queue_size=1)
+        [provider] = analytics.sitewide_providers
+        analytics.collect_event(
+            self.library, self.pool, CirculationEvent.CM_CHECKOUT
+        )
+        eq_(0, provider.count)
+        analytics.collect_event(
+            self.library, self.pool, CirculationEvent.CM_CHECKIN
+        )
+        eq_(1, provider.count)
+        eq_(CirculationEvent.CM_CHECKIN, provider.event_type)
+
+    def test_full_queue_without_spill_file_or_objects(self):
+        # An event with no Library or LicensePool is delivered using
+        # the session the BufferedAnalytics was created with.
+        analytics = BufferedAnalytics(self._db, max_queue_size=1)
+        [provider] = analytics.sitewide_providers
+        analytics.collect_event(None, None, CirculationEvent.CM_CHECKOUT)
+        analytics.collect_event(None, None, CirculationEvent.CM_CHECKIN)
+        eq_(1, provider.count)
+        eq_(CirculationEvent.CM_CHECKIN, provider.event_type)
+
+    def test_spill_file_lock(self):
+        # The spill file is locked against other processes, not just
+        # other threads, using a lock file next to it.
+        spill_path = os.path.join(tempfile.mkdtemp(), "spill")
+        analytics = BufferedAnalytics(self._db, spill_path=spill_path)
+
+        def try_lock():
+            with open(spill_path + ".lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        with analytics.spill_file_lock():
+            assert_raises(IOError, try_lock)
+        try_lock()
+
+        # The lock file stays around when spilled events are taken
+        # out of the spill file.
+        analytics.spill([dict(event_type="event")])
+        eq_([dict(event_type="event")], analytics.unspill())
+        eq_(False, os.path.exists(spill_path))
+        eq_(True, os.path.exists(spill_path + ".lock"))
+
+    def test_background_thread(self):
+        analytics = BufferedAnalytics(self._db, flush_interval=0.1)
+        [provider] = analytics.sitewide_providers
+        analytics.start()
+        analytics.collect_event(
+            self.library, self.pool, CirculationEvent.CM_CHECKOUT
+        )
+        analytics.stop()
+        eq_(1, provider.count)
+        eq_(None, analytics.thread)
+
+    def test_batches_go_to_collect_events(self):
+        # A provider that can handle a batch of events gets them all
+        # at once.
+        #
+        # The Libraries and LicensePools in the batch belong to a
+        # session that's closed after delivery, so the provider
+        # records their IDs rather than holding on to them.
+        class BatchProvider(object):
+            def __init__(self):
+                self.batches = []
+            def collect_events(self, events):
+                self.batches.append([
+                    (library.id, pool.id, event_type)
+                    for library, pool, event_type, time, kwargs in events
+                ])
+
+        analytics = BufferedAnalytics(self._db)
+        provider = BatchProvider()
+        analytics.sitewide_providers = [provider]
+        for event_type in (CirculationEvent.CM_CHECKOUT,
+                           CirculationEvent.CM_CHECKIN):
+            analytics.collect_event(self.library, self.pool, event_type)
+        analytics.flush()
+
+        [batch] = provider.batches
+        eq_([(self.library.id, self.pool.id, CirculationEvent.CM_CHECKOUT),
+             (self.library.id, self.pool.id, CirculationEvent.CM_CHECKIN)],
+            batch)
+
+    def test_failed_batch_is_spilled(self):
+        spill_path = os.path.join(tempfile.mkdtemp(), "spill")
+
+        class FlakyProvider(object):
+            def __init__(self):
+                self.failures = 1
+                self.event_types = []
+            def collect_events(self, events):
+                if self.failures:
+                    self.failures -= 1
+                    raise Exception("Not right now.")
+                self.event_types.extend(x[2] for x in events)
+
+        analytics = BufferedAnalytics(self._db, spill_path=spill_path)
+        provider = FlakyProvider()
+        analytics.sitewide_providers = [provider]
+        analytics.collect_event(
+            self.library, self.pool, CirculationEvent.CM_CHECKOUT
+        )
+
+        # The first attempt fails, and the event is written to the
+        # spill file instead of being lost.
+        eq_(0, analytics.flush())
+        eq_(1, analytics.metrics['dispatch_errors'])
+        eq_(1, analytics.metrics['spilled_depth'])
+        eq_([], provider.event_types)
+
+        # The next attempt succeeds.
+        eq_(1, analytics.flush())
+        eq_([CirculationEvent.CM_CHECKOUT], provider.event_types)
+        eq_(0, analytics.metrics['spilled_depth'])
+
+        # An event that keeps failing is eventually dropped.
+        provider.failures = analytics.MAX_DISPATCH_ATTEMPTS
+        analytics.collect_event(
+            self.library, self.pool, CirculationEvent.CM_CHECKIN
+        )
+        for i in range(analytics.MAX_DISPATCH_ATTEMPTS):
+            eq_(0, analytics.flush())
+        eq_(0, analytics.metrics['spilled_depth'])
+        eq_([CirculationEvent.CM_CHECKOUT], provider.event_types)
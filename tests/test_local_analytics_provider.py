@@ -69,6 +69,46 @@ class TestLocalAnalyticsProvider(DatabaseTest):
             )
         eq_(3, qu.count())
 
+    def test_collect_events(self):
+        library2 = self._library()
+        pool = self._licensepool(None)
+        now = datetime.datetime.utcnow()
+        p = LocalAnalyticsProvider
+        self.integration.setting(p.LOCATION_SOURCE).value = (
+            p.LOCATION_SOURCE_NEIGHBORHOOD
+        )
+        la = p(self.integration, self._default_library)
+
+        events = [
+            (self._default_library, pool, CirculationEvent.CM_CHECKOUT, now,
+             dict(old_value=1, new_value=0, neighborhood="Gormenghast")),
+            # This event is for a different library, so it's ignored.
+            (library2, pool, CirculationEvent.CM_CHECKIN, now, dict()),
+            (None, pool, CirculationEvent.DISTRIBUTOR_CHECKIN, now, dict()),
+            # This event has neither a library nor a pool. It's
+            # skipped, but the rest of the batch is still recorded.
+            (None, None, CirculationEvent.CM_FULFILL, now, dict()),
+        ]
+        eq_(2, la.collect_events(events))
+
+        [checkout] = self._db.query(CirculationEvent).filter(
+            CirculationEvent.type==CirculationEvent.CM_CHECKOUT
+        ).all()
+        eq_(self._default_library, checkout.library)
+        eq_(pool, checkout.license_pool)
+        eq_(-1, checkout.delta)
+        eq_(now, checkout.start)
+        eq_("Gormenghast", checkout.location)
+
+        [checkin] = self._db.query(CirculationEvent).filter(
+            CirculationEvent.type==CirculationEvent.DISTRIBUTOR_CHECKIN
+        ).all()
+        eq_(None, checkin.library)
+        eq_(None, checkin.location)
+
+        # Nothing to do.
+        eq_(0, la.collect_events([]))
+
     def test_collect_with_missing_information(self):
         """A circulation event may be collected with either the
         library or the license pool missing, but not both.
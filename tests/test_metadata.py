@@ -40,10 +40,12 @@ from ..model import (
     Hyperlink,
     Representation,
     RightsStatus,
+    SortNameMemo,
     Subject,
     Timestamp,
     Work,
     WorkCoverageRecord,
+    get_one,
 )
 from ..model.configuration import ExternalIntegrationLink
 from ..s3 import MockS3Uploader
@@ -1058,6 +1060,57 @@ class TestContributorData(DatabaseTest):
         # algorithm to guess at the author name.
         eq_("Banks, Iain M.", contributor_data.sort_name)
 
+    def test_find_sort_name_remembers_answers(self):
+
+        class Mock(DummyMetadataClient):
+            calls = 0
+            def canonicalize_author_name(self, primary_identifier, display_author):
+                self.calls += 1
+                return super(Mock, self).canonicalize_author_name(
+                    primary_identifier, display_author
+                )
+
+        metadata_client = Mock()
+        metadata_client.lookups["Metadata Client Author"] = "Author, M. C."
+
+        def find(display_name, client=metadata_client):
+            contributor_data = ContributorData(display_name=display_name)
+            contributor_data.find_sort_name(self._db, [], client)
+            return contributor_data.sort_name
+
+        # The first time we see a display name, the canonicalizer
+        # is asked about it.
+        eq_("Author, M. C.", find("Metadata Client Author"))
+        eq_(1, metadata_client.calls)
+
+        # After that, the answer is remembered, both in this process
+        # and in the database.
+        eq_("Author, M. C.", find("Metadata Client Author"))
+        SortNameMemo.reset_cache()
+        eq_("Author, M. C.", find("Metadata Client Author"))
+        eq_(1, metadata_client.calls)
+        memo = get_one(
+            self._db, SortNameMemo, display_name="Metadata Client Author"
+        )
+        eq_(SortNameMemo.CANONICALIZER, memo.source)
+
+        # A guess made after the canonicalizer came up empty is
+        # remembered too.
+        eq_("Author, New", find("New Author"))
+        eq_("Author, New", find("New Author"))
+        eq_(2, metadata_client.calls)
+
+        # A guess made without a canonicalizer is used as long as
+        # there's no canonicalizer...
+        eq_("Author, Other", find("Other Author", None))
+        metadata_client.lookups["Other Author"] = "Author, O."
+        eq_("Author, Other", find("Other Author", None))
+        eq_(2, metadata_client.calls)
+
+        # ...but once there is one, it gets asked.
+        eq_("Author, O.", find("Other Author"))
+        eq_(3, metadata_client.calls)
+        eq_("Author, O.", find("Other Author", None))
 
 class TestLinkData(DatabaseTest):
     @parameterized.expand([
@@ -1105,6 +1158,49 @@ class TestMetadata(DatabaseTest):
         m = Metadata(data_source=DataSource.OCLC)
         eq_(None, m.medium)
 
+    def test_guess_license_pools(self):
+        moby, moby_pool = self._edition(
+            title=u"Moby Dick", authors=u"Melville, Herman",
+            with_open_access_download=True
+        )
+        moby.calculate_permanent_work_id()
+        unknown, unknown_pool = self._edition(
+            title=u"MOBY DICK", authors=Edition.UNKNOWN_AUTHOR,
+            with_open_access_download=True
+        )
+        # A book with a different title is never a candidate.
+        other, other_pool = self._edition(
+            title=u"Omoo", authors=u"Melville, Herman",
+            with_open_access_download=True
+        )
+
+        def guess(sort_name, display_name=None):
+            metadata = Metadata(
+                DataSource.GUTENBERG, title=u"moby dick",
+                contributors=[ContributorData(
+                    sort_name=sort_name, display_name=display_name,
+                    roles=[Contributor.PRIMARY_AUTHOR_ROLE]
+                )]
+            )
+            return metadata.guess_license_pools(self._db, None)
+
+        # The best match is on permanent work ID.
+        eq_({moby_pool: 0.95}, guess(u"Melville, Herman"))
+
+        # An author we don't know matches a book by an unknown author.
+        eq_({unknown_pool: 0.45}, guess(u"Else, Someone"))
+
+        # Failing that, any book with the title will do.
+        unknown.author = u"Ishmael"
+        eq_({moby_pool: 0.3, unknown_pool: 0.3}, guess(u"Else, Someone"))
+
+        # A match on display name is better than that.
+        eq_({unknown_pool: 0.8}, guess(u"Else, Someone", u"Ishmael"))
+
+        # Without any authors, nothing is guessed.
+        metadata = Metadata(DataSource.GUTENBERG, title=u"Moby Dick")
+        eq_({}, metadata.guess_license_pools(self._db, None))
+
     def test_from_edition(self):
         # Makes sure Metadata.from_edition copies all the fields over.
 
@@ -1557,6 +1653,66 @@ class TestMetadata(DatabaseTest):
 
         eq_([link2, link5, link4, link3], filtered_links)
 
+    def test_content_hash(self):
+        def metadata(**kwargs):
+            circulation = CirculationData(
+                DataSource.GUTENBERG,
+                primary_identifier=IdentifierData(Identifier.GUTENBERG_ID, "1"),
+                licenses_owned=kwargs.pop('licenses_owned', 1),
+                last_checked=kwargs.pop('last_checked', None),
+            )
+            args = dict(
+                data_source=DataSource.GUTENBERG,
+                primary_identifier=IdentifierData(Identifier.GUTENBERG_ID, "1"),
+                title=u"A title",
+                contributors=[ContributorData(display_name=u"Sally Smith")],
+                subjects=[SubjectData(Subject.TAG, u"Cats")],
+                measurements=[
+                    MeasurementData(
+                        Measurement.RATING, 5,
+                        taken_at=kwargs.pop('taken_at', None)
+                    )
+                ],
+                links=[
+                    LinkData(
+                        rel=Hyperlink.IMAGE, href="http://example.com/",
+                        content="\x89PNG\xff",
+                    )
+                ],
+                circulation=circulation,
+            )
+            args.update(kwargs)
+            return Metadata(**args)
+
+        m = metadata()
+        content_hash = m.content_hash()
+        eq_(64, len(content_hash))
+
+        # Two Metadata objects that say the same thing have the same
+        # hash, even if they were last updated or measured at
+        # different times.
+        eq_(content_hash, metadata().content_hash())
+        eq_(content_hash, metadata(
+            data_source_last_updated=datetime.datetime(2019, 1, 1),
+            last_checked=datetime.datetime(2019, 1, 2),
+            taken_at=datetime.datetime(2019, 1, 3),
+        ).content_hash())
+
+        # Changing anything about the book changes the hash.
+        for different in (
+            metadata(title=u"Another title"),
+            metadata(subjects=[SubjectData(Subject.TAG, u"Dogs")]),
+            metadata(contributors=[ContributorData(display_name=u"Jo Smith")]),
+            metadata(licenses_owned=2),
+            metadata(measurements=[MeasurementData(Measurement.RATING, 4)]),
+        ):
+            assert different.content_hash() != content_hash
+
+        # The hash is calculated once, so filling in information
+        # later on doesn't change it.
+        m.contributors[0].sort_name = u"Smith, Sally"
+        eq_(content_hash, m.content_hash())
+
 
 class TestCirculationData(DatabaseTest):
 
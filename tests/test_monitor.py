@@ -27,6 +27,7 @@ from ..model import (
     CollectionMissing,
     Credential,
     DataSource,
+    DRMDeviceIdentifier,
     Edition,
     ExternalIntegration,
     Genre,
@@ -41,6 +42,7 @@ from ..model import (
 from ..monitor import (
     CachedFeedReaper,
     CirculationEventLocationScrubber,
+    CirculationEventPartitionMonitor,
     CollectionMonitor,
     CollectionReaper,
     CoverageProvidersFailed,
@@ -60,6 +62,8 @@ from ..monitor import (
     ReaperMonitor,
     SubjectSweepMonitor,
     SweepMonitor,
+    SweepPartition,
+    SweepPartitionJob,
     TimelineMonitor,
     WorkReaper,
     WorkSweepMonitor,
@@ -608,6 +612,164 @@ class TestSweepMonitor(DatabaseTest):
         # cleanup() is only called when the sweep completes successfully.
         eq_([], monitor.cleanup_called)
 
+    def test_run_partition(self):
+        i1, i2, i3, i4 = [self._identifier() for i in range(4)]
+
+        # This monitor is restricted to the middle of the table.
+        partition = SweepPartition(i2.id, i3.id)
+        self.monitor.set_partition(partition)
+        eq_(
+            "Sweep Monitor (ids %d-%d)" % (i2.id, i3.id),
+            self.monitor.service_name
+        )
+        self.monitor.run()
+
+        # Only the items in the partition were processed.
+        eq_([i2, i3], self.monitor.processed)
+
+        # Progress was tracked in the partition's own Timestamp, and
+        # unlike a normal sweep, the counter was not reset once the
+        # partition was completed.
+        timestamp = self.monitor.timestamp()
+        eq_(self.monitor.service_name, timestamp.service)
+        eq_(i3.id, timestamp.counter)
+        eq_(None, timestamp.exception)
+
+        # Running the partition again doesn't process anything.
+        self.monitor.run()
+        eq_([i2, i3], self.monitor.processed)
+
+    def test_partitions(self):
+        # If the table is empty, there's nothing to partition.
+        eq_([], self.monitor.partitions(2))
+
+        i1, i2, i3, i4 = [self._identifier() for i in range(4)]
+        low, high = i1.id, i4.id
+
+        # The range of IDs in the table is divided up evenly.
+        p1, p2 = self.monitor.partitions(2)
+        eq_((low, low+1), (p1.lower, p1.upper))
+        eq_((low+2, high), (p2.lower, p2.upper))
+
+        # A Timestamp was created for each partition before any of
+        # them ran, so the sweep can be resumed with all of them even
+        # if some never got started.
+        timestamps = self.monitor.partition_timestamps().all()
+        eq_(
+            set([p1.service_name(self.monitor.service_name),
+                 p2.service_name(self.monitor.service_name)]),
+            set([x.service for x in timestamps])
+        )
+        for timestamp in timestamps:
+            eq_(None, timestamp.start)
+            eq_(None, timestamp.finish)
+        eq_([p1, p2], self.monitor.partitions(10))
+        for timestamp in timestamps:
+            self._db.delete(timestamp)
+
+        # Now pretend that a partitioned sweep was interrupted.
+        # Timestamps for its partitions are in the database.
+        old_partitions = [SweepPartition(low, low), SweepPartition(low+1, high)]
+        for partition in old_partitions:
+            Timestamp.stamp(
+                self._db, partition.service_name(self.monitor.service_name),
+                Timestamp.MONITOR_TYPE, None
+            )
+
+        # A Timestamp for some other Monitor is ignored.
+        Timestamp.stamp(
+            self._db, "Sweep Monitor 2 (ids 1-2)", Timestamp.MONITOR_TYPE,
+            None
+        )
+
+        # Those partitions are used instead of new ones, no matter
+        # how many partitions were requested.
+        eq_(old_partitions, self.monitor.partitions(10))
+
+    def test_finish_partitioned_sweep(self):
+        i1, i2 = [self._identifier() for i in range(2)]
+        partitions = self.monitor.partitions(2)
+        started_at = datetime.datetime.utcnow()
+
+        # Only one of the partitions has been run.
+        first = MockSweepMonitor(self._db)
+        first.set_partition(partitions[0])
+        first.run()
+
+        eq_(False, self.monitor.finish_partitioned_sweep(partitions, started_at))
+        eq_(2, self.monitor.partition_timestamps().count())
+
+        # The other partition ran, but it hit an error.
+        class Broken(MockSweepMonitor):
+            def process_item(self, item):
+                raise Exception("Oh no")
+        second = Broken(self._db)
+        second.set_partition(partitions[1])
+        second.run()
+        eq_(False, self.monitor.finish_partitioned_sweep(partitions, started_at))
+
+        # Now it runs successfully, and the sweep is complete.
+        second = MockSweepMonitor(self._db)
+        second.set_partition(partitions[1])
+        second.run()
+        eq_(True, self.monitor.finish_partitioned_sweep(partitions, started_at))
+
+        # The partition Timestamps are gone, so the next partitioned
+        # sweep will start from scratch.
+        eq_(0, self.monitor.partition_timestamps().count())
+
+        # The Monitor's own Timestamp was updated.
+        timestamp = self.monitor.timestamp()
+        eq_("Partitions swept: 2.", timestamp.achievements)
+        eq_(0, timestamp.counter)
+        assert timestamp.finish >= started_at
+
+
+class TestSweepPartition(object):
+
+    def test_divide(self):
+        eq_(
+            [SweepPartition(1, 3), SweepPartition(4, 7), SweepPartition(8, 10)],
+            SweepPartition.divide(1, 10, 3)
+        )
+
+        # A range can't be divided into more partitions than it has IDs.
+        eq_([SweepPartition(5, 5), SweepPartition(6, 6)],
+            SweepPartition.divide(5, 6, 10))
+
+    def test_service_name(self):
+        partition = SweepPartition(10, 200)
+        name = partition.service_name("Some Monitor")
+        eq_("Some Monitor (ids 10-200)", name)
+        eq_(partition, SweepPartition.from_service_name("Some Monitor", name))
+
+        # A name that belongs to another Monitor is ignored.
+        eq_(None, SweepPartition.from_service_name("Other Monitor", name))
+        eq_(None, SweepPartition.from_service_name(
+            "Some", "Some Monitor (ids 10-200)")
+        )
+
+
+class TestSweepPartitionJob(DatabaseTest):
+
+    def test_do_run(self):
+        collection = self._default_collection
+        i1 = self._identifier()
+        partition = SweepPartition(i1.id, i1.id)
+        job = SweepPartitionJob(
+            MockSweepMonitor, collection, partition, batch_size=10
+        )
+        job.do_run(self._db)
+
+        # A Monitor was created for the partition and run to completion.
+        timestamp = get_one(
+            self._db, Timestamp,
+            service=partition.service_name(MockSweepMonitor.SERVICE_NAME),
+            collection=collection
+        )
+        eq_(i1.id, timestamp.counter)
+        eq_("Records processed: 1.", timestamp.achievements)
+
 
 class TestIdentifierSweepMonitor(DatabaseTest):
 
@@ -815,6 +977,29 @@ class TestPermanentWorkIDRefresh(DatabaseTest):
         Mock(self._db).process_item(edition)
         assert edition.permanent_work_id != None
 
+    def test_only_changed(self):
+        """In this mode, the Monitor only recalculates permanent work
+        IDs whose inputs have changed.
+        """
+        class Mock(PermanentWorkIDRefreshMonitor):
+            SERVICE_NAME = "Mock"
+        edition = self._edition()
+        edition.calculate_permanent_work_id()
+        edition.permanent_work_id = u"unchanged"
+
+        monitor = Mock(self._db, only_changed=True)
+        monitor.process_item(edition)
+        eq_(u"unchanged", edition.permanent_work_id)
+
+        edition.title = u"A new title"
+        monitor.process_item(edition)
+        assert edition.permanent_work_id != u"unchanged"
+
+        # By default, every permanent work ID is recalculated.
+        edition.permanent_work_id = u"unchanged"
+        Mock(self._db).process_item(edition)
+        assert edition.permanent_work_id != u"unchanged"
+
 
 class TestMakePresentationReadyMonitor(DatabaseTest):
 
@@ -982,6 +1167,58 @@ class TestReaperMonitor(DatabaseTest):
         remaining = set(self._db.query(Credential).all())
         eq_(set([active, eternal]), remaining)
 
+    def test_bulk_delete(self):
+        # The CredentialReaper deletes rows in bulk, so it never
+        # calls delete().
+        m = CredentialReaper(self._db)
+        m.BATCH_SIZE = 2
+        eq_(True, m.BULK_DELETE)
+        def refuse(row):
+            raise Exception("Tried to delete %r one at a time." % row)
+        m.delete = refuse
+
+        now = datetime.datetime.utcnow()
+        expiration_date = now - datetime.timedelta(
+            days=CredentialReaper.MAX_AGE + 1
+        )
+        expired = [self._credential() for i in range(5)]
+        for e in expired:
+            e.expires = expiration_date
+        active = self._credential()
+
+        # One of the expired credentials has a DRM device identifier
+        # associated with it.
+        device, ignore = expired[0].register_drm_device_identifier("device")
+
+        result = m.run_once()
+        eq_("Items deleted: 5", result.achievements)
+        eq_([active], self._db.query(Credential).all())
+
+        # The DRM device identifier is still around, but it's no
+        # longer associated with a credential.
+        self._db.expire_all()
+        eq_([device], self._db.query(DRMDeviceIdentifier).all())
+        eq_(None, device.credential_id)
+
+    def test_reap_cached_feeds_in_bulk(self):
+        m = CachedFeedReaper(self._db)
+        eq_(True, m.BULK_DELETE)
+        now = datetime.datetime.utcnow()
+        old = CachedFeed(
+            type='page', content="content", pagination="", facets="",
+            timestamp=now - datetime.timedelta(days=CachedFeedReaper.MAX_AGE+1)
+        )
+        new = CachedFeed(
+            type='page', content="content", pagination="", facets="",
+            timestamp=now
+        )
+        self._db.add_all([old, new])
+        self._db.flush()
+
+        result = m.run_once()
+        eq_("Items deleted: 1", result.achievements)
+        eq_([new], self._db.query(CachedFeed).all())
+
     def test_reap_patrons(self):
         m = PatronRecordReaper(self._db)
         expired = self._patron()
@@ -1195,6 +1432,36 @@ class TestScrubberMonitor(DatabaseTest):
         for untouched in (new, recent):
             eq_("loc", untouched.location)
 
+    def test_run_once_scrubs_whole_partitions(self):
+        m = CirculationEventLocationScrubber(self._db)
+        long_ago = datetime.datetime(1999, 5, 17)
+        old, ignore = create(
+            self._db, CirculationEvent, start=long_ago, location="loc"
+        )
+        now = datetime.datetime.utcnow()
+        new, ignore = create(
+            self._db, CirculationEvent, start=now, location="loc"
+        )
+
+        # This event is older than any partition, so it stays in the
+        # default partition.
+        very_long_ago = datetime.datetime(1970, 1, 1)
+        ancient, ignore = create(
+            self._db, CirculationEvent, start=very_long_ago, location="loc"
+        )
+
+        # The old event is scrubbed as part of its partition. The
+        # ancient event is scrubbed even though it's in the default
+        # partition, which may also contain events newer than the
+        # cutoff.
+        CirculationEvent.create_partition(self._db, long_ago)
+        timestamp = m.run_once()
+        eq_("Items scrubbed: 2", timestamp.achievements)
+        self._db.expire_all()
+        eq_(None, old.location)
+        eq_(None, ancient.location)
+        eq_("loc", new.location)
+
     def test_specific_scrubbers(self):
         # Check that all specific ScrubberMonitors are set up
         # correctly.
@@ -1207,3 +1474,30 @@ class TestScrubberMonitor(DatabaseTest):
         eq_(Patron.last_external_sync, patron.timestamp_field)
         eq_(Patron.cached_neighborhood, patron.scrub_field)
         eq_(Patron.MAX_SYNC_TIME, patron.MAX_AGE)
+
+
+class TestCirculationEventPartitionMonitor(DatabaseTest):
+
+    def test_run_once(self):
+        m = CirculationEventPartitionMonitor(self._db)
+        progress = m.run_once()
+
+        # Partitions exist for this month and the next couple of months.
+        names = [x[0] for x in CirculationEvent.partitions(self._db)]
+        month = datetime.datetime.utcnow()
+        for i in range(m.MONTHS_AHEAD + 1):
+            assert CirculationEvent.PARTITION_NAME_FORMAT % (
+                month.year, month.month) in names
+            month = CirculationEvent.month_bounds(month)[1]
+
+        # Now an event is logged for a month with no partition.
+        pool = self._licensepool(edition=None)
+        CirculationEvent.log(
+            self._db, pool, CirculationEvent.DISTRIBUTOR_CHECKOUT, 1, 0,
+            start=datetime.datetime(1999, 5, 17)
+        )
+
+        # The next run creates a partition for that month.
+        progress = m.run_once()
+        eq_("Partitions created: 1", progress.achievements)
+        eq_([], CirculationEvent.months_in_default_partition(self._db))
@@ -1,7 +1,13 @@
 import datetime
+import json
 import os
+from collections import OrderedDict
 
-from nose.tools import eq_
+from nose.tools import (
+    assert_raises,
+    eq_,
+)
+from webpub_manifest_parser.errors import BaseError
 
 from ..model import (
     Contribution,
@@ -10,11 +16,15 @@ from ..model import (
     DeliveryMechanism,
     Edition,
     EditionConstants,
+    ExternalIntegration,
     LicensePool,
     MediaTypes,
     Work,
 )
-from ..opds2_import import OPDS2Importer
+from ..opds2_import import (
+    OPDS2Importer,
+    OPDS2ImportMonitor,
+)
 from .test_opds_import import OPDSTest
 
 
@@ -268,3 +278,151 @@ class TestOPDS2Importer(OPDSTest):
             u"December 1884 and in the United States in February 1885.",
             huckleberry_finn_work.summary_text,
         )
+
+    def test_stream_publications(self):
+        # Rearrange the sample feed so the publications come before
+        # the feed's links, and one of them is in a group.
+        original = json.loads(self.sample_opds("feed.json"))
+        [moby_dick, huckleberry_finn] = original["publications"]
+        links = original["links"] + [
+            {"rel": "next", "href": "http://example.com/next",
+             "type": "application/opds+json"}
+        ]
+        feed = json.dumps(OrderedDict([
+            ("publications", [moby_dick]),
+            ("groups", [{
+                "metadata": {"title": "A group"},
+                "links": [
+                    {"rel": "self", "href": "http://example.com/group",
+                     "type": "application/opds+json"}
+                ],
+                "publications": [huckleberry_finn],
+            }]),
+            ("links", links),
+            ("metadata", original["metadata"]),
+        ]))
+
+        data_source = DataSource.lookup(
+            self._db, "OPDS 2.0 Data Source", autocreate=True
+        )
+        self._default_collection.data_source = data_source
+        importer = OPDS2Importer(self._db, self._default_collection)
+        streaming_importer = OPDS2Importer(
+            self._db, self._default_collection, stream_publications=True
+        )
+        eq_(False, importer.stream_publications)
+
+        # Each publication is parsed as part of a feed with the
+        # original feed's links but no other publications, or with
+        # only the group it belongs to.
+        feeds_and_publications = list(
+            streaming_importer._stream_publications(feed)
+        )
+        eq_(
+            [u"Moby-Dick", u"Adventures of Huckleberry Finn"],
+            [x.metadata.title for _, x in feeds_and_publications]
+        )
+        [(feed1, publication1), (feed2, publication2)] = feeds_and_publications
+        eq_([publication1], feed1.publications)
+        eq_([], feed1.groups)
+        eq_([], feed2.publications)
+        eq_([publication2], feed2.groups[0].publications)
+        for parsed_feed, publication in feeds_and_publications:
+            eq_(
+                [u"http://example.com/next"],
+                [x.href for x in parsed_feed.links.get_by_rel(u"next")]
+            )
+
+        # Streaming gets the same results as parsing the whole feed.
+        for method in ("extract_next_links", "extract_last_update_dates"):
+            expect = getattr(importer, method)(feed)
+            eq_(expect, getattr(streaming_importer, method)(feed))
+        eq_([u"http://example.com/next"], importer.extract_next_links(feed))
+
+        metadata, failures = importer.extract_feed_data(feed)
+        streamed_metadata, streamed_failures = streaming_importer.extract_feed_data(feed)
+        eq_(sorted(metadata.keys()), sorted(streamed_metadata.keys()))
+        eq_(failures, streamed_failures)
+        def summarize(m):
+            return (
+                m.title, m.published, m.publisher,
+                [x.display_name for x in m.contributors],
+                sorted(x.href for x in m.links),
+                sorted(x.href for x in m.circulation.links),
+            )
+        for key, value in metadata.items():
+            eq_(summarize(value), summarize(streamed_metadata[key]))
+
+        # A feed that isn't JSON has no links or publications.
+        eq_([], streaming_importer.extract_next_links("not a feed"))
+        eq_([], streaming_importer.extract_last_update_dates("not a feed"))
+
+    def test_stream_publications_invalid_feed(self):
+        # This feed has a group with no links, which makes the whole
+        # feed invalid. Streaming rejects it the same way parsing the
+        # whole feed does.
+        original = json.loads(self.sample_opds("feed.json"))
+        [moby_dick, huckleberry_finn] = original["publications"]
+        links = original["links"] + [
+            {"rel": "next", "href": "http://example.com/next",
+             "type": "application/opds+json"}
+        ]
+        feed = json.dumps(OrderedDict([
+            ("metadata", original["metadata"]),
+            ("links", links),
+            ("publications", [moby_dick]),
+            ("groups", [{
+                "metadata": {"title": "A group"},
+                "publications": [huckleberry_finn],
+            }]),
+        ]))
+
+        importer = OPDS2Importer(self._db, self._default_collection)
+        streaming_importer = OPDS2Importer(
+            self._db, self._default_collection, stream_publications=True
+        )
+        for i in (importer, streaming_importer):
+            eq_([], i.extract_next_links(feed))
+            assert_raises(BaseError, i.extract_feed_data, feed)
+
+
+class TestOPDS2ImportMonitor(OPDSTest):
+
+    def test_run_once_with_spooled_feeds(self):
+        # Pages of an OPDS 2.0 feed can be spooled to temporary files
+        # before they're imported, whether or not the importer parses
+        # them one publication at a time.
+        base_path = os.path.split(__file__)[0]
+        feed = open(
+            os.path.join(base_path, "files", "opds2", "feed.json")
+        ).read()
+
+        class MockOPDS2ImportMonitor(OPDS2ImportMonitor):
+            def _get(self, url, headers):
+                return 200, {"content-type": "application/opds+json"}, feed
+
+            def import_one_feed(self, feed):
+                self.imported = feed
+                eq_(False, feed.closed)
+                return super(MockOPDS2ImportMonitor, self).import_one_feed(feed)
+
+        for stream_publications in (False, True):
+            collection = self._collection(
+                protocol=ExternalIntegration.OPDS2_IMPORT,
+                external_account_id="http://example.com/feed",
+                data_source_name="OPDS 2.0 Data Source"
+            )
+            monitor = MockOPDS2ImportMonitor(
+                self._db, collection=collection,
+                import_class=OPDS2Importer, force_reimport=True,
+                spool_feeds=True, stream_publications=stream_publications
+            )
+            progress = monitor.run_once(object())
+
+            # Both books in the feed were imported straight from the
+            # file, which was closed afterwards.
+            eq_(
+                "Items imported: 2. Failures: 0.", progress.achievements
+            )
+            eq_(True, monitor.imported.closed)
+            eq_(2, len(collection.licensepools))
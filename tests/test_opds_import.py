@@ -14,6 +14,7 @@ import feedparser
 from lxml import etree
 import pkgutil
 from psycopg2.extras import NumericRange
+from sqlalchemy.orm.session import Session
 
 from . import (
     DatabaseTest,
@@ -25,6 +26,7 @@ from ..config import (
 )
 from ..opds_import import (
     AccessNotAuthenticated,
+    ImportWorkerError,
     MetadataWranglerOPDSLookup,
     OPDSImporter,
     OPDSImportMonitor,
@@ -39,7 +41,10 @@ from ..util.opds_writer import (
 from ..metadata_layer import (
     LinkData,
     CirculationData,
+    ContributorData,
+    IdentifierData,
     Metadata,
+    SubjectData,
     TimestampData,
 )
 from ..model import (
@@ -59,6 +64,7 @@ from ..model import (
     Subject,
     Work,
     WorkCoverageRecord,
+    get_one,
 )
 from ..model.configuration import ExternalIntegrationLink
 from ..coverage import CoverageFailure
@@ -73,7 +79,10 @@ from ..testing import (
     MockRequestsRequest,
     MockRequestsResponse,
 )
-from ..util.http import BadResponseException
+from ..util.http import (
+    BadResponseException,
+    HostLimiter,
+)
 
 
 class DoomedOPDSImporter(OPDSImporter):
@@ -984,6 +993,139 @@ class TestOPDSImporter(OPDSImporterTest):
         eq_(True, failure.transient)
         assert "Utter failure!" in failure.exception
 
+    def test_extract_data_from_elementtree(self):
+        data_source = DataSource.lookup(self._db, DataSource.OA_CONTENT_SERVER)
+        importer = OPDSImporter(self._db, None, data_source_name=data_source.name)
+        values, failures = importer.extract_data_from_elementtree(
+            self.content_server_mini_feed, data_source
+        )
+
+        # The <entry> tag became a dictionary containing the
+        # information feedparser would have found...
+        metadata = values['urn:librarysimplified.org/terms/id/Gutenberg%20ID/10441']
+        eq_("The Green Mouse", metadata['title'])
+        eq_("A Tale of Mousy Terror", metadata['subtitle'])
+        eq_('en', metadata['language'])
+        eq_('Project Gutenberg', metadata['publisher'])
+        eq_(datetime.datetime(2015, 1, 2, 16, 56, 40),
+            metadata['data_source_last_updated'])
+
+        circulation = metadata['circulation']
+        eq_(DataSource.GUTENBERG, circulation['data_source'])
+
+        # ...as well as the information extract_metadata_from_elementtree
+        # would have found.
+        eq_([u'Chambers, Robert W. (Robert William)'],
+            [x.sort_name for x in metadata['contributors']])
+        eq_(0.3333, metadata['measurements'][0].value)
+
+        # The summary became the first link, and the other links
+        # follow it. The CirculationData has the same links.
+        description = metadata['links'][0]
+        eq_(Hyperlink.DESCRIPTION, description.rel)
+        eq_("This is a summary!", description.content)
+        eq_(
+            [(x.rel, x.href) for x in metadata['links']],
+            [(x.rel, x.href) for x in circulation['links']]
+        )
+
+        # The <simplified:message> tag became a CoverageFailure.
+        [failure] = failures.values()
+        assert isinstance(failure, CoverageFailure)
+        assert failure.exception.startswith('202')
+
+    def test_extract_data_from_elementtree_handles_exception(self):
+        class DoomedElementtreeOPDSImporter(OPDSImporter):
+            """An importer that can't extract metadata from elementttree."""
+            @classmethod
+            def _data_detail_for_elementtree_entry(cls, *args, **kwargs):
+                raise Exception("Utter failure!")
+
+        data_source = DataSource.lookup(self._db, DataSource.OA_CONTENT_SERVER)
+
+        values, failures = DoomedElementtreeOPDSImporter.extract_data_from_elementtree(
+            self.content_server_mini_feed, data_source
+        )
+
+        # No metadata was extracted.
+        eq_(0, len(values.keys()))
+
+        # Every <entry> became a CoverageFailure, as did the
+        # <simplified:message>.
+        eq_(3, len(failures))
+        failure = failures['urn:librarysimplified.org/terms/id/Gutenberg%20ID/10441']
+        assert isinstance(failure, CoverageFailure)
+        eq_(True, failure.transient)
+        assert "Utter failure!" in failure.exception
+
+        failure = failures['http://www.gutenberg.org/ebooks/1984']
+        assert failure.exception.startswith('202')
+
+    def test_extract_feed_data_parse_with_feedparser(self):
+        # Parsing a feed with lxml alone gives the same results as
+        # parsing it with feedparser and then lxml.
+        class FeedparserOPDSImporter(OPDSImporter):
+            PARSE_WITH_FEEDPARSER = True
+
+        def extract(importer_class):
+            importer = importer_class(
+                self._db, collection=self._default_collection
+            )
+            return importer.extract_feed_data(self.content_server_feed)
+
+        def summarize(metadata):
+            circulation = metadata.circulation
+            return (
+                metadata.title, metadata.subtitle, metadata.language,
+                metadata.publisher, metadata.medium, metadata.published,
+                metadata.data_source_last_updated,
+                [x.sort_name for x in metadata.contributors],
+                [x.identifier for x in metadata.subjects],
+                [(x.rel, x.href, x.media_type, x.content)
+                 for x in metadata.links],
+                circulation and circulation.data_source_name,
+                circulation and circulation.default_rights_uri,
+                circulation and [x.href for x in circulation.links],
+            )
+
+        lxml_metadata, lxml_failures = extract(OPDSImporter)
+        feedparser_metadata, feedparser_failures = extract(
+            FeedparserOPDSImporter
+        )
+        eq_(76, len(lxml_metadata))
+        eq_(sorted(feedparser_metadata.keys()), sorted(lxml_metadata.keys()))
+        eq_(sorted(feedparser_failures.keys()), sorted(lxml_failures.keys()))
+        for urn, metadata in lxml_metadata.items():
+            eq_(summarize(feedparser_metadata[urn]), summarize(metadata))
+
+    def test_feedparser_hooks_are_honored(self):
+        # A subclass that overrides one of the methods that only
+        # matter when parsing with feedparser still has its feeds
+        # parsed with feedparser.
+        class Subclass(OPDSImporter):
+            @classmethod
+            def _data_detail_for_feedparser_entry(cls, entry, data_source):
+                detail = super(
+                    Subclass, cls
+                )._data_detail_for_feedparser_entry(entry, data_source)
+                detail['title'] = u"Overridden"
+                return detail
+
+        class SubSubclass(Subclass):
+            pass
+
+        eq_([], OPDSImporter(
+            self._db, collection=None).overrides_feedparser_hooks)
+        for importer_class in (Subclass, SubSubclass):
+            importer = importer_class(self._db, collection=None)
+            eq_(['_data_detail_for_feedparser_entry'],
+                importer.overrides_feedparser_hooks)
+            metadata, failures = importer.extract_feed_data(
+                self.content_server_mini_feed
+            )
+            eq_(set([u"Overridden"]),
+                set(x.title for x in metadata.values()))
+
     def test_import_exception_if_unable_to_parse_feed(self):
         feed = "I am not a feed."
         importer = OPDSImporter(self._db, collection=None)
@@ -1465,6 +1607,163 @@ class TestOPDSImporter(OPDSImporterTest):
         importer.build_identifier_mapping([isbn1])
         eq_(None, importer.identifier_mapping)
 
+    def test_import_skips_unchanged_metadata(self):
+        feed = self.content_server_mini_feed
+        importer = OPDSImporter(
+            self._db, collection=None, skip_unchanged=True
+        )
+        imported_editions, pools, works, failures = importer.import_from_feed(feed)
+        [crow, mouse] = sorted(imported_editions, key=lambda x: x.title)
+
+        # A hash of the imported metadata was stored with each Edition.
+        metadata_objs, ignore = importer.extract_feed_data(feed)
+        expect = sorted(importer.content_hash(x) for x in metadata_objs.values())
+        eq_(expect, sorted([crow.metadata_hash, mouse.metadata_hash]))
+
+        # The hash depends on the collection the metadata is being
+        # imported into.
+        other_importer = OPDSImporter(
+            self._db, collection=self._default_collection,
+            data_source_name=DataSource.OA_CONTENT_SERVER
+        )
+        assert other_importer.content_hash(metadata_objs.values()[0]) not in expect
+
+        # Change an Edition so we can tell whether the metadata gets
+        # applied again.
+        crow.title = u"Changed locally"
+
+        # Importing the same feed again finds the same Editions, but
+        # since the metadata hasn't changed, it isn't applied again.
+        imported_editions_2, pools, works, failures = importer.import_from_feed(feed)
+        eq_(set(imported_editions), set(imported_editions_2))
+        eq_(u"Changed locally", crow.title)
+
+        # If the metadata has changed, it is applied.
+        modified_feed = feed.replace("Johnny Crow's Party", "Johnny Crow's Garden")
+        importer.import_from_feed(modified_feed)
+        eq_(u"Johnny Crow's Garden", crow.title)
+
+        # By default, an importer applies metadata whether or not it
+        # has changed.
+        crow.title = u"Changed locally"
+        eq_(False, OPDSImporter(self._db, collection=None).skip_unchanged)
+        OPDSImporter(self._db, collection=None).import_from_feed(modified_feed)
+        eq_(u"Johnny Crow's Garden", crow.title)
+
+    def test_import_from_feed_in_parallel(self):
+        # If worker processes are requested, import_from_feed hands
+        # the data it extracted to import_in_parallel.
+        class Mock(OPDSImporter):
+            def import_in_parallel(self, metadata_objs, failures):
+                self.import_in_parallel_called_with = (metadata_objs, failures)
+                return "parallel import results"
+
+        feed = self.content_server_mini_feed
+        importer = Mock(self._db, collection=None, worker_processes=2)
+        eq_(2, importer.worker_processes)
+        eq_("parallel import results", importer.import_from_feed(feed))
+        metadata_objs, failures = importer.import_in_parallel_called_with
+        expect_metadata, expect_failures = importer.extract_feed_data(feed)
+        eq_(sorted(expect_metadata.keys()), sorted(metadata_objs.keys()))
+        eq_(sorted(expect_failures.keys()), sorted(failures.keys()))
+
+        # By default, everything happens in this process.
+        eq_(1, OPDSImporter(self._db, collection=None).worker_processes)
+
+    def test_create_shared_rows(self):
+        def metadata(gutenberg_id):
+            return Metadata(
+                DataSource.GUTENBERG,
+                primary_identifier=IdentifierData(
+                    Identifier.GUTENBERG_ID, gutenberg_id
+                ),
+                identifiers=[
+                    IdentifierData(Identifier.ISBN, "9781453219539")
+                ],
+                contributors=[
+                    ContributorData(display_name="Sally Smith"),
+                    ContributorData(sort_name="Doe, Jane"),
+                ],
+                subjects=[SubjectData(Subject.TAG, "Cats")],
+            )
+        m1 = metadata("1")
+        m2 = metadata("2")
+
+        importer = OPDSImporter(self._db, collection=None)
+        importer.create_shared_rows([m1, m2])
+
+        # The contributors' sort names have been settled on.
+        eq_("Smith, Sally", m1.contributors[0].sort_name)
+        eq_("Smith, Sally", m2.contributors[0].sort_name)
+
+        # The rows that the two Metadata objects share have been
+        # created, once each.
+        for sort_name in ("Smith, Sally", "Doe, Jane"):
+            eq_(1, self._db.query(Contributor).filter(
+                Contributor.sort_name==sort_name).count())
+        eq_(1, self._db.query(Subject).filter(
+            Subject.type==Subject.TAG).filter(
+                Subject.identifier==u"Cats").count())
+        for type, identifier in (
+            (Identifier.ISBN, "9781453219539"),
+            (Identifier.GUTENBERG_ID, "1"),
+            (Identifier.GUTENBERG_ID, "2"),
+        ):
+            assert get_one(
+                self._db, Identifier, type=type, identifier=identifier
+            )
+
+        # Doing it again doesn't create anything new.
+        importer.create_shared_rows([metadata("1")])
+        eq_(1, self._db.query(Contributor).filter(
+            Contributor.sort_name=="Smith, Sally").count())
+
+    def test_import_in_worker_and_gather_results(self):
+        feed = self.content_server_mini_feed
+        importer = OPDSImporter(self._db, collection=None)
+        metadata_objs, failures = importer.extract_feed_data(feed)
+        keys = sorted(x for x in metadata_objs if x not in failures)
+        bad_key = keys[0]
+
+        # One of the items can't be imported.
+        original_import = importer.import_edition_from_metadata
+        def import_edition_from_metadata(metadata):
+            if metadata is metadata_objs[bad_key]:
+                raise Exception("Utter failure!")
+            return original_import(metadata)
+        importer.import_edition_from_metadata = import_edition_from_metadata
+
+        results = importer.import_in_worker(keys, metadata_objs)
+
+        # There's one result per item, and the results refer to
+        # database rows by ID.
+        eq_(keys, [x[0] for x in results])
+        for key, edition_id, pool_id, work_id, error in results:
+            if key == bad_key:
+                eq_(None, edition_id)
+                assert "Utter failure!" in error
+            else:
+                assert isinstance(edition_id, int)
+                eq_(None, error)
+
+            # There's no Collection, so no LicensePools or Works.
+            eq_(None, pool_id)
+            eq_(None, work_id)
+
+        # gather_results turns the results back into the return value
+        # of import_from_feed.
+        editions, pools, works, failures = importer.gather_results(
+            results, failures
+        )
+        eq_(len(keys) - 1, len(editions))
+        assert all(isinstance(x, Edition) for x in editions)
+        eq_([], pools)
+        eq_([], works)
+        failure = failures[bad_key]
+        assert isinstance(failure, CoverageFailure)
+        assert "Utter failure!" in failure.exception
+        eq_(False, failure.transient)
+
     def test_update_work_for_edition_having_no_work(self):
         # We have an Edition and a LicensePool but no Work.
         edition, lp = self._edition(with_license_pool=True)
@@ -1767,6 +2066,119 @@ class TestOPDSImporter(OPDSImporterTest):
         eq_(DeliveryMechanism.NO_DRM, lpdm.delivery_mechanism.drm_scheme)
 
 
+class TestImportInParallel(DatabaseTest):
+    """Import in real worker processes.
+
+    Worker processes have their own database connections, so they can
+    only see rows that have really been committed. This test commits
+    through its own session, and deletes what it created afterwards.
+    """
+
+    class WorkerImporter(OPDSImporter):
+        def import_in_worker(self, keys, metadata_objs):
+            # This runs in a worker process, using its own session.
+            results = []
+            for key in keys:
+                data = metadata_objs[key].primary_identifier
+                identifier = get_one(
+                    self._db, Identifier, type=data.type,
+                    identifier=data.identifier
+                )
+                results.append((key, os.getpid(), identifier.id))
+            return results
+
+        def gather_results(self, results, failures):
+            self.results = results
+            return [], [], [], failures
+
+    def setup(self):
+        super(TestImportInParallel, self).setup()
+        self.committed_db = Session(bind=self.engine)
+        self.overdrive_ids = []
+
+    def teardown(self):
+        if self.overdrive_ids:
+            self.committed_db.query(Identifier).filter(
+                Identifier.type==Identifier.OVERDRIVE_ID).filter(
+                    Identifier.identifier.in_(self.overdrive_ids)
+                ).delete(synchronize_session=False)
+        self.committed_db.commit()
+        self.committed_db.close()
+        super(TestImportInParallel, self).teardown()
+
+    def _metadata_objs(self, how_many):
+        metadata_objs = {}
+        for i in range(how_many):
+            overdrive_id = self._str
+            self.overdrive_ids.append(overdrive_id)
+            urn = Identifier.URN_SCHEME_PREFIX + "Overdrive%20ID/" + overdrive_id
+            metadata_objs[urn] = Metadata(
+                DataSource.GUTENBERG,
+                primary_identifier=IdentifierData(
+                    Identifier.OVERDRIVE_ID, overdrive_id
+                )
+            )
+        return metadata_objs
+
+    def _importer(self, cls):
+        return cls(
+            self.committed_db, collection=None,
+            data_source_name=DataSource.GUTENBERG, worker_processes=2
+        )
+
+    def test_import_in_parallel(self):
+        metadata_objs = self._metadata_objs(3)
+        importer = self._importer(self.WorkerImporter)
+        importer.import_in_parallel(metadata_objs, {})
+
+        # Every key was handled by a worker process other than this
+        # one, and each worker found the Identifier that was created
+        # and committed before the workers were started.
+        eq_(sorted(metadata_objs.keys()), sorted(x[0] for x in importer.results))
+        assert os.getpid() not in set(x[1] for x in importer.results)
+        for key, pid, identifier_id in importer.results:
+            identifier = self.committed_db.query(Identifier).get(identifier_id)
+            eq_(metadata_objs[key].primary_identifier.identifier,
+                identifier.identifier)
+
+    def test_workers_leave_parent_connections_alone(self):
+        engine = self.committed_db.get_bind()
+        parent_pool = engine.pool
+
+        class PoolCheckingImporter(self.WorkerImporter):
+            def import_in_worker(self, keys, metadata_objs):
+                # In a worker process, the engine inherited from this
+                # process has a new connection pool, and the worker's
+                # own session doesn't use it.
+                return [
+                    (engine.pool is not parent_pool,
+                     self._db.get_bind() is not engine)
+                    for key in keys
+                ]
+
+        importer = self._importer(PoolCheckingImporter)
+        importer.import_in_parallel(self._metadata_objs(2), {})
+        eq_([(True, True), (True, True)], importer.results)
+
+        # This process's connections are unaffected.
+        eq_(parent_pool, engine.pool)
+        eq_(1, self.committed_db.execute("select 1").scalar())
+
+    def test_worker_fails_to_start(self):
+        # If a worker process can't be set up, the error is raised in
+        # this process instead of the pool starting new workers
+        # forever.
+        class BrokenImporter(self.WorkerImporter):
+            def start_worker(self, url):
+                raise Exception("I can't work under these conditions.")
+
+        importer = self._importer(BrokenImporter)
+        assert_raises_regexp(
+            ImportWorkerError, "I can't work under these conditions.",
+            importer.import_in_parallel, self._metadata_objs(2), {}
+        )
+
+
 class TestCombine(object):
     """Test that OPDSImporter.combine combines dictionaries in sensible
     ways.
@@ -2202,6 +2614,31 @@ class TestOPDSImportMonitor(OPDSImporterTest):
             OPDSImporter,
         )
 
+    def test_constructor_sets_skip_unchanged(self):
+        # By default, the importer skips entries whose metadata
+        # hasn't changed; but not if everything is being reimported.
+        monitor = OPDSImportMonitor(
+            self._db, self._default_collection, OPDSImporter
+        )
+        eq_(True, monitor.importer.skip_unchanged)
+        monitor = OPDSImportMonitor(
+            self._db, self._default_collection, OPDSImporter,
+            force_reimport=True
+        )
+        eq_(False, monitor.importer.skip_unchanged)
+
+        # An explicit skip_unchanged is passed to the importer as-is.
+        monitor = OPDSImportMonitor(
+            self._db, self._default_collection, OPDSImporter,
+            skip_unchanged=False
+        )
+        eq_(False, monitor.importer.skip_unchanged)
+        monitor = OPDSImportMonitor(
+            self._db, self._default_collection, OPDSImporter,
+            force_reimport=True, skip_unchanged=True
+        )
+        eq_(True, monitor.importer.skip_unchanged)
+
     def test_external_integration(self):
         monitor = OPDSImportMonitor(
             self._db, self._default_collection,
@@ -2344,6 +2781,65 @@ class TestOPDSImportMonitor(OPDSImporterTest):
         """
         return http
 
+    def test_urns_needing_import(self):
+        monitor = OPDSImportMonitor(
+            self._db, self._default_collection,
+            import_class=OPDSImporter,
+        )
+        data_source = monitor.importer.data_source
+        old = datetime.datetime(2015, 1, 1)
+        new = datetime.datetime(2017, 1, 1)
+
+        def record(status=CoverageRecord.SUCCESS):
+            identifier = self._identifier()
+            record, ignore = CoverageRecord.add_for(
+                identifier, data_source, CoverageRecord.IMPORT_OPERATION,
+                timestamp=datetime.datetime(2016, 1, 1), status=status
+            )
+            return identifier
+
+        # This identifier was imported, and hasn't changed since.
+        unchanged = record()
+
+        # This one was imported, but has changed since.
+        changed = record()
+
+        # This one was imported, but the remote side doesn't say
+        # when it was last updated.
+        undated = record()
+
+        # Importing this one didn't work last time.
+        failed = record(CoverageRecord.TRANSIENT_FAILURE)
+
+        # This identifier has never been imported.
+        never_imported = self._identifier()
+
+        # This one isn't even in the database.
+        brand_new = "http://example.com/brand-new-book"
+
+        last_update_dates = [
+            (unchanged.urn, old),
+            (changed.urn, new),
+            (undated.urn, None),
+            (failed.urn, old),
+            (never_imported.urn, old),
+            (brand_new, old),
+            ("not a urn", new),
+        ]
+        eq_(
+            set([changed.urn, undated.urn, failed.urn, never_imported.urn,
+                 brand_new]),
+            monitor.urns_needing_import(last_update_dates)
+        )
+
+        # The new identifier wasn't created.
+        eq_(None, get_one(self._db, Identifier, identifier=brand_new))
+
+        # If only the unchanged identifier is mentioned, there's
+        # nothing to import.
+        eq_(set(), monitor.urns_needing_import([(unchanged.urn, old)]))
+        eq_(set(), monitor.urns_needing_import([]))
+
     def test_follow_one_link(self):
         monitor = OPDSImportMonitor(
             self._db, collection=self._default_collection,
@@ -2404,6 +2900,109 @@ class TestOPDSImportMonitor(OPDSImporterTest):
             BadResponseException, ".*Expected Atom feed, got not/atom.*", follow
         )
 
+    def test_follow_links(self):
+        class Mock(OPDSImportMonitor):
+            def _get(self, url, headers):
+                if url == "http://bad/":
+                    raise BadResponseException(url, "oops")
+                return 200, {}, "page at %s" % url
+
+            def follow_one_link(self, url, do_get=None):
+                # The page was already fetched, and follow_one_link
+                # is given a way to get at it.
+                status_code, headers, content = do_get(url, {})
+                return [], content
+
+            def _get_feeds(self):
+                self.follow_links(["http://a/", "http://b/"])
+                self.fetch_pool_used = self._fetch_pool
+                return []
+
+        self._default_collection.external_integration.setting(
+            OPDSImporter.MAX_CONCURRENT_REQUESTS
+        ).value = 3
+        monitor = Mock(
+            self._db, collection=self._default_collection,
+            import_class=OPDSImporter
+        )
+        eq_(3, monitor.max_concurrent_requests)
+
+        # The pages are requested at once, but the results come back
+        # in the original order.
+        links = ["http://a/%d" % i for i in range(5)]
+        results = monitor.follow_links(links)
+        eq_(["page at %s" % x for x in links], [x[1] for x in results])
+
+        # If a request raises an exception, it's raised again when
+        # that page is processed.
+        assert_raises_regexp(
+            BadResponseException, "oops",
+            monitor.follow_links, ["http://a/", "http://bad/"]
+        )
+
+        # The threads that fetch pages are stopped at the end of
+        # run_once.
+        monitor.run_once(None)
+        eq_(None, monitor._fetch_pool)
+        eq_([False] * 3,
+            [x.is_alive() for x in monitor.fetch_pool_used.workers])
+
+    def test__get_honors_retry_after(self):
+        class MockSession(object):
+            def __init__(self):
+                self.responses = []
+                self.requests = []
+
+            def request(self, method, url, **kwargs):
+                self.requests.append(url)
+                return self.responses.pop(0)
+
+        class MockHostLimiter(HostLimiter):
+            def back_off(self, url, seconds):
+                self.backed_off = (url, seconds)
+
+        monitor = OPDSImportMonitor(
+            self._db, collection=self._default_collection,
+            import_class=OPDSImporter
+        )
+        session = MockSession()
+        monitor.http_session = session
+        monitor.host_limiter = MockHostLimiter()
+
+        # The server tells us to come back in 10 seconds, then serves
+        # the page.
+        url = "http://opds/"
+        session.responses = [
+            MockRequestsResponse(429, headers={"Retry-After": "10"}),
+            MockRequestsResponse(200, content="a feed"),
+        ]
+        status_code, headers, content = monitor._get(url, {})
+        eq_("a feed", content)
+        eq_([url, url], session.requests)
+        eq_((url, 10), monitor.host_limiter.backed_off)
+
+        # If the server doesn't say when to come back, or wants us to
+        # wait too long, we give up.
+        too_long = str(monitor.MAX_RETRY_AFTER + 1)
+        for headers in ({}, {"Retry-After": too_long}):
+            session.responses = [MockRequestsResponse(503, headers=headers)]
+            assert_raises_regexp(
+                BadResponseException, "Got status code 503",
+                monitor._get, url, {}
+            )
+
+        # We also give up eventually, even if the server keeps
+        # asking us to come back soon.
+        session.responses = [
+            MockRequestsResponse(429, headers={"Retry-After": "1"})
+            for i in range(monitor.MAX_RETRIES+1)
+        ]
+        assert_raises_regexp(
+            BadResponseException, "Got status code 429",
+            monitor._get, url, {}
+        )
+        eq_([], session.responses)
+
     def test_import_one_feed(self):
         # Check coverage records are created.
 
@@ -2510,6 +3109,40 @@ class TestOPDSImportMonitor(OPDSImporterTest):
         eq_(None, progress.start)
         eq_(None, progress.finish)
 
+    def test_run_once_with_spooled_feeds(self):
+        feed = self.content_server_mini_feed
+
+        class MockOPDSImportMonitor(OPDSImportMonitor):
+            def _get(self, url, headers):
+                return 200, {"content-type": AtomFeed.ATOM_TYPE}, feed
+
+            def import_one_feed(self, feed):
+                # The feed was spooled to a file, which is still open.
+                self.imported = feed
+                eq_(False, feed.closed)
+                return super(MockOPDSImportMonitor, self).import_one_feed(feed)
+
+        monitor = MockOPDSImportMonitor(
+            self._db, collection=self._default_collection,
+            import_class=OPDSImporter, spool_feeds=True
+        )
+        progress = monitor.run_once(object())
+
+        # The editions were imported straight from the file, which
+        # was closed afterwards.
+        eq_(2, self._db.query(Edition).count())
+        eq_(True, monitor.imported.closed)
+        eq_("Items imported: 2. Failures: 1.", progress.achievements)
+
+    def test_spool(self):
+        monitor = OPDSImportMonitor(
+            self._db, collection=self._default_collection,
+            import_class=OPDSImporter
+        )
+        spooled = monitor.spool(u"a feed \u2603")
+        eq_(u"a feed \u2603".encode("utf8"), spooled.read())
+        spooled.close()
+
     def test_update_headers(self):
         # Test the _update_headers helper method.
         monitor = OPDSImportMonitor(
@@ -31,6 +31,7 @@ from ..model import (
     create,
 )
 from ..s3 import (
+    S3BlobStore,
     S3Uploader,
     MockS3Client,
     MultipartS3Upload,
@@ -1185,6 +1186,43 @@ class TestMultiPartS3Upload(S3UploaderTest):
         eq_([], uploader.client.parts)
 
 
+class TestS3BlobStore(S3UploaderTest):
+
+    def test_put_and_get(self):
+        uploader = self._create_s3_uploader(MockS3Client)
+        store = S3BlobStore(uploader, "blob-bucket")
+
+        key = store.put(b"some content")
+        eq_(S3BlobStore.key(b"some content"), key)
+        eq_(
+            {("blob-bucket", "blobs/" + key): b"some content"},
+            uploader.client.objects
+        )
+        eq_(True, store.exists(key))
+        eq_(b"some content", store.get(key))
+
+        # Putting the same content again doesn't upload it again.
+        uploader.client.fail_with = Exception("no more uploads")
+        eq_(key, store.put(b"some content"))
+
+        # Content that isn't there is treated as missing, rather
+        # than as an error.
+        eq_(False, store.exists("nosuchkey"))
+        eq_(None, store.open("nosuchkey"))
+        eq_(None, store.get("nosuchkey"))
+
+    def test_other_errors_are_raised(self):
+        uploader = self._create_s3_uploader(MockS3Client)
+        store = S3BlobStore(uploader, "blob-bucket")
+
+        def denied(**kwargs):
+            raise ClientError(
+                dict(Error=dict(Code='AccessDenied')), 'HeadObject'
+            )
+        uploader.client.head_object = denied
+        assert_raises(ClientError, store.exists, "key")
+
+
 @attr(integration='minio')
 class TestS3UploaderIntegration(S3UploaderIntegrationTest):
     @parameterized.expand([
@@ -55,6 +55,11 @@ from ..monitor import (
     Monitor,
     CollectionMonitor,
     ReaperMonitor,
+    SweepMonitor,
+)
+from ..opds2_import import (
+    OPDS2Importer,
+    OPDS2ImportMonitor,
 )
 from ..s3 import S3Uploader, MinIOUploader, MinIOUploaderConfiguration
 from ..scripts import (
@@ -83,6 +88,7 @@ from ..scripts import (
     RunCoverageProviderScript,
     RunMonitorScript,
     RunMultipleMonitorsScript,
+    RunPartitionedSweepMonitorScript,
     RunReaperMonitorsScript,
     RunThreadedCollectionCoverageProviderScript,
     RunWorkCoverageProviderScript,
@@ -471,6 +477,78 @@ class TestRunCollectionMonitorScript(DatabaseTest):
             assert isinstance(monitor, OPDSCollectionMonitor)
 
 
+class InlinePool(object):
+    """Mock DatabasePool that runs each job as soon as it's queued,
+    using the given database session.
+
+    :param crash_after: Pretend the script crashed after running this
+        many jobs.
+    """
+    def __init__(self, _db, crash_after=None):
+        self._db = _db
+        self.crash_after = crash_after
+        self.jobs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        return
+
+    def put(self, job):
+        if self.crash_after is not None and len(self.jobs) >= self.crash_after:
+            raise Exception("Crash!")
+        self.jobs.append(job)
+        job.run(self._db)
+
+
+class TestRunPartitionedSweepMonitorScript(DatabaseTest):
+
+    def test_resume_after_crash(self):
+        collection = self._default_collection
+        identifiers = [self._identifier() for i in range(4)]
+        processed = []
+
+        class Mock(SweepMonitor):
+            SERVICE_NAME = "Partitioned Sweep Monitor"
+            PROTOCOL = collection.protocol
+            MODEL_CLASS = Identifier
+            DEFAULT_BATCH_SIZE = 1
+
+            def scope_to_collection(self, qu, collection):
+                return qu
+
+            def process_item(self, item):
+                processed.append(item)
+
+        script = RunPartitionedSweepMonitorScript(
+            Mock, partitions=2, _db=self._db
+        )
+
+        # The script crashes after sweeping the first partition,
+        # before the second partition even got started.
+        assert_raises_regexp(
+            Exception, "Crash!", script.do_run,
+            pool=InlinePool(script._db, crash_after=1)
+        )
+        eq_(identifiers[:2], processed)
+
+        # Both partitions have Timestamps, so the sweep can be
+        # resumed with both of them.
+        monitor = Mock(script._db, collection=collection)
+        eq_(2, monitor.partition_timestamps().count())
+
+        # Next time, the sweep picks up where it left off. The first
+        # partition isn't swept again, the second partition is swept,
+        # and the sweep is complete.
+        pool = InlinePool(script._db)
+        script.do_run(pool=pool)
+        eq_(2, len(pool.jobs))
+        eq_(identifiers, processed)
+        eq_(0, monitor.partition_timestamps().count())
+        eq_("Partitions swept: 2.", monitor.timestamp().achievements)
+
+
 class TestRunReaperMonitorsScript(DatabaseTest):
 
     def test_monitors(self):
@@ -2203,6 +2281,50 @@ class TestOPDSImportScript(DatabaseTest):
         monitor = MockOPDSImportMonitor.INSTANCES.pop()
         eq_(self._default_collection, monitor.collection)
         eq_(True, monitor.kwargs['force_reimport'])
+        assert 'spool_feeds' not in monitor.kwargs
+
+        # Setting --spool-feeds tells the monitor to keep pages of
+        # the feed in temporary files.
+        args.append('--spool-feeds')
+        script.do_run(args)
+        monitor = MockOPDSImportMonitor.INSTANCES.pop()
+        eq_(True, monitor.kwargs['spool_feeds'])
+        assert 'worker_processes' not in monitor.kwargs
+
+        # Setting --processes is passed through to the importer.
+        args.append('--processes=4')
+        script.do_run(args)
+        monitor = MockOPDSImportMonitor.INSTANCES.pop()
+        eq_(4, monitor.kwargs['worker_processes'])
+
+    def test_opds2_with_processes(self):
+        # --processes works with the OPDS 2.0 importer and monitor,
+        # not only with the OPDS 1.x ones.
+        class MockOPDS2ImportMonitor(OPDS2ImportMonitor):
+            INSTANCES = []
+
+            def run(self):
+                self.INSTANCES.append(self)
+
+        collection = self._collection(
+            protocol=ExternalIntegration.OPDS2_IMPORT,
+            external_account_id=self._url,
+            data_source_name="OPDS 2.0 Data Source"
+        )
+        script = OPDSImportScript(
+            self._db, importer_class=OPDS2Importer,
+            monitor_class=MockOPDS2ImportMonitor,
+            protocol=ExternalIntegration.OPDS2_IMPORT
+        )
+        script.do_run(
+            ['--collection=%s' % collection.name, '--processes=4']
+        )
+
+        [monitor] = MockOPDS2ImportMonitor.INSTANCES
+        assert isinstance(monitor.importer, OPDS2Importer)
+        eq_(collection, monitor.importer.collection)
+        eq_(4, monitor.importer.worker_processes)
+        eq_(True, monitor.importer.skip_unchanged)
 
 
 class MockWhereAreMyBooks(WhereAreMyBooksScript):
@@ -3,6 +3,7 @@ import json
 from ...util.http import (
     HTTP,
     BadResponseException,
+    HostLimiter,
     RemoteIntegrationException,
     RequestNetworkException,
     RequestTimedOut,
@@ -48,6 +49,41 @@ class TestHTTP(object):
         eq_(200, response.status_code)
         eq_("Success!", response.content)
 
+    def test_request_with_session(self):
+        # If a requests.Session is passed in, the request is made
+        # through it.
+        class MockSession(object):
+            def request(self, *args, **kwargs):
+                self.called_with = (args, kwargs)
+                return MockRequestsResponse(200, content="Success!")
+
+        session = MockSession()
+        response = HTTP.request_with_timeout(
+            "GET", "http://url/", session=session
+        )
+        eq_("Success!", response.content)
+        args, kwargs = session.called_with
+        eq_(("GET", "http://url/"), args)
+        assert 'session' not in kwargs
+
+    def test_retry_after(self):
+        m = HTTP.retry_after
+        def response(**headers):
+            return MockRequestsResponse(503, headers=headers)
+
+        eq_(None, m(response()))
+        eq_(120, m(response(**{"Retry-After": "120"})))
+        eq_(None, m(response(**{"Retry-After": "whenever"})))
+
+        # An HTTP date is converted into a number of seconds from now.
+        now = 784111717
+        eq_(60, m(response(**{"retry-after": "Sun, 06 Nov 1994 08:49:37 GMT"}),
+                  now=now))
+
+        # A date in the past means there's no need to wait.
+        eq_(0, m(response(**{"retry-after": "Sun, 06 Nov 1994 08:49:37 GMT"}),
+                 now=now+3600))
+
     def test_request_with_timeout_failure(self):
 
         def immediately_timeout(*args, **kwargs):
@@ -248,6 +284,43 @@ class TestHTTP(object):
         eq_(error, m("url", error, allowed_response_codes=["400"]))
         eq_(error, m("url", error, allowed_response_codes=['4xx']))
 
+class TestHostLimiter(object):
+
+    def test_request(self):
+        sleeps = []
+        limiter = HostLimiter(2, sleep=sleeps.append)
+
+        # Each host gets its own set of request slots.
+        with limiter.request("http://a.com/1"):
+            with limiter.request("http://a.com/2"):
+                semaphore = limiter.semaphore("a.com")
+                eq_(False, semaphore.acquire(False))
+                other = limiter.semaphore("b.com")
+                eq_(True, other.acquire(False))
+                other.release()
+
+        # The slots are released when the requests are done.
+        eq_(True, semaphore.acquire(False))
+        semaphore.release()
+        eq_([], sleeps)
+
+    def test_back_off(self):
+        sleeps = []
+        limiter = HostLimiter(sleep=sleeps.append)
+        limiter.back_off("http://a.com/1", 30)
+
+        # A request to the host that asked us to back off has to wait.
+        with limiter.request("http://a.com/2"):
+            pass
+        [wait] = sleeps
+        assert 29 < wait <= 30
+
+        # A request to some other host doesn't.
+        with limiter.request("http://b.com/"):
+            pass
+        eq_(1, len(sleeps))
+
+
 class TestRemoteIntegrationException(object):
 
     def test_with_service_name(self):
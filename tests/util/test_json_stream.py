@@ -0,0 +1,70 @@
+import json
+
+from nose.tools import (
+    assert_raises_regexp,
+    eq_,
+    set_trace,
+)
+
+from ...util.json_stream import (
+    iterate_array,
+    scan_object,
+)
+
+
+class TestJSONStream(object):
+
+    def test_scan_object(self):
+        document = {
+            "before": {"a": [1, 2, {"b": "]}"}]},
+            "skipped": [{"c": "{[\"", "d": []}, 3],
+            "after": "value",
+            "scalar": None,
+        }
+        text = json.dumps(document, indent=2)
+
+        values, offsets = scan_object(text, ["skipped", "scalar", "missing"])
+
+        # Everything but the skipped keys was decoded.
+        eq_(dict(before=document["before"], after="value"), values)
+
+        # The skipped values can be found at the offsets.
+        eq_(set(["skipped", "scalar"]), set(offsets.keys()))
+        eq_(document["skipped"], list(iterate_array(text, offsets["skipped"])))
+        assert text[offsets["scalar"]:].startswith("null")
+
+        # An empty object is fine.
+        eq_(({}, {}), scan_object(" { } ", ["skipped"]))
+
+    def test_scan_object_failure(self):
+        assert_raises_regexp(
+            ValueError, "Expected one of '{'", scan_object, "[1, 2]", []
+        )
+        assert_raises_regexp(
+            ValueError, "Unterminated JSON value",
+            scan_object, '{"a": [1, {"b": 2}', ["a"]
+        )
+        assert_raises_regexp(
+            ValueError, "Expected one of ',}'",
+            scan_object, '{"a": 1 "b": 2}', []
+        )
+
+    def test_iterate_array(self):
+        text = '{"items": [ {"a": 1}, [2], "three" , null ]}'
+        values, offsets = scan_object(text, ["items"])
+        items = iterate_array(text, offsets["items"])
+
+        # Items are decoded one at a time.
+        eq_({"a": 1}, next(items))
+        eq_([[2], "three", None], list(items))
+
+        values, offsets = scan_object('{"items": []}', ["items"])
+        eq_([], list(iterate_array('{"items": []}', offsets["items"])))
+
+        # The value has to be an array.
+        text = '{"items": {"a": 1}}'
+        values, offsets = scan_object(text, ["items"])
+        assert_raises_regexp(
+            ValueError, r"Expected one of '\['",
+            list, iterate_array(text, offsets["items"])
+        )
@@ -0,0 +1,63 @@
+from threading import Thread
+
+from nose.tools import (
+    eq_,
+    set_trace,
+)
+
+from ...util.lru import LRUCache
+
+
+class TestLRUCache(object):
+
+    def test_get_and_set(self):
+        cache = LRUCache(size=2)
+        eq_(None, cache.get("a"))
+        eq_("default", cache.get("a", "default"))
+        eq_(2, cache.misses)
+
+        cache.set("a", 1)
+        cache.set("b", 2)
+        eq_(1, cache.get("a"))
+        eq_(1, cache.hits)
+        eq_(2, len(cache))
+
+        # Adding a third key forgets the key that was used least
+        # recently -- "b", since "a" was just looked up.
+        cache.set("c", 3)
+        eq_(2, len(cache))
+        assert "b" not in cache
+        eq_(1, cache.get("a"))
+        eq_(3, cache.get("c"))
+
+        # Setting an existing key doesn't make the cache any bigger.
+        cache.set("c", 4)
+        eq_(4, cache.get("c"))
+        eq_(2, len(cache))
+
+        eq_([("a", 1), ("c", 4)], cache.items())
+        cache.discard("a")
+        cache.discard("no such key")
+        eq_([("c", 4)], cache.items())
+
+        cache.clear()
+        eq_(0, len(cache))
+        eq_(0, cache.hits)
+        eq_(0, cache.misses)
+
+    def test_shared_between_threads(self):
+        # Many threads can use the same cache at once without
+        # corrupting it.
+        cache = LRUCache(size=50)
+        def work(n):
+            for i in range(2000):
+                key = (n * i) % 100
+                if cache.get(key) is None:
+                    cache.set(key, i)
+        threads = [Thread(target=work, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        eq_(50, len(cache))
+        eq_(8 * 2000, cache.hits + cache.misses)
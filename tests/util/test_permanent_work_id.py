@@ -0,0 +1,50 @@
+# encoding: utf-8
+from nose.tools import (
+    eq_,
+    set_trace,
+)
+
+from ...util.permanent_work_id import WorkIDCalculator
+
+
+class TestWorkIDCalculator(object):
+
+    def test_normalize_title(self):
+        m = WorkIDCalculator.normalize_title
+        eq_(u"hobbit or there and back again",
+            m(u"The Hobbit; or, There and Back Again"))
+        eq_(u"", m(None))
+
+    def test_normalize_author(self):
+        m = WorkIDCalculator.normalize_author
+        eq_(u"tolkien jrr", m(u"Tolkien, J.R.R."))
+        eq_(u"walt disney", m(u"Walt Disney Presents"))
+        eq_(u"", m(None))
+
+    def test_normalizations_are_remembered(self):
+        WorkIDCalculator.reset_cache()
+        title = u"A Remembered Title"
+        normalized = WorkIDCalculator.normalize_title(title)
+        hits = WorkIDCalculator._title_cache.hits
+        eq_(normalized, WorkIDCalculator.normalize_title(title))
+        eq_(hits + 1, WorkIDCalculator._title_cache.hits)
+
+        # The number of non-filing characters is part of the key.
+        eq_(u"re", WorkIDCalculator.normalize_title(title, 4))
+
+    def test_permanent_ids(self):
+        w = WorkIDCalculator
+        items = [
+            (u"The Hobbit", u"Tolkien, J.R.R.", "book"),
+            (u"Huckleberry Finn", None, "ebook"),
+            (u"The Hobbit", u"Tolkien, J.R.R.", "book"),
+        ]
+        hobbit = w.permanent_id(
+            w.normalize_title(u"The Hobbit"),
+            w.normalize_author(u"Tolkien, J.R.R."), "book"
+        )
+        huck = w.permanent_id(
+            w.normalize_title(u"Huckleberry Finn"), None, "ebook"
+        )
+        eq_([hobbit, huck, hobbit], w.permanent_ids(items))
+        eq_([], w.permanent_ids([]))
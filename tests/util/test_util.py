@@ -42,6 +42,14 @@ class TestMetadataSimilarity(object):
         eq_(1, MetadataSimilarity.title_similarity("foo bar", "bar, foo"))
         eq_(1, MetadataSimilarity.title_similarity("foo bar.", "FOO BAR"))
 
+    def test_wordbag(self):
+        bag = MetadataSimilarity._wordbag(u"The Moby-Dick, The Whale")
+        eq_(frozenset([u"the", u"moby", u"dick", u"whale"]), bag)
+
+        # Word bags are remembered, so a string that's compared
+        # against many others is only split up once.
+        assert bag is MetadataSimilarity._wordbag(u"The Moby-Dick, The Whale")
+
     def test_histogram_distance(self):
 
         # These two sets of titles generate exactly the same histogram.
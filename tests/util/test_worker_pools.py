@@ -84,6 +84,22 @@ class TestPool(object):
             pool.join()
         eq_(1/3.0, pool.success_rate)
 
+    def test_shutdown(self):
+        done = []
+        pool = Pool(2)
+        for i in range(3):
+            pool.put(lambda i=i: done.append(i))
+        pool.shutdown()
+
+        # The jobs already in the queue were finished, and then the
+        # worker threads stopped.
+        eq_([0, 1, 2], sorted(done))
+        eq_([False, False], [w.is_alive() for w in pool.workers])
+
+        # Stopping the workers isn't counted as a job.
+        eq_(3, pool.job_total)
+        eq_(0, pool.error_count)
+
 
 class TestDatabasePool(DatabaseTest):
 
@@ -14,6 +14,7 @@ from sqlalchemy.sql.functions import func
 # For backwards compatibility, import items that were moved to 
 # languages.py
 from .languages import LanguageCodes, LookupTable
+from .lru import LRUCache
 
 
 def batch(iterable, size=1):
@@ -75,9 +76,17 @@ class MetadataSimilarity(object):
 
     SEPARATOR = re.compile("\W")
 
+    # Word bags for strings that have been compared recently. The
+    # same titles and names get compared against many candidates.
+    _wordbags = LRUCache(100000)
+
     @classmethod
     def _wordbag(cls, s):
-        return set(cls._wordlist(s))
+        wordbag = cls._wordbags.get(s)
+        if wordbag is None:
+            wordbag = frozenset(cls._wordlist(s))
+            cls._wordbags.set(s, wordbag)
+        return wordbag
 
     @classmethod
     def _wordlist(cls, s):
@@ -1,7 +1,17 @@
 import logging
+import time
+from contextlib import contextmanager
+from email.utils import (
+    mktime_tz,
+    parsedate_tz,
+)
 from nose.tools import set_trace
 import requests
 import urlparse
+from threading import (
+    BoundedSemaphore,
+    RLock,
+)
 from flask_babel import lazy_gettext as _
 from problem_detail import (
     ProblemDetail as pd,
@@ -166,6 +176,61 @@ class RequestTimedOut(RequestNetworkException, requests.exceptions.Timeout):
     internal_message = "Timeout accessing %s: %s"
 
 
+class HostLimiter(object):
+    """Keep track of the requests being made to each host, so that
+    no host gets more than a certain number of requests at once, and
+    a host that asks us to back off doesn't get any requests until
+    it's ready.
+    """
+
+    def __init__(self, max_requests_per_host=1, sleep=time.sleep):
+        self.max_requests_per_host = max_requests_per_host
+        self.sleep = sleep
+        self.lock = RLock()
+        self.semaphores = {}
+        self.not_before = {}
+
+    @classmethod
+    def host(cls, url):
+        return urlparse.urlparse(url).netloc
+
+    def semaphore(self, host):
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = BoundedSemaphore(
+                    self.max_requests_per_host
+                )
+            return self.semaphores[host]
+
+    def back_off(self, url, seconds):
+        """Make no more requests to `url`'s host for the given number of
+        seconds.
+        """
+        host = self.host(url)
+        until = time.time() + seconds
+        with self.lock:
+            self.not_before[host] = max(
+                until, self.not_before.get(host, until)
+            )
+
+    @contextmanager
+    def request(self, url):
+        """Wait until it's okay to make a request to `url`, then hold
+        one of its host's request slots until the `with` block ends.
+        """
+        host = self.host(url)
+        semaphore = self.semaphore(host)
+        semaphore.acquire()
+        try:
+            with self.lock:
+                wait = self.not_before.get(host, 0) - time.time()
+            if wait > 0:
+                self.sleep(wait)
+            yield
+        finally:
+            semaphore.release()
+
+
 class HTTP(object):
     """A helper for the `requests` module."""
 
@@ -190,9 +255,17 @@ class HTTP(object):
     def request_with_timeout(cls, http_method, url, *args, **kwargs):
         """Call requests.request and turn a timeout into a RequestTimedOut
         exception.
+
+        :param session: If a requests.Session is passed in, the request
+            will be made through it, reusing its pooled connections.
         """
+        session = kwargs.pop('session', None)
+        if session:
+            make_request_with = session.request
+        else:
+            make_request_with = requests.request
         return cls._request_with_timeout(
-            url, requests.request, http_method, *args, **kwargs
+            url, make_request_with, http_method, *args, **kwargs
         )
 
     @classmethod
@@ -324,6 +397,31 @@ class HTTP(object):
         """Return the HTTP series for the given status code."""
         return "%sxx" % (int(status_code) // 100)
 
+    @classmethod
+    def retry_after(cls, response, now=None):
+        """How long does the server want us to wait before trying again?
+
+        :param response: A response object with a `headers` dictionary.
+        :return: A number of seconds, or None if the response has no
+            usable Retry-After header.
+        """
+        value = None
+        for header, header_value in response.headers.items():
+            if header.lower() == 'retry-after':
+                value = header_value
+        if not value:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return int(value)
+
+        # Otherwise it's an HTTP date.
+        parsed = parsedate_tz(value)
+        if not parsed:
+            return None
+        now = now or time.time()
+        return max(0, int(mktime_tz(parsed) - now))
+
     @classmethod
     def debuggable_get(cls, url, **kwargs):
         """Make a GET request that returns a detailed problem
@@ -0,0 +1,114 @@
+"""Read large JSON documents without turning the whole thing into
+Python objects at once.
+
+This works on a JSON document that's already in memory as a string.
+Only the values actually being looked at are decoded, so the Python
+objects in memory at any one time are bounded by the size of the
+largest single value.
+"""
+import json
+import re
+
+_decoder = json.JSONDecoder()
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# A JSON string, or one of the characters that starts or ends an
+# array or object.
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}]')
+
+
+def _skip_whitespace(text, index):
+    return _WHITESPACE.match(text, index).end()
+
+
+def _expect(text, index, characters):
+    """Skip whitespace and make sure the next character is one of
+    `characters`.
+
+    :return: A 2-tuple (the character, the index just after it).
+    """
+    index = _skip_whitespace(text, index)
+    if index >= len(text) or text[index] not in characters:
+        raise ValueError(
+            "Expected one of %r at position %d" % (characters, index)
+        )
+    return text[index], index + 1
+
+
+def _skip_value(text, index):
+    """Find the end of the JSON value that starts at `index`, without
+    decoding it if it's an array or object.
+    """
+    if text[index:index+1] not in ('[', '{'):
+        value, index = _decoder.raw_decode(text, index)
+        return index
+
+    depth = 0
+    for match in _TOKEN.finditer(text, index):
+        token = match.group()
+        if token in ('[', '{'):
+            depth += 1
+        elif token in (']', '}'):
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    raise ValueError("Unterminated JSON value at position %d" % index)
+
+
+def scan_object(text, skip_keys):
+    """Decode a JSON object, except for the values of certain keys.
+
+    :param text: A string containing a JSON object.
+    :param skip_keys: Don't decode the values of these keys.
+    :return: A 2-tuple (values, offsets). `values` is a dictionary
+        of the keys that were decoded. `offsets` maps each key in
+        `skip_keys` that was found to the position in `text` where
+        its value starts.
+    :raise ValueError: If `text` isn't a JSON object.
+    """
+    values = {}
+    offsets = {}
+    character, index = _expect(text, 0, '{')
+    index = _skip_whitespace(text, index)
+    if text[index:index+1] == '}':
+        return values, offsets
+
+    while True:
+        index = _skip_whitespace(text, index)
+        key, index = _decoder.raw_decode(text, index)
+        if not isinstance(key, basestring):
+            raise ValueError("Expected a key at position %d" % index)
+        character, index = _expect(text, index, ':')
+        index = _skip_whitespace(text, index)
+        if key in skip_keys:
+            offsets[key] = index
+            index = _skip_value(text, index)
+        else:
+            values[key], index = _decoder.raw_decode(text, index)
+        character, index = _expect(text, index, ',}')
+        if character == '}':
+            return values, offsets
+
+
+def iterate_array(text, offset):
+    """Decode the items in a JSON array one at a time.
+
+    :param text: A string containing a JSON document.
+    :param offset: The position in `text` where the array starts,
+        as found by scan_object().
+    :yield: Each item in the array.
+    :raise ValueError: If there's no array at `offset`.
+    """
+    character, index = _expect(text, offset, '[')
+    index = _skip_whitespace(text, index)
+    if text[index:index+1] == ']':
+        return
+
+    while True:
+        index = _skip_whitespace(text, index)
+        item, index = _decoder.raw_decode(text, index)
+        yield item
+        character, index = _expect(text, index, ',]')
+        if character == ']':
+            return
@@ -0,0 +1,71 @@
+"""A dictionary that only remembers the things that were used most
+recently.
+"""
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache(object):
+    """Map keys to values, keeping at most `size` of them.
+
+    When the cache gets too big, the key that was looked up or set
+    least recently is forgotten.
+
+    Caches are often shared by every thread in a process, so each
+    operation holds a lock.
+    """
+
+    def __init__(self, size=10000):
+        self.size = size
+        self._values = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Look up a key, making it the most recently used key."""
+        with self._lock:
+            try:
+                value = self._values.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._values[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Set a key, forgetting the least recently used key if the
+        cache is full.
+        """
+        with self._lock:
+            self._values.pop(key, None)
+            self._values[key] = value
+            while len(self._values) > self.size:
+                self._values.popitem(last=False)
+
+    def discard(self, key):
+        """Forget a key, if it's in the cache."""
+        with self._lock:
+            self._values.pop(key, None)
+
+    def items(self):
+        """List the (key, value) pairs in the cache, from least to
+        most recently used.
+        """
+        with self._lock:
+            return list(self._values.items())
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._values
+
+    def __len__(self):
+        with self._lock:
+            return len(self._values)
@@ -4,8 +4,15 @@ import re
 import struct
 import unicodedata
 
+from lru import LRUCache
+
 class WorkIDCalculator(object):
 
+    # Normalized titles and authors, keyed by the values that were
+    # normalized. The same titles and authors come up over and over.
+    _title_cache = LRUCache(100000)
+    _author_cache = LRUCache(100000)
+
     @classmethod
     def permanent_id(self, normalized_title, normalized_author,
                      grouping_category):
@@ -20,6 +27,31 @@ class WorkIDCalculator(object):
             permanent_id[16:20], permanent_id[20:]])
         return permanent_id
 
+    @classmethod
+    def permanent_ids(cls, items):
+        """Calculate the permanent work IDs for a number of books.
+
+        :param items: A list of (title, author, grouping_category)
+            3-tuples. The titles and authors will be normalized.
+        :return: A list of permanent work IDs, in the same order.
+        """
+        permanent_ids = dict()
+        results = []
+        for item in items:
+            if item not in permanent_ids:
+                title, author, grouping_category = item
+                permanent_ids[item] = cls.permanent_id(
+                    cls.normalize_title(title), cls.normalize_author(author),
+                    grouping_category
+                )
+            results.append(permanent_ids[item])
+        return results
+
+    @classmethod
+    def reset_cache(cls):
+        cls._title_cache.clear()
+        cls._author_cache.clear()
+
     # Strings to be removed from author names.
     authorExtract1 = re.compile("^(.+?)\\spresents.*$")
     authorExtract2 = re.compile("^(?:(?:a|an)\\s)?(.+?)\\spresentation.*$")
@@ -136,6 +168,14 @@ class WorkIDCalculator(object):
 
         Returns de-linted author's name.
         """
+        normalized = cls._author_cache.get(author)
+        if normalized is None:
+            normalized = cls._normalize_author(author)
+            cls._author_cache.set(author, normalized)
+        return normalized
+
+    @classmethod
+    def _normalize_author(cls, author):
         if author is None or len(author) == 0:
             author = u''
         author = unicodedata.normalize("NFKD", unicode(author))
@@ -171,13 +211,13 @@ class WorkIDCalculator(object):
 
     commonSubtitlesPattern = re.compile("^(.*?)((a|una)\\s(.*)novel(a|la)?|a(.*)memoir|a(.*)mystery|a(.*)thriller|by\\s(.+)|a novel of .*|stories|an autobiography|a biography|a memoir in books|\\d+\S*\s*ed(ition)?|\\d+\S*\s*update|1st\\s+ed.*|an? .* story|a .*\\s?book|poems|the movie|[\\w\\s]+series book \\d+|[\\w\\s]+trilogy book \\d+|large print|graphic novel|magazine|audio cd)$", re.U)
 
-    numerics = []
-    for find, replace in (
-            ("1st", "first"), ("2nd", "second"), ("3rd", "third"),
-            ("4th", "fourth"), ("5th", "fifth"), ("6th", "sixth"),
-            ("7th", "seventh"), ("8th", "eighth"), ("9th", "ninth"),
-            ("10th", "tenth")):
-        numerics.append((re.compile(find), replace))
+    numerics = {
+        "1st": "first", "2nd": "second", "3rd": "third",
+        "4th": "fourth", "5th": "fifth", "6th": "sixth",
+        "7th": "seventh", "8th": "eighth", "9th": "ninth",
+        "10th": "tenth",
+    }
+    numericPattern = re.compile("|".join(sorted(numerics)))
 
 
     @classmethod
@@ -201,8 +241,9 @@ class WorkIDCalculator(object):
         if match:
             subtitle = match.groups()[0]
         # Normalize numeric titles
-        for find, replace in cls.numerics:
-            subtitle = find.sub(replace, subtitle)
+        subtitle = cls.numericPattern.sub(
+            lambda match: cls.numerics[match.group()], subtitle
+        )
 
         subtitle = subtitle[:175].strip()
         return subtitle
@@ -218,13 +259,20 @@ class WorkIDCalculator(object):
         Splits into title and subtitle portions (normalizes subtitle).
         Lowercases.
         """
+        key = (full_title, num_non_filing_characters)
+        normalized = cls._title_cache.get(key)
+        if normalized is None:
+            normalized = cls._normalize_title(
+                full_title, num_non_filing_characters
+            )
+            cls._title_cache.set(key, normalized)
+        return normalized
+
+    @classmethod
+    def _normalize_title(cls, full_title, num_non_filing_characters):
         if full_title is None:
             full_title = u''
         full_title = unicodedata.normalize("NFKD", full_title)
-        # Remove any bracketed parts of the title
-        tmp_title = cls.bracketedCharacterStrip.sub("", full_title)
-        tmp_title = cls.specialCharacterStrip.sub(
-            "", full_title)
 
         if (num_non_filing_characters > 0
             and num_non_filing_characters < len(full_title)):
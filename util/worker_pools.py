@@ -16,6 +16,14 @@ from Queue import Queue
 # (or instead of) multithreading.
 
 
+class StopWorker(Exception):
+    """Raised by a job to make the Worker that runs it stop."""
+
+
+def _stop_worker(*args, **kwargs):
+    raise StopWorker()
+
+
 class Worker(Thread):
     """A Thread that performs jobs"""
 
@@ -37,6 +45,8 @@ class Worker(Thread):
         while True:
             try:
                 self.do_job()
+            except StopWorker:
+                return
             except Exception as e:
                 self.jobs.inc_error()
                 self.log.error("Job raised error: %r", e, exc_info=e)
@@ -134,6 +144,16 @@ class Pool(object):
             self.error_count, self.job_total, self.success_rate*100
         )
 
+    def shutdown(self):
+        """Let the workers finish the jobs already in the queue, then
+        stop them and wait for their threads to end.
+        """
+        for w in self.workers:
+            self.jobs.put(_stop_worker)
+        for w in self.workers:
+            if w.is_alive():
+                w.join()
+
 
 class DatabasePool(Pool):
     """A pool of DatabaseWorker threads and a job queue to keep them busy."""